@@ -0,0 +1,308 @@
+# benchmarks/bench_api.py
+"""
+文章接口基准：list / get / save / delete / refresh 延迟与内存占用
+使用方式（在 cms-backend 目录下）：
+    python benchmarks/bench_api.py                                   # 默认 1k / 10k / 100k 篇
+    python benchmarks/bench_api.py --sizes 1000,10000 --clients 8 --requests 200
+    python benchmarks/bench_api.py --sizes 1000 --baseline benchmarks/results/上次结果.json
+流程：
+    1. 用 synthetic_repo 生成（或复用）合成仓库和本地裸仓库 remote
+    2. 每个规模在独立子进程中运行：独立的 REPOS_BASE_DIR，后台线程启动 uvicorn，
+       多个并发客户端通过 HTTP 调用接口
+    3. 结果写入 benchmarks/results/<时间>.json；指定 --baseline 时输出与基线的对比
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_repo import generate_repo, GIT_ENV  # noqa: E402
+
+TOKEN = "bench-token"
+# 与基线对比时，变慢超过该比例标记为回归
+REGRESSION_THRESHOLD = 0.2
+
+
+# ============= 统计 =============
+def summarize(samples, wall_seconds=None):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    result = {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+    if wall_seconds:
+        result["throughput_rps"] = round(len(samples) / wall_seconds, 2)
+    return result
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），仅 Linux 读取 /proc，其他平台返回峰值"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# ============= 子进程：单个规模 =============
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(app, port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def _concurrent(client_count, jobs, fn):
+    """client_count 个客户端并发执行 jobs，返回 (每次耗时列表, 总耗时, 失败数)"""
+    import httpx
+    local = threading.local()
+    failures = []
+
+    def call(job):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = httpx.Client(base_url=_BASE_URL, timeout=600,
+                                                 headers={"Authorization": f"Bearer {TOKEN}"})
+        start = time.perf_counter()
+        response = fn(client, job)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            failures.append(response.status_code)
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=client_count) as pool:
+        samples = list(pool.map(call, jobs))
+    return samples, time.perf_counter() - start, len(failures)
+
+
+def _collect_paths(items, out):
+    for item in items:
+        if item["type"] == "file":
+            out.append(item["path"])
+        else:
+            _collect_paths(item.get("children", []), out)
+    return out
+
+
+def run_one(meta, args):
+    """在独立的 REPOS_BASE_DIR 下启动服务并执行各场景，返回结果字典"""
+    global _BASE_URL
+    import httpx
+    import main
+    from routers.article import cache_manager
+    from utils.article_utils import scan_posts_tree
+
+    port = _free_port()
+    _BASE_URL = f"http://127.0.0.1:{port}"
+    server, thread = _start_server(main.app, port)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    result = {"repo": meta, "rss_mb": {"start": rss_mb()}}
+    rng = random.Random(0)
+
+    try:
+        with httpx.Client(base_url=_BASE_URL, timeout=600, headers=headers) as client:
+            # 冷启动：克隆 + 拉取 + 扫描
+            start = time.perf_counter()
+            response = client.post("/api/list", json={})
+            result["cold_list_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            response.raise_for_status()
+            listing = response.json()
+            result["list_response_bytes"] = len(response.content)
+            result["rss_mb"]["after_cold_list"] = rss_mb()
+        paths = _collect_paths(listing["items"], [])
+        result["posts_found"] = listing["total"]
+
+        samples, wall, failed = _concurrent(args.clients, range(args.requests),
+                                            lambda c, _: c.post("/api/list", json={}))
+        result["list"] = {**summarize(samples, wall), "failed": failed}
+
+        picks = [rng.choice(paths) for _ in range(args.requests)]
+        samples, wall, failed = _concurrent(args.clients, picks,
+                                            lambda c, p: c.post("/api/getArticle", json={"path": p}))
+        result["get"] = {**summarize(samples, wall), "failed": failed}
+
+        new_paths = [f"bench/{os.getpid()}-{i}.md" for i in range(args.writes)]
+        samples, wall, failed = _concurrent(args.clients, new_paths, lambda c, p: c.post("/api/saveArticle", json={
+            "title": f"Bench {p}", "path": p, "body": f"---\ntitle: Bench {p}\n---\nbenchmark body\n"}))
+        result["save"] = {**summarize(samples, wall), "failed": failed}
+
+        samples, wall, failed = _concurrent(args.clients, new_paths,
+                                            lambda c, p: c.post("/api/delete", json={"path": p}))
+        result["delete"] = {**summarize(samples, wall), "failed": failed}
+
+        # 手动刷新：git pull + 重新扫描
+        repo_url, branch = meta["remote"], "master"
+        samples = []
+        for _ in range(args.writes):
+            start = time.perf_counter()
+            cache_manager.refresh_cache(repo_url, branch)
+            samples.append(time.perf_counter() - start)
+        result["refresh"] = summarize(samples)
+
+        # 纯扫描耗时与内存（不含 git）
+        samples = []
+        for _ in range(3):
+            start = time.perf_counter()
+            scan_posts_tree(repo_url)
+            samples.append(time.perf_counter() - start)
+        result["scan"] = summarize(samples)
+        tracemalloc.start()
+        tree = scan_posts_tree(repo_url)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["scan_memory_mb"] = {"retained": round(current / 1024 / 1024, 2), "peak": round(peak / 1024 / 1024, 2)}
+        del tree
+        result["rss_mb"]["end"] = rss_mb()
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return result
+
+
+def _child_main(meta_path, out_path, args):
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    result = run_one(meta, args)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# ============= 主进程：编排与对比 =============
+def _run_size(size, args):
+    meta = generate_repo(args.work_dir, size, args.depth, args.fanout, args.history, args.seed)
+    base_dir = tempfile.mkdtemp(prefix="cms-bench-repos-", dir=args.work_dir)
+    out_path = os.path.join(base_dir, "result.json")
+    env = {
+        **os.environ, **GIT_ENV,
+        "REPOS_BASE_DIR": base_dir,
+        "HEXO_GIT_REPO": meta["remote"],
+        "HEXO_GIT_BRANCH": "master",
+        "ACCESS_TOKEN": TOKEN,
+    }
+    # 慢请求日志会干扰计时，基准默认关闭（可通过环境变量覆盖）
+    env.setdefault("TRACE_SLOW_MS", "1e12")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", meta["remote"] + ".json", out_path,
+           "--clients", str(args.clients), "--requests", str(args.requests), "--writes", str(args.writes)]
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"规模 {size} 基准失败:\n{proc.stderr[-4000:]}")
+    with open(out_path, encoding="utf-8") as f:
+        result = json.load(f)
+    if not args.keep:
+        import shutil
+        shutil.rmtree(base_dir, ignore_errors=True)
+    return result
+
+
+def compare(current, baseline):
+    """按规模和场景比较 p50 / p95，返回差异列表"""
+    rows = []
+    for size, result in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for scenario in ("list", "get", "save", "delete", "refresh", "scan"):
+            for metric in ("p50_ms", "p95_ms"):
+                old, new = base.get(scenario, {}).get(metric), result.get(scenario, {}).get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                rows.append({"size": size, "scenario": scenario, "metric": metric, "baseline": old,
+                             "current": new, "change": round(change, 3),
+                             "regression": change > REGRESSION_THRESHOLD})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文章接口基准")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="文章数，逗号分隔")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=200, help="list / get 请求数")
+    parser.add_argument("--writes", type=int, default=10, help="save / delete / refresh 次数")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "cms-bench"))
+    parser.add_argument("--output", default=None, help="结果文件，默认 benchmarks/results/<时间>.json")
+    parser.add_argument("--baseline", default=None, help="与之前的结果文件对比")
+    parser.add_argument("--keep", action="store_true", help="保留每个规模的工作区")
+    parser.add_argument("--child", nargs=2, metavar=("META", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child_main(args.child[0], args.child[1], args)
+        return
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "params": {k: v for k, v in vars(args).items() if k not in ("child", "baseline", "output")},
+        "results": {},
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"▶ {size} 篇文章 ...", flush=True)
+        result = _run_size(size, args)
+        report["results"][str(size)] = result
+        print(f"  冷启动 list {result['cold_list_ms']}ms，list p50 {result['list']['p50_ms']}ms，"
+              f"get p50 {result['get']['p50_ms']}ms，save p50 {result['save']['p50_ms']}ms，"
+              f"refresh p50 {result['refresh']['p50_ms']}ms，RSS {result['rss_mb']['end']}MB", flush=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+        for row in report["comparison"]:
+            flag = "⚠️ 回归" if row["regression"] else ""
+            print(f"  {row['size']:>7} {row['scenario']:<8} {row['metric']:<7} "
+                  f"{row['baseline']:>10} → {row['current']:>10} ({row['change']:+.1%}) {flag}")
+
+    output = args.output or os.path.join(BENCH_DIR, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+
+_BASE_URL = ""
+
+if __name__ == "__main__":
+    main()
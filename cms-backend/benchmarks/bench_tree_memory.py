@@ -0,0 +1,115 @@
+# benchmarks/bench_tree_memory.py
+"""
+缓存文章树内存基准：紧凑表示（PostsTree）对比原嵌套 dict 树，以及每个缓存条目的实际常驻内存
+使用方式（在 cms-backend 目录下）：
+    python benchmarks/bench_tree_memory.py                       # 默认 1k / 10k / 100k 篇
+    python benchmarks/bench_tree_memory.py --sizes 10000 --depth 3 --fanout 8
+流程：
+    1. 在临时目录生成 _posts 文件布局（空文件即可，扫描只看目录结构），目录分布与 synthetic_repo 一致
+    2. tracemalloc 分别统计：扫描得到的 PostsTree 常驻内存、扫描峰值，以及 dict 树（即原缓存内容）常驻内存
+    3. 缓存条目还常驻预序列化的响应体（EncodedBody，只保留 gzip / br），条目内存 = 文章树 + 响应体
+    4. 同时记录扫描、物化、按层级查询的耗时
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_repo import _post_dir  # noqa: E402
+from utils.article_utils import scan_posts_dir  # noqa: E402
+from utils.response_utils import EncodedBody, dumps_json  # noqa: E402
+
+
+def make_layout(root: str, posts: int, depth: int, fanout: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(posts):
+        sub = _post_dir(rng, depth, fanout)
+        directory = os.path.join(root, sub)
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, f"2024-01-01-post-{i}.md"), "w").close()
+
+
+def measure(fn):
+    """返回 (结果, 常驻字节, 峰值字节, 耗时秒)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def run_size(posts: int, args):
+    root = tempfile.mkdtemp(prefix="cms-tree-bench-")
+    try:
+        make_layout(root, posts, args.depth, args.fanout, args.seed)
+        # 原缓存内容：扫描后只保留 dict 树；先测并释放，避免与紧凑树共享 intern 的名称字符串
+        as_dict, dict_bytes, _, _ = measure(lambda: scan_posts_dir(root).to_dict())
+        del as_dict
+        tree, tree_bytes, scan_peak, scan_s = measure(lambda: scan_posts_dir(root))
+        _, _, _, materialize_s = measure(tree.to_dict)
+        json_bytes = len(dumps_json(tree.to_dict()))
+        body, body_bytes, _, encode_s = measure(lambda: EncodedBody(tree.to_dict(), keep_identity=False))
+        nodes = max(1, len(tree))
+
+        start = time.perf_counter()
+        for _ in range(100):
+            tree.list_dir("", depth=1)
+        list_dir_ms = (time.perf_counter() - start) * 10
+        return {
+            "posts": tree.total,
+            "nodes": len(tree),
+            "compact_mb": round(tree_bytes / 1024 / 1024, 2),
+            "dict_mb": round(dict_bytes / 1024 / 1024, 2),
+            "ratio": round(dict_bytes / tree_bytes, 2) if tree_bytes else None,
+            "compact_bytes_per_node": round(tree_bytes / nodes, 1),
+            "dict_bytes_per_node": round(dict_bytes / nodes, 1),
+            "json_mb": round(json_bytes / 1024 / 1024, 2),
+            "body_mb": round(body_bytes / 1024 / 1024, 2),
+            "body_bytes_reported": body.size,
+            "entry_mb": round((tree_bytes + body_bytes) / 1024 / 1024, 2),
+            "entry_bytes_per_node": round((tree_bytes + body_bytes) / nodes, 1),
+            "encode_ms": round(encode_s * 1000, 1),
+            "scan_peak_mb": round(scan_peak / 1024 / 1024, 2),
+            "scan_ms": round(scan_s * 1000, 1),
+            "materialize_ms": round(materialize_s * 1000, 1),
+            "list_dir_depth1_ms": round(list_dir_ms, 3),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存文章树内存基准")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="文章数，逗号分隔")
+    parser.add_argument("--depth", type=int, default=2, help="_posts 下目录层级")
+    parser.add_argument("--fanout", type=int, default=8, help="每层子目录数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        results[size] = run_size(size, args)
+        r = results[size]
+        print(f"{size:>7} 篇: 紧凑 {r['compact_mb']:>7} MB（{r['compact_bytes_per_node']} B/节点） "
+              f"dict {r['dict_mb']:>7} MB（{r['dict_bytes_per_node']} B/节点） 节省 {r['ratio']}x  "
+              f"响应体 {r['body_mb']} MB（JSON {r['json_mb']} MB） "
+              f"条目合计 {r['entry_mb']} MB（{r['entry_bytes_per_node']} B/节点）  "
+              f"扫描 {r['scan_ms']}ms 物化 {r['materialize_ms']}ms")
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
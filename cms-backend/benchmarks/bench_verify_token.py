@@ -0,0 +1,87 @@
+# benchmarks/bench_verify_token.py
+"""
+verify_token 单次调用开销基准
+使用方式（在 cms-backend 目录下）：
+    python benchmarks/bench_verify_token.py --requests 200000 --threads 8 --ips 50000
+场景：
+    valid    合法 Token（快速路径）
+    invalid  无效 Token，来自大量不同 IP（失败记录路径 + 内存淘汰）
+输出每次调用的平均耗时（微秒）与跟踪的 IP 数
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ACCESS_TOKEN", "bench-token")
+
+from fastapi import HTTPException  # noqa: E402
+
+from configs.config import AUTH_STORAGE, SECRET_TOKEN  # noqa: E402
+from utils.token_utils import verify_token  # noqa: E402
+
+
+class _Client:
+    __slots__ = ("host",)
+
+    def __init__(self, host):
+        self.host = host
+
+
+class FakeRequest:
+    """verify_token 只用到 client.host 和 headers"""
+    __slots__ = ("client", "headers")
+
+    def __init__(self, ip, token):
+        self.client = _Client(ip)
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+
+def run(name, requests, threads):
+    def worker(chunk):
+        rejected = 0
+        for req in chunk:
+            try:
+                verify_token(req)
+            except HTTPException:
+                rejected += 1
+        return rejected
+
+    chunks = [requests[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        rejected = sum(pool.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": len(requests),
+        "threads": threads,
+        "rejected": rejected,
+        "seconds": round(elapsed, 3),
+        "us_per_request": round(elapsed / len(requests) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="verify_token 基准")
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ips", type=int, default=50_000, help="无效请求使用的不同 IP 数")
+    args = parser.parse_args()
+
+    valid = [FakeRequest(f"10.0.{i % 256}.{i // 256 % 256}", SECRET_TOKEN) for i in range(args.requests)]
+    invalid = [FakeRequest(f"172.16.{(i % args.ips) // 256 % 256}.{i % args.ips % 256}-{i % args.ips}", "wrong")
+               for i in range(args.requests)]
+
+    results = [run("valid", valid, args.threads), run("invalid", invalid, args.threads),
+               run("valid_after_failures", valid, args.threads)]
+    tracked = len(AUTH_STORAGE._store) if hasattr(AUTH_STORAGE, "_store") else None
+    print(json.dumps({"results": results, "tracked_ips": tracked,
+                      "storage": type(AUTH_STORAGE).__name__}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
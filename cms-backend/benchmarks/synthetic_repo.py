@@ -0,0 +1,152 @@
+# benchmarks/synthetic_repo.py
+"""
+生成合成 Hexo 仓库（带本地裸仓库作为 remote），供基准测试使用
+使用方式（在 cms-backend 目录下）：
+    python benchmarks/synthetic_repo.py --posts 10000 --depth 3 --fanout 8 --history 20 --out /tmp/cms-bench
+可调参数：
+    posts    文章数
+    depth    _posts 下目录层级（0 为全部平铺）
+    fanout   每层子目录数
+    history  提交历史长度（文章分批提交，后续提交还会修改部分已有文章）
+    seed     随机种子，相同参数生成完全相同的仓库
+生成结果：<out>/<name>.git（裸仓库）；同参数的仓库已存在时直接复用
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from typing import Dict
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+TITLE_WORDS = ["Hexo", "Python", "FastAPI", "性能", "缓存", "部署", "Git", "博客", "笔记", "Vue", "优化", "设计"]
+TAGS = ["python", "hexo", "git", "前端", "后端", "运维", "database", "linux", "随笔", "算法"]
+CATEGORIES = ["tech", "life", "notes", "读书", "project"]
+BODY_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "静态", "站点", "生成", "文章", "内容", "测试", "markdown"]
+
+
+def _git(args, cwd):
+    subprocess.run(["git"] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL,
+                   env={**os.environ, **GIT_ENV})
+
+
+def _post_dir(rng: random.Random, depth: int, fanout: int) -> str:
+    if depth <= 0:
+        return ""
+    level = rng.randint(0, depth)
+    return "/".join(f"dir-{d}-{rng.randrange(fanout)}" for d in range(level))
+
+
+def _front_matter(rng: random.Random, index: int, day: date) -> str:
+    """不同文章的 front-matter 字段组合不同，覆盖列表写法、引号、draft 等情况"""
+    title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 4))) + f" {index}"
+    lines = ["---", f"title: {title}" if rng.random() < 0.7 else f'title: "{title}"',
+             f"date: {day.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00"]
+    tags = rng.sample(TAGS, rng.randint(0, 4))
+    if tags:
+        if rng.random() < 0.5:
+            lines.append(f"tags: [{', '.join(tags)}]")
+        else:
+            lines.append("tags:")
+            lines.extend(f"  - {t}" for t in tags)
+    if rng.random() < 0.6:
+        lines.append(f"categories: {rng.choice(CATEGORIES)}")
+    if rng.random() < 0.1:
+        lines.append("draft: true")
+    if rng.random() < 0.3:
+        lines.append(f"description: {' '.join(rng.choices(BODY_WORDS, k=12))}")
+    lines.append("---")
+    return "\n".join(lines)
+
+
+def _body(rng: random.Random) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(1, 8)):
+        paragraphs.append(" ".join(rng.choices(BODY_WORDS, k=rng.randint(20, 120))))
+    if rng.random() < 0.3:
+        paragraphs.append("```python\nprint('hello')\n```")
+    return "\n\n".join(paragraphs)
+
+
+def generate_repo(out_dir: str, posts: int, depth: int = 2, fanout: int = 8, history: int = 10,
+                  seed: int = 42, force: bool = False) -> Dict:
+    """生成裸仓库，返回 {"remote": 裸仓库路径, "posts": ..., ...}"""
+    name = f"hexo-p{posts}-d{depth}-f{fanout}-h{history}-s{seed}"
+    remote = os.path.join(os.path.abspath(out_dir), name + ".git")
+    meta_path = remote + ".json"
+    if os.path.exists(meta_path) and not force:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    shutil.rmtree(remote, ignore_errors=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    rng = random.Random(seed)
+    work = tempfile.mkdtemp(prefix="hexo-bench-")
+    try:
+        _git(["init", "-q", "-b", "master"], work)
+        with open(os.path.join(work, "_config.yml"), "w", encoding="utf-8") as f:
+            f.write("title: Bench\nsource_dir: source\npublic_dir: public\n")
+        with open(os.path.join(work, "package.json"), "w", encoding="utf-8") as f:
+            f.write('{"name": "bench", "private": true}\n')
+        posts_dir = os.path.join(work, "source", "_posts")
+        os.makedirs(posts_dir, exist_ok=True)
+
+        commits = max(1, history)
+        # 前 70% 的提交新增文章，其余提交修改已有文章，模拟真实的历史
+        add_commits = max(1, int(commits * 0.7))
+        per_commit = -(-posts // add_commits)
+        written = []
+        start_day = date(2015, 1, 1)
+        for c in range(commits):
+            if c < add_commits:
+                for i in range(c * per_commit, min(posts, (c + 1) * per_commit)):
+                    day = start_day + timedelta(days=i % 3650)
+                    rel = os.path.join(_post_dir(rng, depth, fanout), f"{day.isoformat()}-post-{i}.md")
+                    path = os.path.join(posts_dir, rel)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(_front_matter(rng, i, day) + "\n" + _body(rng) + "\n")
+                    written.append(path)
+                message = f"add posts batch {c}"
+            else:
+                for path in rng.sample(written, min(len(written), max(1, posts // 100))):
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write("\n" + _body(rng) + "\n")
+                message = f"edit posts batch {c}"
+            _git(["add", "-A"], work)
+            _git(["commit", "-q", "-m", message], work)
+
+        _git(["clone", "-q", "--bare", work, remote], out_dir)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    meta = {"remote": remote, "name": name, "posts": posts, "depth": depth, "fanout": fanout,
+            "history": commits, "seed": seed}
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成 Hexo 仓库")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join(tempfile.gettempdir(), "cms-bench"))
+    parser.add_argument("--force", action="store_true", help="已存在时也重新生成")
+    args = parser.parse_args()
+    meta = generate_repo(args.out, args.posts, args.depth, args.fanout, args.history, args.seed, args.force)
+    print(json.dumps(meta, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
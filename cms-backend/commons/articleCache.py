@@ -3,48 +3,138 @@ import time
 from datetime import datetime
 from typing import Dict, Any, Tuple, Optional
 
-from configs.config import current_repo
-from utils.article_utils import scan_posts_tree
-from utils.git_utils import ensure_repo_cloned, git_pull
+from configs.config import current_repo, SHARED_STATE
+from commons.sharedState import process_id
+from commons.tracing import span
+from utils.article_utils import scan_posts_compact
+from utils.git_utils import ensure_repo_cloned, git_pull, get_head_commit, repo_lock
+from utils.etag_utils import content_etag
+from utils.response_utils import EncodedBody, dumps_json
+from commons.postsTree import PostsTree
+from commons.searchIndex import SEARCH_INDEXES
+from commons.autoDeploy import AUTO_DEPLOY
 
 ## 每次缓存间隔 300S
 CACHE_FLUSH_TIME=300
+## 非主 worker 检查共享版本号的间隔
+FOLLOWER_POLL_TIME=5
+## 刷新租约有效期，主 worker 每次循环续期，退出后其他 worker 最迟在该时间后接管
+REFRESH_LEASE_TTL=30
 
 # ============= 缓存条目 =============
 class CacheEntry:
     def __init__(self, repo_url: str, branch: str):
         self.repo_url = repo_url
         self.branch = branch
-        self.data = None
+        self.tree: Optional[PostsTree] = None  # 紧凑文章树，响应时才物化为 JSON 结构
+        self.version: Optional[str] = None  # 数据对应的 HEAD commit
+        self.etag: Optional[str] = None  # HEAD commit + 文章树内容哈希，刷新时计算一次
+        self.body: Optional[EncodedBody] = None  # 预序列化 JSON 的 gzip / br 版本（不常驻未压缩 JSON）
         self.last_updated: Optional[datetime] = None
         self.lock = threading.RLock()  # 每个仓库独立锁
         self.stop_event = threading.Event()
         self.background_thread: Optional[threading.Thread] = None
 
-    def set_data(self, data):
+    def set_data(self, tree: PostsTree, version: Optional[str] = None):
+        # 在锁外物化、编码、压缩、计算哈希，避免阻塞读请求；物化的 dict 与未压缩 JSON 用完即释放
+        identity = dumps_json(tree.to_dict())
+        etag = content_etag(identity, prefix=(version or "")[:12])
+        body = EncodedBody(raw=identity, keep_identity=False)
+        del identity
         with self.lock:
-            self.data = data
+            self.tree = tree
+            self.version = version
+            self.etag = etag
+            self.body = body
             self.last_updated = datetime.now()
+        if SEARCH_INDEXES is not None:
+            SEARCH_INDEXES.schedule(self.repo_url, tree, version)
+
+    @property
+    def lease_name(self) -> str:
+        return f"cache-refresh:{self.repo_url}@{self.branch}"
+
+    @property
+    def version_key(self) -> str:
+        return f"cache-version:{self.repo_url}@{self.branch}"
+
+    def pull_and_scan(self):
+        """拉取并重新扫描，同时发布新版本号，通知其他 worker 重新扫描"""
+        with span("cache.pull_and_scan", repo=self.repo_url, branch=self.branch), repo_lock(self.repo_url):
+            ensure_repo_cloned(self.repo_url, self.branch)
+            before = get_head_commit(self.repo_url)
+            git_pull(self.repo_url, self.branch)
+            tree = scan_posts_compact(self.repo_url)
+            version = get_head_commit(self.repo_url)
+        self.set_data(tree, version)
+        SHARED_STATE.set(self.version_key, version)
+        if AUTO_DEPLOY is not None and version != before:
+            # 拉取到了远端的新提交（本地提交在拉取前已在 HEAD 中）
+            AUTO_DEPLOY.mark_dirty(self.repo_url, self.branch, "remote")
+        return tree
+
+    def rescan(self):
+        """本进程刚提交推送、工作区已是最新时使用：只重新扫描并发布版本号，省去一次拉取"""
+        with span("cache.rescan", repo=self.repo_url, branch=self.branch), repo_lock(self.repo_url):
+            tree = scan_posts_compact(self.repo_url)
+            version = get_head_commit(self.repo_url)
+        self.set_data(tree, version)
+        SHARED_STATE.set(self.version_key, version)
+        return tree
+
+    def sync_from_shared_version(self) -> bool:
+        """非主 worker：共享版本号变化时只重新扫描本地工作区，不做 git 网络操作"""
+        version = SHARED_STATE.get(self.version_key)
+        if version is None or version == self.version:
+            return False
+        with repo_lock(self.repo_url):
+            tree = scan_posts_compact(self.repo_url)
+        self.set_data(tree, version)
+        return True
 
     def get_data(self):
+        """物化为原有的 { "items": [...], "total": N } 结构"""
         with self.lock:
-            return self.data
+            tree = self.tree
+        return tree.to_dict() if tree is not None else None
+
+    def get_encoded(self) -> Tuple[Optional[EncodedBody], Optional[str]]:
+        """预序列化的响应体和 ETag"""
+        with self.lock:
+            return self.body, self.etag
+
+    def get_tree(self) -> Tuple[Optional[PostsTree], Optional[str]]:
+        """同时取文章树和 ETag，保证两者对应同一次刷新"""
+        with self.lock:
+            return self.tree, self.etag
+
+    def get_versioned_tree(self) -> Tuple[Optional[PostsTree], Optional[str]]:
+        """同时取文章树和对应的 HEAD commit"""
+        with self.lock:
+            return self.tree, self.version
 
     def start_background_refresh(self):
         """为当前仓库启动后台刷新线程"""
         self.stop_background_refresh()  # 先停止旧线程
 
         def refresh_loop():
+            # 多 worker 时通过租约选出一个 worker 负责 git 拉取，其余 worker 跟随共享版本号
+            next_refresh = 0.0
             while not self.stop_event.is_set():
                 try:
-                    repo_path = ensure_repo_cloned(self.repo_url, self.branch)
-                    git_pull(self.repo_url, self.branch)
-                    data = scan_posts_tree(self.repo_url)
-                    self.set_data(data)
-                    print(f"[{datetime.now()}] 仓库 {self.repo_url}@{self.branch} 缓存已刷新")
+                    if SHARED_STATE.acquire_lease(self.lease_name, process_id(), REFRESH_LEASE_TTL):
+                        if time.monotonic() >= next_refresh:
+                            self.pull_and_scan()
+                            next_refresh = time.monotonic() + CACHE_FLUSH_TIME
+                            print(f"[{datetime.now()}] 仓库 {self.repo_url}@{self.branch} 缓存已刷新")
+                        else:
+                            self.sync_from_shared_version()
+                    elif self.sync_from_shared_version():
+                        print(f"[{datetime.now()}] 仓库 {self.repo_url}@{self.branch} 缓存已同步")
                 except Exception as e:
                     print(f"[{datetime.now()}] 仓库 {self.repo_url}@{self.branch} 后台刷新失败: {e}")
-                time.sleep(CACHE_FLUSH_TIME)
+                self.stop_event.wait(FOLLOWER_POLL_TIME)
+            SHARED_STATE.release_lease(self.lease_name, process_id())
 
         self.background_thread = threading.Thread(target=refresh_loop, daemon=True)
         self.background_thread.start()
@@ -73,9 +163,15 @@ class MultiRepoCacheManager:
         entry = self.get_cache_entry(repo_url, branch)
         return entry.get_data()
 
-    def set_cached_data(self, repo_url: str, branch: str, data):
+    def get_cached_body(self, repo_url: str, branch: str) -> Tuple[Optional[EncodedBody], Optional[str]]:
+        return self.get_cache_entry(repo_url, branch).get_encoded()
+
+    def get_cached_tree(self, repo_url: str, branch: str) -> Tuple[Optional[PostsTree], Optional[str]]:
+        return self.get_cache_entry(repo_url, branch).get_tree()
+
+    def set_cached_data(self, repo_url: str, branch: str, tree: PostsTree, version: Optional[str] = None):
         entry = self.get_cache_entry(repo_url, branch)
-        entry.set_data(data)
+        entry.set_data(tree, version)
         # 自动启动后台刷新（如果尚未启动）
         if not (entry.background_thread and entry.background_thread.is_alive()):
             entry.start_background_refresh()
@@ -84,24 +180,33 @@ class MultiRepoCacheManager:
         """手动刷新指定仓库缓存"""
         entry = self.get_cache_entry(repo_url, branch)
         try:
-            repo_path = ensure_repo_cloned(repo_url, branch)
-            git_pull(repo_url, branch)
-            data = scan_posts_tree(repo_url)
-            entry.set_data(data)
+            tree = entry.pull_and_scan()
             # 确保后台线程运行
             if not (entry.background_thread and entry.background_thread.is_alive()):
                 entry.start_background_refresh()
-            return data
+            return tree
         except Exception as e:
             raise Exception(f"手动刷新失败: {str(e)}")
 
+    def rescan_cache(self, repo_url: str, branch: str):
+        """提交推送后更新缓存（不再拉取）"""
+        entry = self.get_cache_entry(repo_url, branch)
+        tree = entry.rescan()
+        if not (entry.background_thread and entry.background_thread.is_alive()):
+            entry.start_background_refresh()
+        return tree
+
     def get_cache_status(self, repo_url: str, branch: str):
         entry = self.get_cache_entry(repo_url, branch)
         with entry.lock:
             return {
                 "repo_url": entry.repo_url,
                 "branch": entry.branch,
-                "has_data": entry.data is not None,
+                "has_data": entry.tree is not None,
+                "nodes": len(entry.tree) if entry.tree is not None else 0,
+                "version": entry.version,
+                "etag": entry.etag,
+                "body_bytes": entry.body.size if entry.body else 0,
                 "last_updated": entry.last_updated.isoformat() if entry.last_updated else None,
                 "background_thread_alive": entry.background_thread is not None and entry.background_thread.is_alive(),
             }
@@ -0,0 +1,189 @@
+# autoDeploy.py
+"""
+自动部署（可选）：文章提交、拉取到远端新提交时标记站点待部署，防抖后启动构建
+- 最后一次改动后安静 AUTO_DEPLOY_DEBOUNCE_SECONDS 才构建；持续改动时最迟 AUTO_DEPLOY_MAX_DELAY_SECONDS 构建一次
+- 同一仓库已有构建排队或运行时继续等待，每个安静期最多启动一次构建
+- 站点输入（HEAD 中除构建产物外的内容）与上次自动部署成功时相同则跳过；该记录存放在共享状态中，多 worker 共用
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from loguru import logger
+
+from commons.buildPool import build_pool
+from configs.config import SHARED_STATE, AUTO_DEPLOY_ENABLED, AUTO_DEPLOY_DEBOUNCE_SECONDS, \
+    AUTO_DEPLOY_MAX_DELAY_SECONDS
+from utils.git_utils import get_head_commit, source_fingerprint
+
+# 到期但同仓库仍在构建时的重试间隔（秒）
+BUSY_RETRY_SECONDS = 5
+
+# 提交构建的函数：(repo_url, branch, on_finish(成功与否)) -> task_id，由部署路由注册
+DeployFn = Callable[[str, str, Callable[[bool], None]], str]
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+class AutoDeployScheduler:
+    def __init__(self, debounce: float, max_delay: float):
+        self.debounce = debounce
+        self.max_delay = max(debounce, max_delay)
+        self._states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._deploy_fn: Optional[DeployFn] = None
+
+    def bind(self, deploy_fn: DeployFn):
+        self._deploy_fn = deploy_fn
+
+    @staticmethod
+    def _built_key(repo_url: str, branch: str) -> str:
+        return f"auto-deploy-built:{repo_url}@{branch}"
+
+    def _state(self, key: Tuple[str, str]) -> Dict[str, Any]:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = {
+                "dirty_since": None, "last_change": None, "pending_commit": None, "reasons": {},
+                "building": None, "last_task_id": None, "last_triggered_at": None,
+                "last_skipped_at": None, "skipped": 0, "triggered": 0,
+            }
+        return state
+
+    def mark_dirty(self, repo_url: str, branch: str, reason: str):
+        """内容已变化（commit: 本地提交，remote: 拉取到远端提交）"""
+        try:
+            commit = get_head_commit(repo_url)
+        except Exception:
+            commit = None
+        now = time.time()
+        with self._lock:
+            state = self._state((repo_url, branch))
+            if state["dirty_since"] is None:
+                state["dirty_since"] = now
+            state["last_change"] = now
+            state["pending_commit"] = commit
+            state["reasons"][reason] = state["reasons"].get(reason, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="auto-deploy")
+                self._thread.start()
+        self._wakeup.set()
+
+    def _due_at(self, state: Dict[str, Any]) -> Optional[float]:
+        if state["dirty_since"] is None:
+            return None
+        return min(state["last_change"] + self.debounce, state["dirty_since"] + self.max_delay)
+
+    def _loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            with self._lock:
+                due = [key for key, state in self._states.items()
+                       if state["dirty_since"] is not None and self._due_at(state) <= now]
+            for key in due:
+                try:
+                    self._fire(key)
+                except Exception as e:
+                    logger.error(f"自动部署失败 {key[0]}@{key[1]}: {e}")
+                    with self._lock:
+                        # 保留待部署标记，重新计时，避免反复报错
+                        self._states[key]["last_change"] = time.time()
+            with self._lock:
+                waits = [self._due_at(s) - time.time() for s in self._states.values() if s["dirty_since"] is not None]
+            # 仍然到期的是同仓库构建尚未结束的，稍后重试
+            self._wakeup.wait(min((w if w > 0 else BUSY_RETRY_SECONDS) for w in waits) if waits else None)
+
+    def _fire(self, key: Tuple[str, str]):
+        """到期处理；同仓库仍有构建在排队或运行时保留标记，稍后重试"""
+        repo_url, branch = key
+        if build_pool.queue_position(repo_url):
+            return
+        with self._lock:
+            state = self._state(key)
+            seen_change = state["last_change"]
+        fingerprint = source_fingerprint(repo_url)
+        commit = get_head_commit(repo_url)
+        fired_at = time.time()
+
+        def clear_dirty():
+            with self._lock:
+                # 期间又有新改动时保留待部署标记，下一个安静期再处理
+                if state["last_change"] == seen_change:
+                    state["dirty_since"] = None
+                    state["reasons"] = {}
+
+        built = SHARED_STATE.get(self._built_key(repo_url, branch))
+        if built and built.get("fingerprint") == fingerprint:
+            clear_dirty()
+            with self._lock:
+                state["skipped"] += 1
+                state["last_skipped_at"] = fired_at
+            logger.info(f"⏭️ 站点输入未变化，跳过自动部署 {repo_url}@{branch}（{commit[:8]}）")
+            return
+        if self._deploy_fn is None:
+            clear_dirty()
+            logger.warning("自动部署未注册构建函数，跳过")
+            return
+
+        building = {"commit": commit, "fingerprint": fingerprint, "built_at": None}
+
+        def on_finish(success: bool):
+            # 失败时不记录，下一次改动会重新构建
+            if success:
+                building["built_at"] = time.time()
+                SHARED_STATE.set(self._built_key(repo_url, branch), dict(building))
+            with self._lock:
+                if state["building"] is building:
+                    state["building"] = None
+
+        with self._lock:
+            state["building"] = building
+        try:
+            task_id = self._deploy_fn(repo_url, branch, on_finish)
+        except Exception:
+            # 提交失败：撤销构建中标记并保留待部署标记，由 _loop 重新计时后重试
+            with self._lock:
+                if state["building"] is building:
+                    state["building"] = None
+            raise
+        clear_dirty()
+        with self._lock:
+            state["last_task_id"] = task_id
+            state["last_triggered_at"] = fired_at
+            state["triggered"] += 1
+        logger.info(f"🚀 自动部署已提交 {repo_url}@{branch}（{commit[:8]}），任务 {task_id}")
+
+    def get_status(self, repo_url: str, branch: str) -> Dict[str, Any]:
+        with self._lock:
+            state = dict(self._state((repo_url, branch)))
+            due_at = self._due_at(state)
+        built = SHARED_STATE.get(self._built_key(repo_url, branch)) or {}
+        building = state["building"]
+        return {
+            "enabled": True,
+            "debounce_seconds": self.debounce,
+            "max_delay_seconds": self.max_delay,
+            "pending": state["dirty_since"] is not None,
+            "pending_commit": state["pending_commit"] if state["dirty_since"] is not None else None,
+            "pending_reasons": dict(state["reasons"]),
+            "pending_since": _iso(state["dirty_since"]),
+            "scheduled_at": _iso(due_at),
+            "building_commit": building["commit"] if building else None,
+            "last_built_commit": built.get("commit"),
+            "last_built_at": _iso(built.get("built_at")),
+            "last_task_id": state["last_task_id"],
+            "last_triggered_at": _iso(state["last_triggered_at"]),
+            "last_skipped_at": _iso(state["last_skipped_at"]),
+            "triggered": state["triggered"],
+            "skipped": state["skipped"],
+        }
+
+
+AUTO_DEPLOY = AutoDeployScheduler(AUTO_DEPLOY_DEBOUNCE_SECONDS, AUTO_DEPLOY_MAX_DELAY_SECONDS) \
+    if AUTO_DEPLOY_ENABLED else None
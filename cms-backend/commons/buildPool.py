@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+
+from loguru import logger
+
+from commons.profiler import maybe_profile_deploy
+from commons.tracing import start_trace
+from configs.config import BUILD_MAX_WORKERS, SHARED_STATE
+from utils.git_utils import get_repo_path
+
+# 最近 N 次等待时间用于统计
+WAIT_SAMPLE_SIZE = 200
+
+
+# ============= 构建任务 =============
+class BuildJob:
+    def __init__(self, repo_key: str, repo_url: str, branch: str, fn: Callable, args: tuple, kwargs: dict,
+                 task_id: Optional[str] = None):
+        self.repo_key = repo_key
+        self.repo_url = repo_url
+        self.branch = branch
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.task_id = task_id
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+# ============= 构建线程池（全局并发上限 + 每仓库 FIFO） =============
+class BuildWorkerPool:
+    """
+    - 全局最多 max_workers 个构建同时运行
+    - 同一仓库的构建严格串行、按提交顺序执行；同一仓库的不同分支共用一个本地工作区，同样串行
+    - 不同仓库之间并发执行
+    - 多 worker 时通过共享状态的构建锁保证同一仓库跨进程串行
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hexo-build")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Deque[BuildJob]] = {}  # 等待同仓库前序构建完成
+        self._active: Dict[str, BuildJob] = {}  # 已交给线程池（排队或运行中）
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_samples: Deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    def submit(self, repo_url: str, branch: str, fn: Callable, *args,
+               task_id: Optional[str] = None, **kwargs) -> BuildJob:
+        """提交一个构建，返回 BuildJob（不阻塞）；指定 task_id 时同样作为关键字参数传给 fn"""
+        if task_id is not None:
+            kwargs["task_id"] = task_id
+        job = BuildJob(self._repo_key(repo_url), repo_url, branch, fn, args, kwargs, task_id=task_id)
+        with self._lock:
+            self._submitted += 1
+            if job.repo_key in self._active:
+                self._pending.setdefault(job.repo_key, deque()).append(job)
+                return job
+            self._active[job.repo_key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    @staticmethod
+    def _repo_key(repo_url: str) -> str:
+        """按本地工作区路径排队：工作区只由仓库 URL 决定，与分支无关"""
+        return get_repo_path(repo_url)
+
+    def _run(self, job: BuildJob):
+        job.started_at = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._wait_samples.append(job.wait_seconds)
+        logger.info(f"🏗️ 开始构建 {job.repo_url}@{job.branch}，排队 {job.wait_seconds:.2f}s")
+        try:
+            # 多 worker 时同一仓库同一时间只允许一个进程构建
+            with start_trace("build", repo=job.repo_url, branch=job.branch, task_id=job.task_id or "",
+                             queue_wait_ms=round(job.wait_seconds * 1000, 1)):
+                with SHARED_STATE.lock(f"build:{job.repo_key}"), \
+                        maybe_profile_deploy(repo=job.repo_url, branch=job.branch, task_id=job.task_id):
+                    job.fn(*job.args, **job.kwargs)
+            failed = False
+        except Exception as e:
+            failed = True
+            logger.exception(f"后台任务异常: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+
+        with self._lock:
+            self._running -= 1
+            self._completed += 1
+            if failed:
+                self._failed += 1
+            queue = self._pending.get(job.repo_key)
+            next_job = queue.popleft() if queue else None
+            if queue is not None and not queue:
+                self._pending.pop(job.repo_key, None)
+            if next_job:
+                self._active[job.repo_key] = next_job
+            else:
+                self._active.pop(job.repo_key, None)
+        if next_job:
+            self._executor.submit(self._run, next_job)
+
+    def queue_position(self, repo_url: str) -> int:
+        """同仓库（任意分支）前面还有多少个构建"""
+        with self._lock:
+            key = self._repo_key(repo_url)
+            return len(self._pending.get(key, ())) + (1 if key in self._active else 0)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            waiting_in_executor = len(self._active) - self._running
+            waiting_per_repo = sum(len(q) for q in self._pending.values())
+            samples = list(self._wait_samples)
+            now = time.monotonic()
+            oldest_wait = max(
+                [now - j.enqueued_at for j in self._active.values() if j.started_at is None] +
+                [now - j.enqueued_at for q in self._pending.values() for j in q] + [0.0]
+            )
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "queue_depth": waiting_in_executor + waiting_per_repo,
+                "queue_depth_by_repo": {
+                    q[0].repo_url: len(q) for q in self._pending.values()
+                },
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "oldest_wait_seconds": round(oldest_wait, 3),
+                "avg_wait_seconds": round(sum(samples) / len(samples), 3) if samples else 0.0,
+                "max_wait_seconds": round(max(samples), 3) if samples else 0.0,
+            }
+
+
+# 全局构建池
+build_pool = BuildWorkerPool(BUILD_MAX_WORKERS)
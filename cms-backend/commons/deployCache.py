@@ -1,74 +1,337 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import uuid
 
-TASKS: Dict[str, Dict[str, Any]] = {}
-MAX_TASK_AGE = 3600  # 1 小时（秒）
-MAX_TASK_COUNT = 50  # 最多保留 50 个任务（可选）
+from configs.config import DEPLOY_DB_PATH, DEPLOY_TASK_TTL, DEPLOY_TASK_MAX_COUNT
+
+MAX_TASK_AGE = DEPLOY_TASK_TTL  # 任务保留时长（秒）
+MAX_TASK_COUNT = DEPLOY_TASK_MAX_COUNT  # 最多保留的任务数
+CLEANUP_INTERVAL = 300  # 后台清理间隔（秒）
+CANCEL_POLL_INTERVAL = 1.0  # 跨进程取消标记的查询间隔（秒）
+
+# tasks 表中的固定列，其余字段存入 extra（JSON）
+TASK_COLUMNS = ("status", "message", "triggered_by", "repo_url", "branch")
+STEP_COLUMNS = ("step", "status", "message", "error", "stdout")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deploy_tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    message TEXT,
+    triggered_by TEXT,
+    repo_url TEXT,
+    branch TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_deploy_tasks_triggered_by ON deploy_tasks (triggered_by, created_at);
+CREATE INDEX IF NOT EXISTS idx_deploy_tasks_created_at ON deploy_tasks (created_at);
+CREATE TABLE IF NOT EXISTS deploy_task_steps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    step TEXT,
+    status TEXT,
+    message TEXT,
+    error TEXT,
+    stdout TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deploy_task_steps_task_id ON deploy_task_steps (task_id, id);
+"""
+
+FINISHED_STATUSES = ("success", "failure", "cancelled")
+
+
+def _owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        # Windows 上 os.kill(pid, 0) 不可用，无法判断时视为存活
+        return True
+    return True
+
+
+# ============= SQLite 任务存储（WAL，支持多线程 / 多进程） =============
+class DeployTaskStore:
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock, self._conn() as conn:
+            conn.executescript(SCHEMA)
+        self._recover_orphans()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _recover_orphans(self):
+        """进程退出时仍在运行的任务标记为失败（仅处理本机已不存在的进程）"""
+        host = socket.gethostname()
+        rows = self._conn().execute(
+            "SELECT task_id, owner FROM deploy_tasks WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        orphans = []
+        for row in rows:
+            owner_host, _, pid = (row["owner"] or "").rpartition(":")
+            if owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                orphans.append(row["task_id"])
+        if orphans:
+            with self._write_lock, self._conn() as conn:
+                conn.executemany(
+                    "UPDATE deploy_tasks SET status = 'failure', message = ?, updated_at = ? WHERE task_id = ?",
+                    [("服务重启，任务已中断", time.time(), tid) for tid in orphans]
+                )
+
+    def create(self, task_id: str, triggered_by: str):
+        now = time.time()
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "INSERT INTO deploy_tasks (task_id, status, message, triggered_by, created_at, updated_at, owner) "
+                "VALUES (?, 'queued', '任务已提交，等待执行', ?, ?, ?, ?)",
+                (task_id, triggered_by, now, now, _owner_id())
+            )
+
+    def update(self, task_id: str, fields: Dict[str, Any]):
+        with self._write_lock, self._conn() as conn:
+            self._update(conn, task_id, fields)
+
+    def _update(self, conn: sqlite3.Connection, task_id: str, fields: Dict[str, Any]):
+        """在调用方的事务中更新任务字段"""
+        columns = {k: v for k, v in fields.items() if k in TASK_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in TASK_COLUMNS and k != "steps"}
+        if extra:
+            row = conn.execute("SELECT extra FROM deploy_tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row["extra"]) if row["extra"] else {}
+            merged.update(extra)
+            columns["extra"] = json.dumps(merged, ensure_ascii=False)
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in columns)
+        conn.execute(
+            f"UPDATE deploy_tasks SET {assignments} WHERE task_id = ?",
+            list(columns.values()) + [task_id]
+        )
+        if "steps" in fields:
+            # 兼容整体替换 steps 的旧调用方式
+            conn.execute("DELETE FROM deploy_task_steps WHERE task_id = ?", (task_id,))
+            self._insert_steps(conn, task_id, fields["steps"] or [])
+
+    @staticmethod
+    def _insert_steps(conn: sqlite3.Connection, task_id: str, steps):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO deploy_task_steps (task_id, step, status, message, error, stdout, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(task_id,) + tuple(step.get(c, "") for c in STEP_COLUMNS) + (now,) for step in steps]
+        )
+
+    def append_step(self, task_id: str, step: Dict[str, Any], fields: Dict[str, Any]):
+        """追加一个步骤（单行插入）并更新任务字段，在同一事务中完成"""
+        with self._write_lock, self._conn() as conn:
+            exists = conn.execute("SELECT 1 FROM deploy_tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if not exists:
+                return
+            self._insert_steps(conn, task_id, [step])
+            if fields:
+                self._update(conn, task_id, fields)
+
+    def _row_to_task(self, row: sqlite3.Row) -> Dict[str, Any]:
+        task = {
+            "task_id": row["task_id"],
+            "status": row["status"],
+            "message": row["message"],
+            "triggered_by": row["triggered_by"],
+            "repo_url": row["repo_url"],
+            "branch": row["branch"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if row["extra"]:
+            task.update(json.loads(row["extra"]))
+        steps = self._conn().execute(
+            "SELECT step, status, message, error, stdout FROM deploy_task_steps WHERE task_id = ? ORDER BY id",
+            (row["task_id"],)
+        ).fetchall()
+        task["steps"] = [dict(s) for s in steps]
+        return task
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM deploy_tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def get_last_by_triggered_by(self, triggered_by: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM deploy_tasks WHERE triggered_by = ? ORDER BY created_at DESC LIMIT 1",
+            (triggered_by,)
+        ).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def replace_triggered_by(self, old: str, new: str):
+        """把已存储的触发者标识整体替换（清除旧版本写入的原始 Token）"""
+        with self._write_lock, self._conn() as conn:
+            conn.execute("UPDATE deploy_tasks SET triggered_by = ? WHERE triggered_by = ?", (new, old))
+
+    def get_status(self, task_id: str) -> Optional[str]:
+        row = self._conn().execute("SELECT status FROM deploy_tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row["status"] if row else None
+
+    def request_cancel(self, task_id: str):
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "UPDATE deploy_tasks SET cancel_requested = 1, updated_at = ? WHERE task_id = ?",
+                (time.time(), task_id)
+            )
+
+    def is_cancel_requested(self, task_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT cancel_requested FROM deploy_tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def cleanup(self, max_age: float, max_count: int):
+        """删除过期任务及超出数量上限的最老任务（走 created_at 索引）"""
+        cutoff = time.time() - max_age
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM deploy_tasks WHERE created_at < ?", (cutoff,))
+            conn.execute(
+                "DELETE FROM deploy_tasks WHERE task_id IN ("
+                "SELECT task_id FROM deploy_tasks ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (max_count,)
+            )
+            conn.execute(
+                "DELETE FROM deploy_task_steps WHERE task_id NOT IN (SELECT task_id FROM deploy_tasks)"
+            )
+
+
+TASK_STORE = DeployTaskStore(DEPLOY_DB_PATH)
+# 每个任务的本进程取消标记（跨进程取消通过数据库中的 cancel_requested）
+CANCEL_EVENTS: Dict[str, threading.Event] = {}
+_cancel_lock = threading.Lock()
+
 
 def _cleanup_old_tasks():
     """清理过期或过多的任务"""
-    now = time.time()
-    to_delete = []
-
-    # 标记过期任务
-    for tid, task in TASKS.items():
-        if now - task.get("created_at", 0) > MAX_TASK_AGE:
-            to_delete.append(tid)
-
-    # 如果数量超限，按创建时间删除最老的（可选）
-    if len(TASKS) - len(to_delete) > MAX_TASK_COUNT:
-        # 按 created_at 排序，取最老的
-        sorted_tasks = sorted(
-            [(tid, task) for tid, task in TASKS.items() if tid not in to_delete],
-            key=lambda x: x[1].get("created_at", 0)
-        )
-        excess = len(sorted_tasks) - MAX_TASK_COUNT
-        if excess > 0:
-            to_delete.extend(tid for tid, _ in sorted_tasks[:excess])
+    TASK_STORE.cleanup(MAX_TASK_AGE, MAX_TASK_COUNT)
+    with _cancel_lock:
+        for tid in list(CANCEL_EVENTS):
+            if TASK_STORE.get_status(tid) in (None,) + FINISHED_STATUSES:
+                CANCEL_EVENTS.pop(tid, None)
 
-    # 执行删除
-    for tid in to_delete:
-        TASKS.pop(tid, None)
 
-def create_task(triggered_by: str = "unknown") -> str:
-    _cleanup_old_tasks()  # 创建前清理过期任务
+def _cleanup_loop():
+    while True:
+        time.sleep(CLEANUP_INTERVAL)
+        try:
+            _cleanup_old_tasks()
+        except Exception as e:
+            print(f"清理部署任务失败: {e}")
+
+
+threading.Thread(target=_cleanup_loop, daemon=True, name="deploy-task-cleanup").start()
+
 
+def create_task(triggered_by: str = "unknown") -> str:
     task_id = f"_hexo_{int(time.time())}_{uuid.uuid4().hex[:6]}"
-    TASKS[task_id] = {
-        "status": "queued",
-        "message": "任务已提交，等待执行",
-        "steps": [],
-        "created_at": time.time(),
-        "triggered_by": triggered_by
-    }
+    TASK_STORE.create(task_id, triggered_by)
+    with _cancel_lock:
+        CANCEL_EVENTS[task_id] = threading.Event()
     return task_id
 
 def update_task(task_id: str, **kwargs):
-    if task_id in TASKS:
-        TASKS[task_id].update(kwargs)
+    TASK_STORE.update(task_id, kwargs)
+
+def append_task_step(task_id: str, step: Dict[str, Any], **kwargs):
+    """追加一个构建步骤，同时更新任务字段（不再整体重写 steps 列表）"""
+    TASK_STORE.append_step(task_id, step, kwargs)
 
 def get_task(task_id: str):
-    return TASKS.get(task_id)
+    return TASK_STORE.get(task_id)
+
+
+class TaskCancelFlag:
+    """
+    与 threading.Event 接口一致的取消标记：
+    本进程取消时立即生效，其他进程取消时通过数据库轮询感知
+    """
+
+    def __init__(self, task_id: str, event: threading.Event):
+        self.task_id = task_id
+        self._event = event
+        self._last_poll = 0.0
+
+    def is_set(self) -> bool:
+        if self._event.is_set():
+            return True
+        now = time.monotonic()
+        if now - self._last_poll >= CANCEL_POLL_INTERVAL:
+            self._last_poll = now
+            if TASK_STORE.is_cancel_requested(self.task_id):
+                self._event.set()
+        return self._event.is_set()
+
+    def set(self):
+        self._event.set()
+
+
+def get_cancel_event(task_id: str) -> TaskCancelFlag:
+    """获取任务的取消标记，不存在时创建"""
+    with _cancel_lock:
+        event = CANCEL_EVENTS.setdefault(task_id, threading.Event())
+    return TaskCancelFlag(task_id, event)
+
+
+def cancel_task(task_id: str) -> bool:
+    """
+    请求取消任务：已结束的任务返回 False
+    运行中的构建会在下一次轮询时终止整个进程组
+    """
+    status = TASK_STORE.get_status(task_id)
+    if status is None or status in FINISHED_STATUSES:
+        return False
+    TASK_STORE.request_cancel(task_id)
+    get_cancel_event(task_id).set()
+    if status == "queued":
+        update_task(task_id, status="cancelled", message="任务已取消")
+    return True
+
+
+def replace_triggered_by(old: str, new: str):
+    TASK_STORE.replace_triggered_by(old, new)
 
 
 def get_last_task_by_triggered_by(triggered_by: str):
     """
     获取指定用户最近一次创建的任务（按 created_at 最新）
-    :param triggered_by: 用户标识（token / user_id）
+    :param triggered_by: 触发者标识（Token 指纹，见 token_utils.token_fingerprint）
     :return: 任务 dict 或 None
     """
     if not isinstance(triggered_by, str):
         return None
 
-    candidate_tasks = [
-        task for task in TASKS.values()
-        if task.get("triggered_by") == triggered_by
-    ]
-
-    if not candidate_tasks:
-        return None
-
-    # 按 created_at 降序，取第一个（最新）
-    latest_task = max(candidate_tasks, key=lambda t: t.get("created_at", 0))
-    return latest_task
\ No newline at end of file
+    return TASK_STORE.get_last_by_triggered_by(triggered_by)
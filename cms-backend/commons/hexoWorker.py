@@ -0,0 +1,368 @@
+# hexoWorker.py
+"""
+常驻 Hexo 进程：每个仓库一个 node 进程，启动时加载一次 Hexo（插件、主题、配置、数据库），
+之后每次部署只发送一条 generate 请求，由 Hexo 自身的缓存增量处理改动的文件
+- 通过 stdin / stdout 逐行 JSON 通信，应答行带前缀，与 Hexo 和插件的日志区分
+- 配置文件、主题配置、依赖清单变化后常驻进程失效，由完整构建重新启动
+- 后台监督：定期 ping 健康检查，崩溃自动重启（有次数上限），内存超限或空闲过久时回收
+"""
+import atexit
+import glob
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+from configs.config import CMS_DATA_DIR, HEXO_STEP_TIMEOUT, HEXO_WORKER_ENABLED, HEXO_WORKER_MAX_RSS_MB, \
+    HEXO_WORKER_IDLE_SECONDS, HEXO_WORKER_HEALTH_INTERVAL, HEXO_WORKER_MAX_RESTARTS
+from utils.webhook_utils import spawn_process, kill_process_tree, BuildCancelledError, BuildTimeoutError, \
+    POLL_INTERVAL
+
+REPLY_PREFIX = "@@hexo-worker@@ "
+PING_TIMEOUT = 10
+# 常驻进程的输出目录与配置覆盖文件（相对仓库根目录，位于已被 git 忽略的 .releases 下）
+WORKER_PUBLIC_DIR = ".releases/.worker-public"
+WORKER_OVERRIDE = ".releases/.override-worker.yml"
+# 这些文件变化后需要重新加载 Hexo（依赖变化还需要先 npm install）
+FINGERPRINT_PATTERNS = ("_config.yml", "_config.*.yml", "package.json", "package-lock.json", "yarn.lock",
+                        "pnpm-lock.yaml", "themes/*/_config.yml")
+
+WORKER_SCRIPT = r"""
+// 由 cms-backend 生成：常驻 Hexo 进程，逐行读取 JSON 请求，按顺序执行
+const readline = require('readline');
+const [base, config] = process.argv.slice(2);
+const Hexo = require(require.resolve('hexo', { paths: [base] }));
+const PREFIX = '@@hexo-worker@@ ';
+const reply = msg => process.stdout.write(PREFIX + JSON.stringify(msg) + '\n');
+const errorText = err => String((err && err.stack) || err);
+const rss = () => process.memoryUsage().rss;
+
+const hexo = new Hexo(base, { config, silent: true });
+let queue = hexo.init().then(
+  () => reply({ id: 0, ok: true, rss: rss() }),
+  err => { reply({ id: 0, ok: false, error: errorText(err) }); process.exit(1); }
+);
+
+readline.createInterface({ input: process.stdin }).on('line', line => {
+  let req;
+  try { req = JSON.parse(line); } catch (err) { return; }
+  queue = queue.then(() => {
+    const started = Date.now();
+    if (req.cmd !== 'generate') return reply({ id: req.id, ok: true, rss: rss() });
+    return hexo.call('generate', {}).then(
+      () => reply({ id: req.id, ok: true, ms: Date.now() - started, rss: rss() }),
+      err => reply({ id: req.id, ok: false, error: errorText(err) })
+    );
+  });
+}).on('close', () => {
+  queue.then(() => hexo.exit()).then(() => process.exit(0), () => process.exit(1));
+});
+"""
+
+
+def config_fingerprint(repo_path: str) -> Tuple:
+    stamps = []
+    for pattern in FINGERPRINT_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(glob.escape(repo_path), pattern))):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamps.append((os.path.relpath(path, repo_path), st.st_mtime_ns, st.st_size))
+    return tuple(stamps)
+
+
+def _script_path() -> str:
+    path = os.path.join(CMS_DATA_DIR, "hexo-worker.js")
+    existing = None
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            existing = f.read()
+    if existing != WORKER_SCRIPT:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(WORKER_SCRIPT)
+    return path
+
+
+# ============= 单个常驻进程 =============
+class HexoWorker:
+    def __init__(self, repo_path: str, atomic: bool, fingerprint: Optional[Tuple] = None):
+        """
+        :param atomic: True 时输出到私有目录，部署时再复制为新版本；否则与完整构建一样直接输出到 public
+        :param fingerprint: 重启时沿用原进程的配置指纹，依赖变化仍需完整构建（npm install）后才能使用
+        """
+        self.repo_path = repo_path
+        self.atomic = atomic
+        self.public_path = os.path.join(repo_path, WORKER_PUBLIC_DIR if atomic else "public")
+        self.fingerprint = fingerprint or config_fingerprint(repo_path)
+        self.state = "stopped"  # stopped | starting | ready | crashed
+        self.started_at: Optional[float] = None
+        self.last_used = time.monotonic()
+        self.generations = 0
+        self.rss = 0
+        self.needs_restart = False
+        self.last_error = ""
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._ready = threading.Event()
+        self._output: deque = deque(maxlen=50)
+
+    def start(self):
+        """启动并等待 Hexo 加载完成，失败时抛出 RuntimeError"""
+        config_arg = "_config.yml"
+        if self.atomic:
+            os.makedirs(os.path.dirname(os.path.join(self.repo_path, WORKER_OVERRIDE)), exist_ok=True)
+            with open(os.path.join(self.repo_path, WORKER_OVERRIDE), "w", encoding="utf-8") as f:
+                f.write(f"public_dir: {WORKER_PUBLIC_DIR}\n")
+            config_arg = f"_config.yml,{WORKER_OVERRIDE}"
+        self.state = "starting"
+        self._ready.clear()
+        self._output.clear()
+        # 常驻进程不设置 CPU 时间上限；内存由 HEXO_MAX_MEMORY_MB / HEXO_RLIMIT_AS_MB 与 RSS 检查共同限制
+        proc = spawn_process(["node", _script_path(), self.repo_path, config_arg], self.repo_path, limit_cpu=False,
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
+        self._proc = proc
+        threading.Thread(target=self._read, args=(proc,), daemon=True, name="hexo-worker-reader").start()
+        if not self._ready.wait(HEXO_STEP_TIMEOUT) or self.state != "ready":
+            self.stop()
+            self.state = "crashed"
+            raise RuntimeError(self.last_error or "常驻 Hexo 进程启动超时: " + "\n".join(self._output))
+        self.started_at = time.monotonic()
+        self.last_used = self.started_at
+        logger.info(f"♨️ 常驻 Hexo 进程已就绪 {self.repo_path}，pid={proc.pid}，内存 {self.rss // 1024 // 1024} MB")
+
+    def _read(self, proc: subprocess.Popen):
+        for line in proc.stdout:
+            if not line.startswith(REPLY_PREFIX):
+                self._output.append(line.rstrip())
+                continue
+            try:
+                reply = json.loads(line[len(REPLY_PREFIX):])
+            except ValueError:
+                continue
+            self.rss = reply.get("rss", self.rss)
+            if reply.get("id") == 0:
+                self.state = "ready" if reply.get("ok") else "crashed"
+                self.last_error = reply.get("error", "")
+                self._ready.set()
+                continue
+            with self._lock:
+                waiter = self._pending.pop(reply.get("id"), None)
+            if waiter:
+                waiter["reply"] = reply
+                waiter["event"].set()
+
+        # 进程退出：唤醒所有等待者
+        if self._proc is proc and self.state != "stopped":
+            self.state = "crashed"
+            self.last_error = self.last_error or "常驻 Hexo 进程意外退出: " + "\n".join(list(self._output)[-10:])
+        self._ready.set()
+        with self._lock:
+            waiters, self._pending = list(self._pending.values()), {}
+        for waiter in waiters:
+            waiter["event"].set()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def request(self, cmd: str, timeout: float, cancel_event: Optional[threading.Event] = None,
+                deadline: Optional[float] = None) -> Dict[str, Any]:
+        waiter = {"event": threading.Event(), "reply": None}
+        with self._lock:
+            if self.state != "ready" or not self.alive:
+                raise RuntimeError("常驻 Hexo 进程未运行")
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = waiter
+            try:
+                self._proc.stdin.write(json.dumps({"id": request_id, "cmd": cmd}) + "\n")
+                self._proc.stdin.flush()
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                raise RuntimeError(f"常驻 Hexo 进程通信失败: {e}")
+
+        end = time.monotonic() + timeout
+        if deadline:
+            end = min(end, deadline)
+        while not waiter["event"].wait(POLL_INTERVAL):
+            # 生成过程无法中途打断，取消或超时时直接结束进程，之后由完整构建重新启动
+            if cancel_event and cancel_event.is_set():
+                self.stop()
+                raise BuildCancelledError(f"构建已取消: hexo worker {cmd}")
+            if time.monotonic() >= end:
+                self.stop()
+                raise BuildTimeoutError(f"常驻 Hexo 进程响应超时: {cmd}")
+        reply = waiter["reply"]
+        if reply is None:
+            raise RuntimeError(self.last_error or "常驻 Hexo 进程意外退出")
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error") or f"常驻 Hexo 进程执行失败: {cmd}")
+        return reply
+
+    def generate(self, cancel_event: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None) -> Dict[str, Any]:
+        self.last_used = time.monotonic()
+        reply = self.request("generate", HEXO_STEP_TIMEOUT, cancel_event, deadline)
+        self.generations += 1
+        self.last_used = time.monotonic()
+        if HEXO_WORKER_MAX_RSS_MB and self.rss > HEXO_WORKER_MAX_RSS_MB * 1024 * 1024:
+            # 本次结果有效，进程在下一次健康检查时重启
+            self.needs_restart = True
+        return {"seconds": round(reply.get("ms", 0) / 1000, 3), "rss_mb": self.rss // 1024 // 1024}
+
+    def ping(self):
+        self.request("ping", PING_TIMEOUT)
+
+    def stop(self):
+        self.state = "stopped"
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        kill_process_tree(proc)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "repo_path": self.repo_path,
+            "state": self.state,
+            "pid": self._proc.pid if self._proc else None,
+            "atomic": self.atomic,
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at and self.alive else 0,
+            "idle_seconds": round(now - self.last_used, 1),
+            "generations": self.generations,
+            "rss_mb": self.rss // 1024 // 1024,
+            "last_error": self.last_error[-2000:],
+        }
+
+
+# ============= 管理与监督 =============
+class HexoWorkerManager:
+    def __init__(self):
+        self._workers: Dict[str, HexoWorker] = {}
+        self._restarts: Dict[str, int] = {}
+        self._starting = set()
+        self._lock = threading.Lock()
+        self._supervisor: Optional[threading.Thread] = None
+
+    def acquire(self, repo_path: str, atomic: bool) -> Optional[HexoWorker]:
+        """返回可直接使用的常驻进程；不存在、未就绪或配置 / 依赖已变化时返回 None（应执行完整构建）"""
+        key = os.path.abspath(repo_path)
+        with self._lock:
+            worker = self._workers.get(key)
+        if worker is None or worker.state != "ready" or not worker.alive:
+            return None
+        if worker.atomic != atomic or worker.fingerprint != config_fingerprint(repo_path):
+            logger.info(f"♨️ 配置或依赖已变化，停止常驻 Hexo 进程 {repo_path}")
+            self.stop(repo_path)
+            return None
+        return worker
+
+    def warm_up(self, repo_path: str, atomic: bool):
+        """完整构建成功后调用：在后台启动常驻进程并先生成一次，供下次部署使用"""
+        key = os.path.abspath(repo_path)
+        with self._lock:
+            if key in self._starting:
+                return
+            self._starting.add(key)
+            self._restarts[key] = 0
+            if self._supervisor is None:
+                self._supervisor = threading.Thread(target=self._supervise, daemon=True, name="hexo-worker-supervisor")
+                self._supervisor.start()
+        threading.Thread(target=self._start, args=(key, atomic), daemon=True, name="hexo-worker-start").start()
+
+    def _start(self, key: str, atomic: bool, fingerprint: Optional[Tuple] = None):
+        try:
+            self.stop(key)
+            worker = HexoWorker(key, atomic, fingerprint)
+            with self._lock:
+                self._workers[key] = worker
+            worker.start()
+            worker.generate()
+        except Exception as e:
+            logger.warning(f"常驻 Hexo 进程启动失败 {key}: {e}")
+        finally:
+            with self._lock:
+                self._starting.discard(key)
+
+    def stop(self, repo_path: str):
+        """完整构建开始前调用，避免与 hexo clean 同时操作 db.json"""
+        with self._lock:
+            worker = self._workers.pop(os.path.abspath(repo_path), None)
+        if worker:
+            worker.stop()
+
+    def stop_all(self):
+        with self._lock:
+            workers, self._workers = list(self._workers.values()), {}
+        for worker in workers:
+            worker.stop()
+
+    def _supervise(self):
+        while True:
+            time.sleep(HEXO_WORKER_HEALTH_INTERVAL)
+            with self._lock:
+                workers = [(key, w) for key, w in self._workers.items() if key not in self._starting]
+            for key, worker in workers:
+                try:
+                    self._check(key, worker)
+                except Exception as e:
+                    logger.warning(f"常驻 Hexo 进程健康检查异常 {key}: {e}")
+
+    def _check(self, key: str, worker: HexoWorker):
+        if worker.state == "starting":
+            return
+        if HEXO_WORKER_IDLE_SECONDS and time.monotonic() - worker.last_used > HEXO_WORKER_IDLE_SECONDS:
+            logger.info(f"♨️ 常驻 Hexo 进程空闲超时，已退出 {key}")
+            self.stop(key)
+            return
+        if worker.needs_restart:
+            logger.info(f"♨️ 常驻 Hexo 进程内存 {worker.rss // 1024 // 1024} MB 超过上限，重启 {key}")
+            self._restart(key, worker, crashed=False)
+            return
+        if worker.state == "ready" and worker.alive:
+            try:
+                worker.ping()
+                self._restarts[key] = 0
+                return
+            except Exception as e:
+                worker.last_error = f"健康检查失败: {e}"
+        if self._restarts.get(key, 0) >= HEXO_WORKER_MAX_RESTARTS:
+            logger.error(f"常驻 Hexo 进程连续重启 {HEXO_WORKER_MAX_RESTARTS} 次仍失败，等待下次完整构建 {key}")
+            self.stop(key)
+            return
+        logger.warning(f"♨️ 常驻 Hexo 进程异常（{worker.last_error[:200]}），重启 {key}")
+        self._restart(key, worker, crashed=True)
+
+    def _restart(self, key: str, worker: HexoWorker, crashed: bool):
+        with self._lock:
+            if key in self._starting:
+                return
+            self._starting.add(key)
+            if crashed:
+                self._restarts[key] = self._restarts.get(key, 0) + 1
+        self._start(key, worker.atomic, worker.fingerprint)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = list(self._workers.values())
+            starting = sorted(self._starting)
+        return {"enabled": True, "workers": [w.get_stats() for w in workers], "starting": starting}
+
+
+HEXO_WORKERS = HexoWorkerManager() if HEXO_WORKER_ENABLED else None
+if HEXO_WORKERS is not None:
+    # 退出时结束所有 node 进程（stdin 关闭后进程也会自行退出）
+    atexit.register(HEXO_WORKERS.stop_all)
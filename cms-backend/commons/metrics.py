@@ -0,0 +1,244 @@
+# metrics.py
+"""
+Prometheus 文本格式指标（不依赖 prometheus_client）
+- 关闭（METRICS_ENABLED=0）时：装饰器直接返回原函数，计时上下文返回空对象，记录方法立即返回
+- 指标按进程统计，多 worker 时每次抓取只反映处理该请求的 worker
+"""
+import re
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from configs.config import METRICS_ENABLED, current_repo
+
+# 接口延迟桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# git / 扫描 / 构建步骤等慢操作的桶（秒）
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def redact_repo(repo_url: str) -> str:
+    """仓库地址只保留 owner/repo，去掉协议、主机和可能带有的凭据"""
+    match = re.search(r'([^/:@]+/[^/:@]+?)(\.git)?/?$', repo_url or "")
+    return match.group(1) if match else "unknown"
+
+
+def repo_labels(repo_url: str, branch: str) -> Dict[str, str]:
+    """
+    仓库 / 分支标签只取自当前配置的仓库，其他（请求传入的）仓库统一记为 other
+    避免客户端输入进入标签：既不泄露地址中的凭据，也不会撑大指标基数
+    """
+    if repo_url == current_repo["url"] and branch == current_repo["branch"]:
+        return {"repo": redact_repo(current_repo["url"]), "branch": current_repo["branch"]}
+    return {"repo": "other", "branch": "other"}
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ============= 指标类型 =============
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., 总和, 总数]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """计时上下文：with HIST.time(op="x"): ..."""
+        if not METRICS_ENABLED:
+            return _NOOP_TIMER
+        return _Timer(self, labels)
+
+    def _render_sample(self, key: tuple, state) -> List[str]:
+        lines = []
+        bucket_labels = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(bound),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, key + ('+Inf',))} {state[-1]}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+        lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+# ============= 注册表 =============
+_METRICS: List[_Metric] = []
+# 抓取时调用的采集函数，返回 [(指标名, 类型, 说明, [(标签字典, 值), ...]), ...]
+_COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, list]]]] = []
+
+
+def _register(metric):
+    _METRICS.append(metric)
+    return metric
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, list]]]):
+    """注册抓取时才计算的指标（缓存年龄、队列深度等），避免在热路径上维护"""
+    _COLLECTORS.append(fn)
+    return fn
+
+
+def timed_operation(op: str):
+    """按操作名记录函数耗时与失败次数；关闭指标时原样返回函数，没有任何额外开销"""
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                OPERATION_ERRORS.inc(op=op)
+                raise
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - start, op=op)
+        return wrapper
+    return decorator
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _COLLECTORS:
+        try:
+            families = list(collector())
+        except Exception as e:
+            lines.append(f"# collector {getattr(collector, '__name__', collector)} failed: {_escape(e)}")
+            continue
+        for name, type_name, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ============= 指标定义 =============
+HTTP_REQUEST_SECONDS = _register(Histogram(
+    "cms_http_request_duration_seconds", "HTTP 接口耗时", ("method", "route", "status")))
+OPERATION_SECONDS = _register(Histogram(
+    "cms_operation_duration_seconds", "git_pull / git_commit_and_push / ensure_repo_cloned / scan_posts_tree 等操作耗时",
+    ("op",), buckets=SLOW_BUCKETS))
+OPERATION_ERRORS = _register(Counter(
+    "cms_operation_errors_total", "操作失败次数", ("op",)))
+CACHE_REQUESTS = _register(Counter(
+    "cms_cache_requests_total", "文章列表缓存命中 / 未命中次数", ("repo", "branch", "result")))
+DEPLOY_STEP_SECONDS = _register(Histogram(
+    "cms_deploy_step_duration_seconds", "部署步骤耗时", ("step", "status"), buckets=SLOW_BUCKETS))
+AUTH_REJECTIONS = _register(Counter(
+    "cms_auth_rejections_total", "认证拒绝次数", ("reason",)))
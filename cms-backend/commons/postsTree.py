@@ -0,0 +1,150 @@
+# postsTree.py
+"""
+紧凑的文章树：缓存中常驻的内部表示，替代嵌套 dict
+- 节点按广度优先编号存放在平行数组中（名称、父节点、类型、子节点区间、文章数），
+  同一目录的子节点编号连续且按名称有序；目录名做 intern，重复的路径片段只存一份
+- 不保存完整相对路径，需要时沿父节点拼接
+- 只在响应边界物化为原有 JSON 结构（to_dict）或按层级分页输出（list_dir）
+"""
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple, Iterable, Iterator
+
+# 单层默认 / 最大返回条数
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+MAX_DEPTH = 10
+
+ROOT = 0
+_FILE = 0
+_DIR = 1
+
+
+class PostsTree:
+    __slots__ = ("names", "parents", "kinds", "child_start", "child_count", "dir_count", "totals", "_dir_ids")
+
+    def __init__(self):
+        # 0 号节点为 _posts 根目录
+        self.names: List[str] = [""]
+        self.parents = array("i", [-1])
+        self.kinds = bytearray([_DIR])
+        self.child_start = array("i", [0])
+        self.child_count = array("i", [0])
+        self.dir_count = array("i", [0])
+        self.totals = array("i", [0])
+        self._dir_ids: Dict[str, int] = {"": ROOT}
+
+    # ============= 构建 =============
+    def add_children(self, parent: int, children: Iterable[Tuple[str, bool]]) -> List[Tuple[int, str]]:
+        """
+        一次性追加某个目录的全部子节点（需已按名称排序），返回新目录的 (编号, 名称)
+        按广度优先顺序调用，保证每个目录的子节点编号连续
+        """
+        start = len(self.names)
+        new_dirs = []
+        for name, is_dir in children:
+            node = len(self.names)
+            # 目录名在各层、各分支间大量重复，intern 后共享；文件名基本唯一，intern 反而多占驻留表
+            self.names.append(sys.intern(name) if is_dir else name)
+            self.parents.append(parent)
+            self.kinds.append(_DIR if is_dir else _FILE)
+            self.child_start.append(0)
+            self.child_count.append(0)
+            self.dir_count.append(0)
+            self.totals.append(0 if is_dir else 1)
+            if is_dir:
+                new_dirs.append((node, name))
+        self.child_start[parent] = start
+        self.child_count[parent] = len(self.names) - start
+        self.dir_count[parent] = len(new_dirs)
+        return new_dirs
+
+    def finish(self) -> "PostsTree":
+        """自底向上累加目录下的文章总数，并建立目录路径索引"""
+        parents, totals = self.parents, self.totals
+        for node in range(len(self.names) - 1, ROOT, -1):
+            totals[parents[node]] += totals[node]
+        for node, kind in enumerate(self.kinds):
+            if kind == _DIR and node != ROOT:
+                self._dir_ids[self.path(node)] = node
+        return self
+
+    # ============= 查询 =============
+    def __len__(self) -> int:
+        return len(self.names) - 1
+
+    @property
+    def total(self) -> int:
+        return self.totals[ROOT]
+
+    def path(self, node: int) -> str:
+        parts = []
+        while node > ROOT:
+            parts.append(self.names[node])
+            node = self.parents[node]
+        return "/".join(reversed(parts))
+
+    def file_paths(self) -> Iterator[str]:
+        for node, kind in enumerate(self.kinds):
+            if kind == _FILE:
+                yield self.path(node)
+
+    def has_dir(self, path: str) -> bool:
+        return path.strip("/") in self._dir_ids
+
+    def counts(self, node: int) -> Dict[str, int]:
+        return {"dirs": self.dir_count[node], "files": self.child_count[node] - self.dir_count[node],
+                "total": self.totals[node]}
+
+    # ============= 物化 =============
+    def to_dict(self) -> Dict[str, Any]:
+        """物化为 scan_posts_tree 的原有结构: { "items": [...], "total": N }"""
+        return {"items": self._materialize(ROOT, ""), "total": self.total}
+
+    def _materialize(self, node: int, prefix: str) -> List[Dict[str, Any]]:
+        items = []
+        start = self.child_start[node]
+        for child in range(start, start + self.child_count[node]):
+            name = self.names[child]
+            path = prefix + name
+            if self.kinds[child] == _DIR:
+                items.append({"type": "dir", "name": name, "path": path,
+                              "children": self._materialize(child, path + "/")})
+            else:
+                items.append({"type": "file", "name": name, "path": path})
+        return items
+
+    def list_dir(self, path: str = "", depth: int = 1, limit: int = DEFAULT_PAGE_SIZE,
+                 cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        返回 path 目录下 depth 层的节点，目录带子节点统计
+        子节点分页使用 keyset 游标（上一页最后一个名称），在有序的名称区间内二分定位起点；
+        depth 层以内的子目录各自只返回第一页，更多内容用子目录自己的 next_cursor 继续请求
+        """
+        path = path.strip("/")
+        node = self._dir_ids.get(path)
+        if node is None:
+            raise KeyError(path)
+        items, next_cursor = self._page(node, path, max(1, depth), limit, cursor)
+        return {"path": path, **self.counts(node), "items": items, "next_cursor": next_cursor}
+
+    def _page(self, node: int, path: str, depth: int, limit: int,
+              cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        lo = self.child_start[node]
+        hi = lo + self.child_count[node]
+        start = bisect_right(self.names, cursor, lo, hi) if cursor else lo
+        end = min(start + limit, hi)
+        prefix = path + "/" if path else ""
+        items = []
+        for child in range(start, end):
+            name = self.names[child]
+            child_path = prefix + name
+            if self.kinds[child] != _DIR:
+                items.append({"type": "file", "name": name, "path": child_path})
+                continue
+            item = {"type": "dir", "name": name, "path": child_path, **self.counts(child)}
+            if depth > 1:
+                item["children"], item["next_cursor"] = self._page(child, child_path, depth - 1, limit, None)
+            items.append(item)
+        return items, (self.names[end - 1] if end < hi and end > start else None)
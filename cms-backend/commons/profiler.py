@@ -0,0 +1,336 @@
+# profiler.py
+"""
+按需性能剖析：管理员“布防”后，对指定路由的后 N 个请求或后 N 次部署做剖析
+- cprofile: cProfile 确定性剖析（只覆盖执行接口函数 / 构建任务的线程），保存 .prof 供 snakeviz / pstats 查看
+- sampling: 定时采样目标线程调用栈，保存 collapsed stack（可直接生成火焰图），开销更低
+- 每个阶段（tracing 的子 span）记录墙钟时间与 CPU 时间，判断慢在等待 IO 还是计算
+- 布防配置存放在共享状态中，多 worker 共享剩余次数；未布防时每个请求只做一次本地字典查询
+"""
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # Windows 无法统计子进程 CPU
+    resource = None
+
+from commons.tracing import current_span
+from configs.config import SHARED_STATE, PROFILE_DIR, PROFILE_MAX_FILES
+
+PROFILE_MODES = ("cprofile", "sampling")
+DEPLOY_TARGET = "__deploy__"
+# 本地布防快照刷新间隔（秒），其他 worker 布防后最迟在该时间后生效
+ARMS_REFRESH_INTERVAL = 1.0
+# pstats 摘要中保留的函数数
+TOP_FUNCTIONS = 40
+
+_ARMS_KEY = "profile_arms"
+_arms_snapshot: Dict[str, Dict[str, Any]] = {}
+_arms_checked_at = 0.0
+# install_route_profiling 已包装的路由模板，只有这些路由能被布防
+_PROFILED_ROUTES = set()
+
+
+# ============= 布防管理 =============
+def arm(target: str, count: int, mode: str = "cprofile", interval_ms: float = 5.0) -> Dict[str, Any]:
+    """
+    对 target（路由模板或 DEPLOY_TARGET）布防，接下来 count 次调用会被剖析
+    target 不是已注册（并已包装）的路由时抛 LookupError，避免布防永远不会触发的目标
+    """
+    if target != DEPLOY_TARGET and target not in _PROFILED_ROUTES:
+        raise LookupError(f"路由不存在: {target}")
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"不支持的剖析模式: {mode}，可选 {', '.join(PROFILE_MODES)}")
+    if count <= 0:
+        raise ValueError("count 必须大于 0")
+    config = {"remaining": count, "mode": mode, "interval_ms": max(1.0, float(interval_ms)),
+              "armed_at": datetime.now().isoformat()}
+    with SHARED_STATE.lock(_ARMS_KEY):
+        arms = SHARED_STATE.get(_ARMS_KEY) or {}
+        arms[target] = config
+        SHARED_STATE.set(_ARMS_KEY, arms)
+    _refresh_arms(force=True)
+    return config
+
+
+def disarm(target: Optional[str] = None):
+    """撤防指定目标，不指定则全部撤防"""
+    with SHARED_STATE.lock(_ARMS_KEY):
+        arms = SHARED_STATE.get(_ARMS_KEY) or {}
+        if target is None:
+            arms = {}
+        else:
+            arms.pop(target, None)
+        SHARED_STATE.set(_ARMS_KEY, arms)
+    _refresh_arms(force=True)
+
+
+def get_arms() -> Dict[str, Dict[str, Any]]:
+    return SHARED_STATE.get(_ARMS_KEY) or {}
+
+
+def _refresh_arms(force: bool = False):
+    global _arms_snapshot, _arms_checked_at
+    now = time.monotonic()
+    if force or now - _arms_checked_at >= ARMS_REFRESH_INTERVAL:
+        _arms_checked_at = now
+        _arms_snapshot = get_arms()
+
+
+def _claim(target: str) -> Optional[Dict[str, Any]]:
+    """占用一次剖析名额；未布防时只查本地快照，不访问共享状态"""
+    _refresh_arms()
+    if target not in _arms_snapshot:
+        return None
+    with SHARED_STATE.lock(_ARMS_KEY):
+        arms = SHARED_STATE.get(_ARMS_KEY) or {}
+        config = arms.get(target)
+        if not config:
+            _refresh_arms(force=True)
+            return None
+        config["remaining"] -= 1
+        if config["remaining"] <= 0:
+            arms.pop(target)
+        SHARED_STATE.set(_ARMS_KEY, arms)
+    _refresh_arms(force=True)
+    return config
+
+
+# ============= 采样剖析 =============
+class _StackSampler(threading.Thread):
+    """定时抓取目标线程的调用栈，按 collapsed stack 计数"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+# ============= 剖析会话 =============
+@contextmanager
+def profile_session(target: str, config: Dict[str, Any], **meta):
+    """在当前线程内执行一次剖析，结束后把结果写入 PROFILE_DIR"""
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}"
+    mode = config["mode"]
+    root = current_span()
+    started_ns = time.time_ns()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+
+    profiler = sampler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ 同一时间只允许一个 cProfile，并发剖析时退化为采样
+            profiler = None
+            mode = "sampling"
+    if mode == "sampling":
+        sampler = _StackSampler(threading.get_ident(), config["interval_ms"] / 1000)
+        sampler.start()
+
+    error = None
+    try:
+        yield profile_id
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        result = {
+            "id": profile_id,
+            "target": target,
+            "mode": mode,
+            "created_at": datetime.now().isoformat(),
+            "wall_ms": round((time.perf_counter() - wall_start) * 1000, 3),
+            "cpu_ms": round((time.thread_time() - cpu_start) * 1000, 3),
+            "error": error,
+            "phases": _collect_phases(root, started_ns),
+            **meta,
+        }
+        if children_start:
+            # 构建时 npm / hexo 子进程的 CPU 时间
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            result["children_cpu_ms"] = round(
+                (children.ru_utime + children.ru_stime - children_start.ru_utime - children_start.ru_stime) * 1000, 3)
+        try:
+            _save_profile(result, profiler, sampler)
+        except Exception as e:
+            logger.error(f"保存剖析结果失败: {e}")
+
+
+def _collect_phases(root, started_ns: int) -> List[Dict[str, Any]]:
+    """取剖析期间开始的 span 作为阶段，记录墙钟与 CPU 时间"""
+    if root is None:
+        return []
+    phases = []
+    for s in root.trace.spans:
+        if s.start_ns < started_ns or s is root:
+            continue
+        phases.append({
+            "name": s.name,
+            "depth": s.depth - root.depth,
+            "offset_ms": round((s.start_ns - started_ns) / 1e6, 3),
+            "wall_ms": round(s.duration_ms, 3),
+            "cpu_ms": round(s.cpu_ms, 3),
+            "attributes": s.attributes,
+            "error": s.error,
+        })
+    return phases
+
+
+def _save_profile(result: Dict[str, Any], profiler: Optional[cProfile.Profile], sampler: Optional[_StackSampler]):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, result["id"])
+    if profiler:
+        profiler.dump_stats(base + ".prof")
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        result["top"] = out.getvalue()
+        result["raw_file"] = result["id"] + ".prof"
+    if sampler:
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in sampler.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        result["samples"] = sum(sampler.samples.values())
+        result["top"] = [{"stack": stack.rsplit(";", 3)[-3:], "samples": count}
+                         for stack, count in sampler.samples.most_common(20)]
+        result["raw_file"] = result["id"] + ".collapsed"
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+    logger.info(f"🔬 剖析完成 {result['target']}: {result['wall_ms']}ms（CPU {result['cpu_ms']}ms），结果 {result['id']}")
+    _prune_profiles()
+
+
+def _prune_profiles():
+    metas = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for name in metas[:-PROFILE_MAX_FILES] if len(metas) > PROFILE_MAX_FILES else []:
+        profile_id = name[:-len(".json")]
+        for ext in (".json", ".prof", ".collapsed"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+# ============= 结果查询 =============
+def list_profiles() -> List[Dict[str, Any]]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    items = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        items.append({k: data.get(k) for k in ("id", "target", "mode", "created_at", "wall_ms", "cpu_ms", "error")})
+    return items
+
+
+def _profile_file(profile_id: str, ext: str) -> Optional[str]:
+    # 只允许本目录下的文件名，防止路径穿越
+    if not profile_id or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + ext)
+    return path if os.path.isfile(path) else None
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    path = _profile_file(profile_id, ".json")
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_profile_raw_path(profile_id: str) -> Optional[str]:
+    return _profile_file(profile_id, ".prof") or _profile_file(profile_id, ".collapsed")
+
+
+# ============= 接入点 =============
+def install_route_profiling(app):
+    """
+    包装所有 APIRoute 的 route.dependant.call，布防后对该路由的请求做剖析
+    必须在所有路由注册完成之后调用，之后注册的路由不会被包装
+    """
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not getattr(route.dependant.call, "_profiling_wrapped", False):
+            route.dependant.call = _wrap_endpoint(route.path, route.dependant.call)
+            _PROFILED_ROUTES.add(route.path)
+
+
+def _wrap_endpoint(target: str, call):
+    # FastAPI 按 call 是否为协程函数决定是否放到线程池执行，包装后需保持一致
+    if asyncio.iscoroutinefunction(call):
+        @wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            config = _claim(target)
+            if config is None:
+                return await call(*args, **kwargs)
+            with profile_session(target, config):
+                return await call(*args, **kwargs)
+        wrapper = async_wrapper
+    else:
+        @wraps(call)
+        def sync_wrapper(*args, **kwargs):
+            config = _claim(target)
+            if config is None:
+                return call(*args, **kwargs)
+            with profile_session(target, config):
+                return call(*args, **kwargs)
+        wrapper = sync_wrapper
+    wrapper._profiling_wrapped = True
+    return wrapper
+
+
+@contextmanager
+def maybe_profile_deploy(**meta):
+    """构建任务入口：部署已布防时剖析本次构建"""
+    config = _claim(DEPLOY_TARGET)
+    if config is None:
+        yield None
+        return
+    with profile_session(DEPLOY_TARGET, config, **meta) as profile_id:
+        yield profile_id
@@ -0,0 +1,328 @@
+# searchIndex.py
+"""
+文章全文检索：每个仓库一个 SQLite 倒排索引（标题 + 正文），BM25 排序
+- 分词见 utils/search_utils：中文按 bigram，其他按单词；标题词频按 TITLE_WEIGHT 加权
+- 增量维护：索引记录已索引的 commit，拉取 / 保存后只重建两次 commit 之间变更的文件；
+  首次建立或 diff 失败时按文件 mtime / 大小全量比对，未变化的文件不重新读取
+- 索引文件持久化在 SEARCH_INDEX_DIR，重启后直接使用；多 worker 共用同一文件，写入由共享锁互斥
+- 缓存刷新后在后台线程更新，不阻塞 list / save 等接口
+"""
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Collection, Dict, Iterable, Optional, Set, Tuple
+
+from loguru import logger
+
+from commons.postsTree import PostsTree
+from commons.tracing import span
+from configs.config import SHARED_STATE, SEARCH_ENABLED, SEARCH_INDEX_DIR
+from utils.article_utils import get_posts_dir, split_front_matter, post_title
+from utils.git_utils import changed_files, get_repo_name_from_url
+from utils.search_utils import term_frequencies, query_terms, make_snippet
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 标题中的词按正文词频的几倍计
+TITLE_WEIGHT = 3
+# 每处理多少篇提交一次事务，避免首次建立索引时 WAL 过大
+BATCH_SIZE = 500
+MAX_QUERY_LENGTH = 200
+# 分词方式变化时递增，已有索引会被清空重建
+TOKENIZER_VERSION = "2"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT,
+    length INTEGER NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    terms BLOB
+);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term_id, doc_id)
+) WITHOUT ROWID;
+"""
+
+
+class SearchIndex:
+    def __init__(self, repo_url: str, db_path: str):
+        self.repo_url = repo_url
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+        if self._get_meta("tokenizer") != TOKENIZER_VERSION:
+            self._reset()
+
+    def _reset(self):
+        """清空索引（分词方式已变化），下次 sync 时全量重建"""
+        with SHARED_STATE.lock(f"search:{get_repo_name_from_url(self.repo_url)}"), self._conn() as conn:
+            if self._get_meta("tokenizer") == TOKENIZER_VERSION:
+                return
+            for table in ("postings", "docs", "terms", "meta"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("INSERT INTO meta (key, value) VALUES ('tokenizer', ?)", (TOKENIZER_VERSION,))
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    @property
+    def commit(self) -> Optional[str]:
+        """已索引到的 commit"""
+        return self._get_meta("commit")
+
+    # ============= 增量更新 =============
+    def sync(self, tree: PostsTree, version: Optional[str]) -> Dict[str, int]:
+        """把索引更新到 tree / version 对应的状态，返回新增 / 删除的文档数"""
+        with SHARED_STATE.lock(f"search:{get_repo_name_from_url(self.repo_url)}"), \
+                span("search.sync", repo=self.repo_url) as s:
+            indexed = self.commit
+            if version and indexed == version:
+                return {"indexed": 0, "removed": 0}
+            paths = set(tree.file_paths())
+            changed = changed_files(self.repo_url, indexed, version, "source/_posts") \
+                if indexed and version else None
+            if changed is None:
+                stats = self._reconcile(paths)
+            else:
+                stats = self._apply(changed & paths, changed - paths)
+            self._finish(version)
+            if s is not None:
+                s.set_attribute("indexed", stats["indexed"])
+                s.set_attribute("removed", stats["removed"])
+        if stats["indexed"] or stats["removed"]:
+            logger.info(f"🔎 检索索引已更新 {self.repo_url}: 索引 {stats['indexed']} 篇，移除 {stats['removed']} 篇")
+        return stats
+
+    def _reconcile(self, paths: Set[str]) -> Dict[str, int]:
+        """全量比对：文件 mtime / 大小变化或新增的重新索引，已不存在的移除"""
+        posts_dir = get_posts_dir(self.repo_url)
+        stamps = {row["path"]: (row["mtime_ns"], row["size"])
+                  for row in self._conn().execute("SELECT path, mtime_ns, size FROM docs")}
+        to_index = []
+        for path in paths:
+            try:
+                st = os.stat(os.path.join(posts_dir, path))
+            except OSError:
+                continue
+            if stamps.get(path) != (st.st_mtime_ns, st.st_size):
+                to_index.append(path)
+        return self._apply(to_index, set(stamps) - paths)
+
+    def _apply(self, to_index: Collection[str], to_remove: Iterable[str]) -> Dict[str, int]:
+        conn = self._conn()
+        # 大批量时一次性载入词表；少量变更时按需查询，避免每次保存都读整张词表
+        term_ids = {row["term"]: row["id"] for row in conn.execute("SELECT id, term FROM terms")} \
+            if len(to_index) > BATCH_SIZE else {}
+        posts_dir = get_posts_dir(self.repo_url)
+        removed = indexed = 0
+        try:
+            for path in to_remove:
+                removed += self._remove(conn, path)
+            for i, path in enumerate(to_index, 1):
+                self._remove(conn, path)
+                indexed += self._index(conn, posts_dir, path, term_ids)
+                if i % BATCH_SIZE == 0:
+                    conn.commit()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return {"indexed": indexed, "removed": removed}
+
+    @staticmethod
+    def _remove(conn: sqlite3.Connection, path: str) -> int:
+        row = conn.execute("SELECT id, terms FROM docs WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return 0
+        doc_terms = array("I")
+        doc_terms.frombytes(row["terms"] or b"")
+        conn.executemany("DELETE FROM postings WHERE term_id = ? AND doc_id = ?",
+                         ((term_id, row["id"]) for term_id in doc_terms))
+        conn.execute("DELETE FROM docs WHERE id = ?", (row["id"],))
+        return 1
+
+    @staticmethod
+    def _index(conn: sqlite3.Connection, posts_dir: str, path: str, term_ids: Dict[str, int]) -> int:
+        filepath = os.path.join(posts_dir, path)
+        try:
+            st = os.stat(filepath)
+            with open(filepath, "r", encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            return 0
+        front_matter, body = split_front_matter(content)
+        title = post_title(path, front_matter)
+        freqs = term_frequencies(body)
+        for term, count in term_frequencies(title).items():
+            freqs[term] += count * TITLE_WEIGHT
+
+        doc_terms = array("I")
+        for term in freqs:
+            term_id = term_ids.get(term)
+            if term_id is None:
+                row = conn.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()
+                term_id = row["id"] if row else conn.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+                term_ids[term] = term_id
+            doc_terms.append(term_id)
+        doc_id = conn.execute(
+            "INSERT INTO docs (path, title, length, mtime_ns, size, terms) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, title, sum(freqs.values()), st.st_mtime_ns, st.st_size, doc_terms.tobytes())
+        ).lastrowid
+        conn.executemany("INSERT INTO postings (term_id, doc_id, tf) VALUES (?, ?, ?)",
+                         ((term_id, doc_id, freqs[term]) for term_id, term in zip(doc_terms, freqs)))
+        return 1
+
+    def _finish(self, version: Optional[str]):
+        """更新文档数、平均长度和已索引 commit（BM25 查询时直接读取）"""
+        with self._conn() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("commit", version or ""), ("doc_count", str(count)), ("total_length", str(total)),
+                ("updated_at", str(time.time())),
+            ])
+
+    # ============= 查询 =============
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        BM25 排序；优先返回包含全部查询词的文章，没有时退化为包含任一查询词
+        摘要只对当前页的结果读取文件生成
+        """
+        terms = query_terms(query[:MAX_QUERY_LENGTH])
+        result = {"query": query, "total": 0, "items": [], "indexed_commit": self.commit or None}
+        if not terms:
+            return result
+        conn = self._conn()
+        doc_count = int(self._get_meta("doc_count") or 0)
+        avg_length = int(self._get_meta("total_length") or 0) / doc_count if doc_count else 0
+        if not doc_count:
+            return result
+
+        with span("search.query", terms=len(terms)):
+            scores: Dict[int, float] = {}
+            matched: Dict[int, int] = {}
+            for term in terms:
+                rows = self._postings(conn, term)
+                if not rows:
+                    continue
+                idf = math.log(1 + (doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, (tf, length) in rows.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+
+            all_terms = [d for d, n in matched.items() if n == len(terms)]
+            candidates = all_terms or list(scores)
+            ranked = sorted(candidates, key=lambda d: scores[d], reverse=True)
+            page = ranked[offset:offset + limit]
+
+        result["total"] = len(ranked)
+        result["match"] = "all" if all_terms else "any"
+        posts_dir = get_posts_dir(self.repo_url)
+        for doc_id in page:
+            row = conn.execute("SELECT path, title FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            try:
+                with open(os.path.join(posts_dir, row["path"]), "r", encoding="utf-8") as f:
+                    _, body = split_front_matter(f.read())
+            except OSError:
+                body = ""
+            result["items"].append({
+                "path": row["path"],
+                "title": row["title"],
+                "score": round(scores[doc_id], 4),
+                "snippet": make_snippet(body, terms),
+            })
+        return result
+
+    @staticmethod
+    def _postings(conn: sqlite3.Connection, term: str) -> Dict[int, Tuple[int, int]]:
+        """doc_id -> (词频, 文档长度)；单个汉字按前缀匹配以该字开头的 bigram 和段末单字"""
+        if len(term) == 1 and not term.isascii():
+            where, params = "t.term >= ? AND t.term < ?", (term, chr(ord(term) + 1))
+        else:
+            where, params = "t.term = ?", (term,)
+        postings: Dict[int, Tuple[int, int]] = {}
+        for doc_id, tf, length in conn.execute(
+                "SELECT p.doc_id, p.tf, d.length FROM terms t "
+                f"JOIN postings p ON p.term_id = t.id JOIN docs d ON d.id = p.doc_id WHERE {where}", params):
+            previous = postings.get(doc_id)
+            postings[doc_id] = (tf + previous[0], length) if previous else (tf, length)
+        return postings
+
+    def status(self) -> Dict[str, Any]:
+        updated_at = self._get_meta("updated_at")
+        return {
+            "commit": self.commit or None,
+            "doc_count": int(self._get_meta("doc_count") or 0),
+            "updated_at": float(updated_at) if updated_at else None,
+        }
+
+
+# ============= 索引管理（每个仓库一个索引） =============
+class SearchIndexManager:
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._indexes: Dict[str, SearchIndex] = {}
+        self._lock = threading.Lock()
+        # 后台更新串行执行；同一仓库排队期间只保留最新的版本
+        self._pending: Dict[str, Tuple[PostsTree, Optional[str]]] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def get(self, repo_url: str) -> SearchIndex:
+        with self._lock:
+            index = self._indexes.get(repo_url)
+            if index is None:
+                db_path = os.path.join(self.index_dir, f"{get_repo_name_from_url(repo_url)}.db")
+                index = self._indexes[repo_url] = SearchIndex(repo_url, db_path)
+            return index
+
+    def schedule(self, repo_url: str, tree: PostsTree, version: Optional[str]):
+        """缓存刷新后调用：在后台把索引更新到新版本"""
+        with self._lock:
+            queued = repo_url in self._pending
+            self._pending[repo_url] = (tree, version)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, daemon=True, name="search-index")
+                self._worker.start()
+        if not queued:
+            self._queue.put(repo_url)
+
+    def _loop(self):
+        while True:
+            repo_url = self._queue.get()
+            with self._lock:
+                tree, version = self._pending.pop(repo_url)
+            try:
+                self.get(repo_url).sync(tree, version)
+            except Exception as e:
+                logger.error(f"更新检索索引失败 {repo_url}: {e}")
+
+
+SEARCH_INDEXES = SearchIndexManager(SEARCH_INDEX_DIR) if SEARCH_ENABLED else None
@@ -0,0 +1,277 @@
+# sharedState.py
+"""
+跨进程共享状态：多 uvicorn worker 部署时共享 current_repo、封禁计数、选主租约和文件锁
+- MemorySharedState: 单进程（默认），也可作为测试替身
+- SqliteSharedState: 多 worker，同机多进程共享（SQLite WAL + 文件锁）
+"""
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅支持单进程内加锁
+    fcntl = None
+
+def process_id() -> str:
+    """当前进程标识，用于租约归属（每次调用时计算，fork 出的子进程不会沿用父进程的值）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ISharedState(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续期租约（选主），其他 owner 持有且未过期时返回 False"""
+        pass
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str):
+        pass
+
+    @abstractmethod
+    def lock(self, name: str):
+        """跨进程互斥锁（上下文管理器），同一线程可重入"""
+        pass
+
+
+class _ReentrantNamedLocks:
+    """按名称区分的可重入锁；outer_acquire / outer_release 在最外层加解锁时调用"""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.RLock] = {}
+        self._depth = threading.local()
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, name: str, outer_acquire=None, outer_release=None):
+        with self._guard:
+            rlock = self._locks.setdefault(name, threading.RLock())
+        with rlock:
+            depths = self._depth.__dict__.setdefault("depths", {})
+            depths[name] = depths.get(name, 0) + 1
+            handle = None
+            try:
+                if depths[name] == 1 and outer_acquire:
+                    handle = outer_acquire()
+                yield
+            finally:
+                depths[name] -= 1
+                if depths[name] == 0:
+                    depths.pop(name)
+                    if handle is not None and outer_release:
+                        outer_release(handle)
+
+
+# ============= 单进程实现 =============
+class MemorySharedState(ISharedState):
+    def __init__(self):
+        self._store: Dict[str, tuple] = {}
+        self._leases: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._named_locks = _ReentrantNamedLocks()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._store.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                self._store.pop(key, None)
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._store[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._store.pop(key, None)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] == owner:
+                self._leases.pop(name, None)
+
+    def lock(self, name: str):
+        return self._named_locks.hold(name)
+
+
+# ============= 同机多进程实现 =============
+class SqliteSharedState(ISharedState):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS kv (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = str(data_dir)
+        self.db_path = os.path.join(self.data_dir, "shared_state.db")
+        self.lock_dir = os.path.join(self.data_dir, "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._local = threading.local()
+        self._named_locks = _ReentrantNamedLocks()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None)
+            )
+
+    def delete(self, key: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._conn() as conn:
+            # 单条语句完成“无人持有 / 已过期 / 自己持有”时的抢占或续期，由 SQLite 写锁保证原子性
+            conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl, now)
+            )
+            row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return bool(row and row[0] == owner)
+
+    def release_lease(self, name: str, owner: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def _flock(self, name: str):
+        path = os.path.join(self.lock_dir, hashlib.sha1(name.encode("utf-8")).hexdigest() + ".lock")
+        f = open(path, "a+")
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    @staticmethod
+    def _funlock(f):
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def lock(self, name: str):
+        # 进程内先用可重入锁串行化线程，最外层再加文件锁与其他进程互斥
+        return self._named_locks.hold(name, lambda: self._flock(name), self._funlock)
+
+
+def create_shared_state(backend: str, data_dir: str) -> ISharedState:
+    if backend == "sqlite":
+        return SqliteSharedState(data_dir)
+    if backend == "memory":
+        return MemorySharedState()
+    raise ValueError(f"未知的共享状态后端: {backend}")
+
+
+# ============= 共享的 current_repo =============
+class SharedRepoConfig(MutableMapping):
+    """
+    与原 current_repo 字典用法一致（current_repo["url"] = ...），数据存放在共享状态中，
+    任一 worker 调用 /api/setup 后其他 worker 立即可见
+    """
+    KEY = "current_repo"
+    DEFAULTS_KEY = "current_repo_defaults"
+
+    def __init__(self, state: ISharedState, defaults: Dict[str, Any]):
+        self._state = state
+        # 共享状态可能跨重启保留；环境变量中的默认仓库变化时以新配置为准
+        with self._state.lock(self.KEY):
+            if self._state.get(self.KEY) is None or self._state.get(self.DEFAULTS_KEY) != defaults:
+                self._state.set(self.KEY, dict(defaults))
+                self._state.set(self.DEFAULTS_KEY, dict(defaults))
+
+    def _load(self) -> Dict[str, Any]:
+        return self._state.get(self.KEY) or {}
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        with self._state.lock(self.KEY):
+            data = self._load()
+            data[key] = value
+            self._state.set(self.KEY, data)
+
+    def __delitem__(self, key):
+        with self._state.lock(self.KEY):
+            data = self._load()
+            del data[key]
+            self._state.set(self.KEY, data)
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def update(self, *args, **kwargs):
+        """一次性写入多个字段"""
+        with self._state.lock(self.KEY):
+            data = self._load()
+            data.update(*args, **kwargs)
+            self._state.set(self.KEY, data)
+
+    def __repr__(self):
+        return repr(self._load())
@@ -1,9 +1,15 @@
 # storage.py
 from abc import ABC, abstractmethod
-from datetime import datetime
-from threading import Lock
+from datetime import datetime, timedelta
 from typing import Optional, Tuple
 
+from commons.ttlCache import ShardedTTLCache
+
+# 失败记录在最后一次失败后保留的时长（秒），过期自动清除
+DEFAULT_FAILURE_TTL = 3600
+# 达到永久封禁阈值的记录保留时长（秒）
+DEFAULT_PERM_BAN_TTL = 30 * 24 * 3600
+
 class IFailedAuthStorage(ABC):
     @abstractmethod
     def get_failed_attempts(self, ip: str) -> Tuple[int, Optional[datetime]]:
@@ -17,53 +23,219 @@ class IFailedAuthStorage(ABC):
     def clear_failed_attempts(self, ip: str):
         pass
 
-# 内存存储
+    def record_failed_attempt(self, ip: str, temp_threshold: int, perm_threshold: int,
+                              ban_duration: timedelta) -> Tuple[int, Optional[datetime]]:
+        """
+        记录一次失败并判断是否封禁，返回 (失败次数, 解封时间)
+        默认实现为读-改-写，子类可覆盖为原子操作
+        """
+        count, unban_time = _next_failure_state(self.get_failed_attempts(ip), temp_threshold,
+                                                perm_threshold, ban_duration)
+        self.set_failed_attempts(ip, count, unban_time)
+        return count, unban_time
+
+
+def _next_failure_state(current: Tuple[int, Optional[datetime]], temp_threshold: int, perm_threshold: int,
+                        ban_duration: timedelta) -> Tuple[int, Optional[datetime]]:
+    now = datetime.now()
+    failed_count, unban_time = current
+
+    # 如果之前被封但已过期，重置计数
+    if unban_time and now >= unban_time:
+        failed_count = 0
+        unban_time = None
+
+    failed_count += 1
+
+    # 达到临时封禁阈值，且未永久封禁
+    if temp_threshold <= failed_count < perm_threshold:
+        unban_time = now + ban_duration
+    return failed_count, unban_time
+
+# 内存存储（分片 + TTL/LRU 淘汰，内存有上限）
 
 class MemoryStorage(IFailedAuthStorage):
-    def __init__(self):
-        self._store: dict[str, tuple[int, datetime | None]] = {}
-        self._lock = Lock()
+    def __init__(self, max_entries: int = 100_000, failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 perm_ban_ttl: float = DEFAULT_PERM_BAN_TTL, perm_threshold: int = 50):
+        self._store = ShardedTTLCache(max_entries=max_entries)
+        self.failure_ttl = failure_ttl
+        self.perm_ban_ttl = perm_ban_ttl
+        self.perm_threshold = perm_threshold
+
+    def _ttl(self, count: int, unban_time: Optional[datetime]) -> float:
+        """失败记录至少保留 failure_ttl，封禁中保留到解封，达到永久封禁阈值保留 perm_ban_ttl"""
+        if count >= self.perm_threshold:
+            return self.perm_ban_ttl
+        ttl = self.failure_ttl
+        if unban_time:
+            ttl = max(ttl, (unban_time - datetime.now()).total_seconds())
+        return ttl
+
+    def get_failed_attempts(self, ip: str) -> Tuple[int, Optional[datetime]]:
+        return self._store.get(ip, (0, None))
+
+    def set_failed_attempts(self, ip: str, count: int, unban_time: Optional[datetime] = None):
+        self._store.set(ip, (count, unban_time), ttl=self._ttl(count, unban_time))
+
+    def clear_failed_attempts(self, ip: str):
+        self._store.pop(ip)
+
+    def record_failed_attempt(self, ip: str, temp_threshold: int, perm_threshold: int,
+                              ban_duration: timedelta) -> Tuple[int, Optional[datetime]]:
+        """在分片锁内一次完成读-改-写"""
+        def apply(current):
+            state = _next_failure_state(current or (0, None), temp_threshold, perm_threshold, ban_duration)
+            return state, self._ttl(*state)
+
+        return self._store.update(ip, apply)
+
+
+# 共享状态存储（多 worker 共享封禁计数）
+
+class SharedStateStorage(IFailedAuthStorage):
+    def __init__(self, state, prefix: str = "auth_fail:", failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 perm_ban_ttl: float = DEFAULT_PERM_BAN_TTL, perm_threshold: int = 50):
+        self.state = state
+        self.prefix = prefix
+        self.failure_ttl = failure_ttl
+        self.perm_ban_ttl = perm_ban_ttl
+        self.perm_threshold = perm_threshold
+
+    def _key(self, ip: str) -> str:
+        return f"{self.prefix}{ip}"
+
+    def get_failed_attempts(self, ip: str) -> Tuple[int, Optional[datetime]]:
+        obj = self.state.get(self._key(ip))
+        if not obj:
+            return 0, None
+        unban_time = datetime.fromisoformat(obj["unban_time"]) if obj.get("unban_time") else None
+        return obj["count"], unban_time
+
+    def set_failed_attempts(self, ip: str, count: int, unban_time: Optional[datetime] = None):
+        if count >= self.perm_threshold:
+            ttl = self.perm_ban_ttl
+        else:
+            ttl = max(self.failure_ttl, (unban_time - datetime.now()).total_seconds() if unban_time else 0)
+        self.state.set(self._key(ip), {
+            "count": count,
+            "unban_time": unban_time.isoformat() if unban_time else None
+        }, ttl=ttl)
+
+    def clear_failed_attempts(self, ip: str):
+        self.state.delete(self._key(ip))
+
+    def record_failed_attempt(self, ip: str, temp_threshold: int, perm_threshold: int,
+                              ban_duration: timedelta) -> Tuple[int, Optional[datetime]]:
+        # 跨进程加锁，避免多个 worker 并发读-改-写丢失计数
+        with self.state.lock(self._key(ip)):
+            return super().record_failed_attempt(ip, temp_threshold, perm_threshold, ban_duration)
+
+
+
+# Redis 存储（多 worker / 多节点共享，需要 pip install redis）
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class RedisStorage(IFailedAuthStorage):
+    """
+    - 失败次数：{prefix}{ip}，整数，随每次失败刷新过期时间
+    - 封禁标记：{ban_prefix}{ip}，由 Redis 原生过期控制解封，不再存储 unban_time
+    - 计数 + 封禁判断在一个 Lua 脚本中原子完成，一次往返
+    - 连接池复用连接
+    """
+
+    # KEYS: 计数键, 封禁键
+    # ARGV: 临时封禁阈值, 永久封禁阈值, 封禁时长(ms), 失败记录保留时长(ms), 永久封禁保留时长(ms)
+    # 返回: {失败次数, 封禁剩余毫秒（未封禁为 -1）}
+    RECORD_SCRIPT = """
+    local temp = tonumber(ARGV[1])
+    local perm = tonumber(ARGV[2])
+    local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local ban_ttl = redis.call('PTTL', KEYS[2])
+    -- 之前被封但已过期（达到临时封禁阈值时一定会写封禁键），重置计数
+    if ban_ttl < 0 and count >= temp and count < perm then
+        count = 0
+    end
+    count = count + 1
+    local keep = tonumber(ARGV[4])
+    if count >= temp and count < perm then
+        ban_ttl = tonumber(ARGV[3])
+        redis.call('SET', KEYS[2], '1', 'PX', ban_ttl)
+        keep = math.max(keep, ban_ttl)
+    elseif count >= perm then
+        keep = tonumber(ARGV[5])
+    end
+    redis.call('SET', KEYS[1], count, 'PX', keep)
+    return {count, ban_ttl}
+    """
+
+    def __init__(self, redis_url: str = "redis://localhost:6379/0", prefix: str = "auth_fail:",
+                 ban_prefix: str = "auth_ban:", failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 perm_ban_ttl: float = DEFAULT_PERM_BAN_TTL, perm_threshold: int = 50,
+                 max_connections: int = 50, socket_timeout: float = 1.0, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("使用 RedisStorage 需要先安装 redis：pip install redis")
+            pool = redis.ConnectionPool.from_url(
+                redis_url, max_connections=max_connections, socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_timeout, decode_responses=True
+            )
+            client = redis.Redis(connection_pool=pool)
+        # 也可传入已有客户端（如兼容 Redis 协议的替身），需 decode_responses=True
+        self.client = client
+        self.prefix = prefix
+        self.ban_prefix = ban_prefix
+        self.failure_ttl = failure_ttl
+        self.perm_ban_ttl = perm_ban_ttl
+        self.perm_threshold = perm_threshold
+        self._record = self.client.register_script(self.RECORD_SCRIPT)
+
+    def _key(self, ip: str) -> str:
+        return f"{self.prefix}{ip}"
+
+    def _ban_key(self, ip: str) -> str:
+        return f"{self.ban_prefix}{ip}"
+
+    @staticmethod
+    def _unban_time(ban_ttl_ms) -> Optional[datetime]:
+        if ban_ttl_ms is None or int(ban_ttl_ms) < 0:
+            return None
+        return datetime.now() + timedelta(milliseconds=int(ban_ttl_ms))
 
     def get_failed_attempts(self, ip: str) -> Tuple[int, Optional[datetime]]:
-        with self._lock:
-            return self._store.get(ip, (0, None))
+        # 一次往返同时取计数和封禁剩余时间
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self._key(ip))
+        pipe.pttl(self._ban_key(ip))
+        count, ban_ttl = pipe.execute()
+        return int(count or 0), self._unban_time(ban_ttl)
 
     def set_failed_attempts(self, ip: str, count: int, unban_time: Optional[datetime] = None):
-        with self._lock:
-            self._store[ip] = (count, unban_time)
+        ban_ms = int((unban_time - datetime.now()).total_seconds() * 1000) if unban_time else 0
+        if count >= self.perm_threshold:
+            keep_ms = int(self.perm_ban_ttl * 1000)
+        else:
+            keep_ms = max(int(self.failure_ttl * 1000), ban_ms)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._key(ip), count, px=keep_ms)
+        if ban_ms > 0:
+            pipe.set(self._ban_key(ip), "1", px=ban_ms)
+        else:
+            pipe.delete(self._ban_key(ip))
+        pipe.execute()
 
     def clear_failed_attempts(self, ip: str):
-        with self._lock:
-            self._store.pop(ip, None)
-
-
-
-
-# import redis
-# import json
-#
-# class RedisStorage(IFailedAuthStorage):
-#     def __init__(self, redis_url="redis://localhost:6379/0"):
-#         self.client = redis.from_url(redis_url, decode_responses=True)
-#         self.prefix = "auth_fail:"
-#
-#     def _key(self, ip: str) -> str:
-#         return f"{self.prefix}{ip}"
-#
-#     def get_failed_attempts(self, ip: str) -> Tuple[int, Optional[datetime]]:
-#         data = self.client.get(self._key(ip))
-#         if not data:
-#             return 0, None
-#         obj = json.loads(data)
-#         unban_time = datetime.fromisoformat(obj["unban_time"]) if obj.get("unban_time") else None
-#         return obj["count"], unban_time
-#
-#     def set_failed_attempts(self, ip: str, count: int, unban_time: Optional[datetime] = None):
-#         data = {
-#             "count": count,
-#             "unban_time": unban_time.isoformat() if unban_time else None
-#         }
-#         self.client.set(self._key(ip), json.dumps(data))
-#
-#     def clear_failed_attempts(self, ip: str):
-#         self.client.delete(self._key(ip))
\ No newline at end of file
+        self.client.delete(self._key(ip), self._ban_key(ip))
+
+    def record_failed_attempt(self, ip: str, temp_threshold: int, perm_threshold: int,
+                              ban_duration: timedelta) -> Tuple[int, Optional[datetime]]:
+        count, ban_ttl = self._record(
+            keys=[self._key(ip), self._ban_key(ip)],
+            args=[temp_threshold, perm_threshold, int(ban_duration.total_seconds() * 1000),
+                  int(self.failure_ttl * 1000), int(self.perm_ban_ttl * 1000)]
+        )
+        return int(count), self._unban_time(ban_ttl)
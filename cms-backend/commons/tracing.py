@@ -0,0 +1,261 @@
+# tracing.py
+"""
+轻量链路追踪：请求 → git → 扫描 → 解析 → 构建子进程
+- 当前 span 保存在 contextvars 中，FastAPI 同步接口所在线程会继承请求上下文
+- 每个 trace 先在内存中收集全部 span，根 span 结束时决定是否导出：
+  命中采样（TRACE_SAMPLE_RATE）或耗时超过 TRACE_SLOW_MS 的 trace 都会导出，慢 trace 额外打印耗时分解
+- 导出到本地 JSONL 文件，可选同时推送到 OTLP/HTTP（JSON）端点；导出在后台线程进行，不阻塞请求
+- 关闭（TRACING_ENABLED=0）时装饰器原样返回函数，span() 返回空上下文
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from configs.config import TRACING_ENABLED, TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_FILE, TRACE_FILE_MAX_MB, \
+    TRACE_OTLP_ENDPOINT
+
+SERVICE_NAME = "hexo-headless-cms"
+# 单个 trace 最多记录的 span 数，防止循环里的埋点撑爆内存
+MAX_SPANS_PER_TRACE = 2000
+# 导出队列长度，满了直接丢弃
+EXPORT_QUEUE_SIZE = 1000
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error", "depth",
+                 "cpu_start_ns", "cpu_ns")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        # 本线程 CPU 时间（span 在同一线程内开始和结束）
+        self.cpu_start_ns = time.thread_time_ns()
+        self.cpu_ns: Optional[int] = None
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        self.cpu_ns = time.thread_time_ns() - self.cpu_start_ns
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    @property
+    def cpu_ms(self) -> float:
+        cpu = self.cpu_ns if self.cpu_ns is not None else time.thread_time_ns() - self.cpu_start_ns
+        return cpu / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "cpu_ms": round(self.cpu_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("cms_current_span", default=None)
+
+
+# ============= 埋点接口 =============
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """开启一个新 trace 的根 span（请求中间件、后台构建任务使用）"""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    trace.spans.append(root)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(token)
+        _finish_trace(root)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """在当前 trace 下开启子 span；不在 trace 中时什么也不做"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    trace = parent.trace
+    if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+        trace.dropped += 1
+        yield None
+        return
+    child = Span(trace, name, parent, attributes)
+    trace.spans.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    """函数级埋点装饰器；关闭追踪时原样返回函数"""
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ============= 导出 =============
+def format_breakdown(root: Span) -> str:
+    """按调用层级输出每个 span 的耗时，便于一眼看出慢在哪里"""
+    lines = [f"trace {root.trace.trace_id} {root.name} {root.duration_ms:.1f}ms"]
+    for s in sorted(root.trace.spans[1:], key=lambda x: x.start_ns):
+        offset = (s.start_ns - root.start_ns) / 1e6
+        attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+        mark = " ❌" if s.error else ""
+        lines.append(f"{'  ' * s.depth}+{offset:.1f}ms {s.name} {s.duration_ms:.1f}ms {attrs}{mark}".rstrip())
+    if root.trace.dropped:
+        lines.append(f"  ... 另有 {root.trace.dropped} 个 span 未记录")
+    return "\n".join(lines)
+
+
+def _finish_trace(root: Span):
+    slow = root.duration_ms >= TRACE_SLOW_MS
+    if slow:
+        logger.warning(f"🐢 慢请求耗时分解:\n{format_breakdown(root)}")
+    if slow or random.random() < TRACE_SAMPLE_RATE:
+        try:
+            _EXPORT_QUEUE.put_nowait(root.trace)
+        except queue.Full:
+            pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            item = {
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 2 if s.parent_id is None else 1,  # SERVER / INTERNAL
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                item["parentSpanId"] = s.parent_id
+            spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "cms.tracing"}, "spans": spans}],
+    }]}
+
+
+def _write_jsonl(traces: List[Trace]):
+    os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+    # 超过大小上限时轮转为 .1，只保留一份历史
+    if TRACE_FILE_MAX_MB and os.path.exists(TRACE_FILE) and \
+            os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_MB * 1024 * 1024:
+        os.replace(TRACE_FILE, TRACE_FILE + ".1")
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        for trace in traces:
+            for s in trace.spans:
+                f.write(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _post_otlp(traces: List[Trace]):
+    body = json.dumps(_to_otlp(traces), default=str).encode("utf-8")
+    req = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        resp.read()
+
+
+def _export_loop():
+    while True:
+        batch = [_EXPORT_QUEUE.get()]
+        # 攒一小批再写，减少文件打开和网络请求次数
+        while len(batch) < 100:
+            try:
+                batch.append(_EXPORT_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_jsonl(batch)
+        except Exception as e:
+            logger.error(f"写入 trace 文件失败: {e}")
+        if TRACE_OTLP_ENDPOINT:
+            try:
+                _post_otlp(batch)
+            except Exception as e:
+                logger.error(f"推送 OTLP 失败: {e}")
+
+
+_EXPORT_QUEUE: "queue.Queue[Trace]" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+if TRACING_ENABLED:
+    threading.Thread(target=_export_loop, daemon=True, name="trace-export").start()
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+
+class _Shard:
+    __slots__ = ("lock", "items")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+
+# ============= 分片 TTL + LRU 缓存 =============
+class ShardedTTLCache:
+    """
+    - 按 key 哈希分片，每个分片独立加锁，并发请求之间几乎不互相阻塞
+    - 所有操作 O(1)
+    - 条目到期自动失效；容量满时淘汰最久未使用的条目，内存有上限
+    """
+
+    def __init__(self, max_entries: int = 100_000, default_ttl: Optional[float] = None, shards: int = 16):
+        self._shards: List[_Shard] = [_Shard() for _ in range(shards)]
+        self._max_per_shard = max(1, max_entries // shards)
+        self.default_ttl = default_ttl
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        shard = self._shard(key)
+        with shard.lock:
+            item = shard.items.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del shard.items[key]
+                return default
+            shard.items.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        shard = self._shard(key)
+        with shard.lock:
+            shard.items[key] = (value, expires_at)
+            shard.items.move_to_end(key)
+            while len(shard.items) > self._max_per_shard:
+                shard.items.popitem(last=False)
+
+    def update(self, key: Hashable, fn: Callable[[Any], Tuple[Any, Optional[float]]]) -> Any:
+        """
+        在分片锁内原子地读-改-写：fn(旧值或 None) -> (新值, ttl)，返回新值
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            item = shard.items.get(key)
+            old = None
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                old = item[0]
+            value, ttl = fn(old)
+            ttl = ttl if ttl is not None else self.default_ttl
+            shard.items[key] = (value, time.monotonic() + ttl if ttl else None)
+            shard.items.move_to_end(key)
+            while len(shard.items) > self._max_per_shard:
+                shard.items.popitem(last=False)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        shard = self._shard(key)
+        with shard.lock:
+            item = shard.items.pop(key, None)
+        return item[0] if item else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return sum(len(s.items) for s in self._shards)
+
+
+_MISSING = object()
@@ -1,30 +1,129 @@
 # config.py
 import os
 from pathlib import Path
-from commons.storage import MemoryStorage
+from commons.storage import MemoryStorage, SharedStateStorage, RedisStorage
+from commons.sharedState import create_shared_state, SharedRepoConfig
 
 # ========== 开发用内存 ==========
-AUTH_STORAGE = MemoryStorage()
+# 失败记录在内存中按 TTL 过期、超过上限按 LRU 淘汰，避免大量伪造 IP 撑爆内存
+AUTH_MAX_TRACKED_IPS = int(os.getenv("AUTH_MAX_TRACKED_IPS", "100000"))  # 最多跟踪的 IP 数
+AUTH_FAILURE_TTL = int(os.getenv("AUTH_FAILURE_TTL", "3600"))  # 最后一次失败后记录保留时长（秒）
+AUTH_STORAGE = MemoryStorage(max_entries=AUTH_MAX_TRACKED_IPS, failure_ttl=AUTH_FAILURE_TTL)
 
-# ========== 生产用 Redis（取消注释即可切换） ==========
-# AUTH_STORAGE = RedisStorage("redis://localhost:6379/0")
 
 
 # 项目根目录 (cmsBackend/)
 BASE_DIR = Path(__file__).parent.parent.resolve()
 # 所有仓库的根目录
-REPOS_BASE_DIR = BASE_DIR /"repos"
+REPOS_BASE_DIR = Path(os.getenv("REPOS_BASE_DIR", str(BASE_DIR / "repos")))  # 可通过环境变量指定（基准测试等使用独立目录）
+# CMS 自身的数据目录（构建缓存等），放在仓库根目录下以便随挂载卷持久化
+CMS_DATA_DIR = REPOS_BASE_DIR / ".cms"
 
 # 固定 Token
 SECRET_TOKEN = os.getenv("ACCESS_TOKEN", "自定义token")  # 从环境变量读取,默认为"token"
 
 
-# 全局变量（生产环境建议替换为数据库） hexo的git仓库地址和
-current_repo = {
+# ========== 多 worker 共享状态 ==========
+# uvicorn worker 数（uvicorn 命令行也会读取 UVICORN_WORKERS）
+UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", "1"))
+# memory: 单进程；sqlite: 同机多 worker 共享（SQLite + 文件锁）。未指定时按 worker 数自动选择
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND") or ("sqlite" if UVICORN_WORKERS > 1 else "memory")
+SHARED_STATE = create_shared_state(SHARED_STATE_BACKEND, str(CMS_DATA_DIR))
+
+# 多 worker 时封禁计数也放到共享状态中
+if SHARED_STATE_BACKEND != "memory":
+    AUTH_STORAGE = SharedStateStorage(SHARED_STATE, failure_ttl=AUTH_FAILURE_TTL)
+
+# ========== 生产用 Redis（配置 REDIS_URL 即切换，多 worker / 多节点共享封禁计数） ==========
+REDIS_URL = os.getenv("REDIS_URL", "")  # 如 redis://localhost:6379/0，需要 pip install redis
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))  # 连接池上限
+if REDIS_URL:
+    AUTH_STORAGE = RedisStorage(REDIS_URL, failure_ttl=AUTH_FAILURE_TTL, max_connections=REDIS_MAX_CONNECTIONS)
+
+# 全局变量（存放在共享状态中，多 worker 可见） hexo的git仓库地址和
+current_repo = SharedRepoConfig(SHARED_STATE, {
     "url": os.getenv("HEXO_GIT_REPO", "git@gitee.com:xxx-hexo.git"),# 从环境变量读取,hexo的git地址
     "branch": os.getenv("HEXO_GIT_BRANCH", "master"),# 从环境变量读取,hexo的git 分支 一般为master或者main
     "path": None #后续自动初始化
-}
+})
+
+# ========== Hexo 构建进程限制 ==========
+HEXO_STEP_TIMEOUT = int(os.getenv("HEXO_STEP_TIMEOUT", "300"))  # 单个构建步骤超时（秒）
+HEXO_TOTAL_TIMEOUT = int(os.getenv("HEXO_TOTAL_TIMEOUT", "900"))  # 整个构建流程超时（秒）
+HEXO_NICE = int(os.getenv("HEXO_NICE", "10"))  # node 进程的 nice 值，0 为不调整（仅 Linux/macOS）
+HEXO_MAX_MEMORY_MB = int(os.getenv("HEXO_MAX_MEMORY_MB", "0"))  # node 堆内存上限（--max-old-space-size），0 为不限制
+HEXO_RLIMIT_AS_MB = int(os.getenv("HEXO_RLIMIT_AS_MB", "0"))  # 虚拟内存硬上限（RLIMIT_AS），0 为不限制
+HEXO_MAX_CPU_SECONDS = int(os.getenv("HEXO_MAX_CPU_SECONDS", "0"))  # 单个进程 CPU 时间上限（RLIMIT_CPU），0 为不限制
+
+# ========== Hexo 构建线程池 ==========
+BUILD_MAX_WORKERS = int(os.getenv("BUILD_MAX_WORKERS", "2"))  # 同时运行的构建数上限，不同仓库并发，同仓库串行
+
+# ========== 原子发布 ==========
+HEXO_ATOMIC_PUBLISH = os.getenv("HEXO_ATOMIC_PUBLISH", "1") == "1"  # 生成到版本目录后切换 public 链接
+HEXO_KEEP_RELEASES = int(os.getenv("HEXO_KEEP_RELEASES", "5"))  # 保留的历史版本数（用于回滚）
+
+# ========== 静态资源预压缩 ==========
+PRECOMPRESS_ENABLED = os.getenv("PRECOMPRESS_ENABLED", "0") == "1"  # 生成 .gz/.br 供 nginx gzip_static/brotli_static 使用
+PRECOMPRESS_WORKERS = int(os.getenv("PRECOMPRESS_WORKERS", "0"))  # 压缩进程数，0 为 CPU 核数
+
+# ========== 图片优化（可选，需要 pip install Pillow） ==========
+IMAGE_OPTIMIZE_ENABLED = os.getenv("IMAGE_OPTIMIZE_ENABLED", "0") == "1"  # 与 hexo generate 并行生成 WebP / 响应式图片
+IMAGE_WIDTHS = [int(w) for w in os.getenv("IMAGE_WIDTHS", "640,1280").split(",") if w.strip()]  # 响应式宽度
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))  # WebP 质量
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0"))  # 图片处理进程数，0 为 CPU 核数
+IMAGE_REWRITE_HTML = os.getenv("IMAGE_REWRITE_HTML", "1") == "1"  # 把 HTML 中的 <img> 包成带 WebP srcset 的 <picture>
+
+# ========== 部署任务存储（SQLite） ==========
+DEPLOY_DB_PATH = os.getenv("DEPLOY_DB_PATH", str(CMS_DATA_DIR / "deploy_tasks.db"))
+DEPLOY_TASK_TTL = int(os.getenv("DEPLOY_TASK_TTL", str(7 * 24 * 3600)))  # 任务历史保留时长（秒）
+DEPLOY_TASK_MAX_COUNT = int(os.getenv("DEPLOY_TASK_MAX_COUNT", "500"))  # 最多保留的任务数
+
+# ========== 监控指标 ==========
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"  # 关闭后 /metrics 返回 404，埋点几乎零开销
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # 抓取 /metrics 需要 Authorization: Bearer <METRICS_TOKEN>，为空时使用 ACCESS_TOKEN
+
+# ========== 链路追踪 ==========
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))  # 正常请求的采样比例（0~1）
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))  # 超过该耗时的请求总是导出并打印耗时分解
+TRACE_FILE = os.getenv("TRACE_FILE", str(CMS_DATA_DIR / "traces" / "traces.jsonl"))  # 本地 JSONL 导出文件
+TRACE_FILE_MAX_MB = int(os.getenv("TRACE_FILE_MAX_MB", "50"))  # 超过后轮转为 .1
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")  # 如 http://otel-collector:4318/v1/traces，为空不推送
+
+# ========== 按需性能剖析 ==========
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(CMS_DATA_DIR / "profiles"))  # 剖析结果目录
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))  # 最多保留的剖析结果数
+
+# ========== 全文检索 ==========
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "1") == "1"  # 关闭后不维护索引，/api/search 返回 404
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", str(CMS_DATA_DIR / "search"))  # 每个仓库一个 SQLite 索引文件
+
+# ========== 资源上传 ==========
+ASSET_MAX_MB = int(os.getenv("ASSET_MAX_MB", "20"))  # 单个文件大小上限
+ASSET_ALLOWED_EXTS = {e.strip().lower() for e in os.getenv(
+    "ASSET_ALLOWED_EXTS", ".png,.jpg,.jpeg,.gif,.webp,.avif,.svg,.ico,.bmp,.pdf,.mp4,.webm,.mp3").split(",") if e.strip()}
+ASSET_UPLOAD_TMP_DIR = os.getenv("ASSET_UPLOAD_TMP_DIR", str(CMS_DATA_DIR / "uploads"))  # 需与仓库在同一文件系统
+
+# ========== Markdown 预览（可选，需要 pip install markdown-it-py 或 markdown） ==========
+PREVIEW_CACHE_ENTRIES = int(os.getenv("PREVIEW_CACHE_ENTRIES", "20000"))  # 按内容哈希缓存的渲染块数（LRU）
+PREVIEW_MAX_KB = int(os.getenv("PREVIEW_MAX_KB", "2048"))  # 单次预览的正文大小上限
+
+# ========== 常驻 Hexo 进程（增量生成） ==========
+HEXO_WORKER_ENABLED = os.getenv("HEXO_WORKER_ENABLED", "0") == "1"  # 部署时由常驻进程增量生成，跳过 npm install / clean
+HEXO_WORKER_MAX_RSS_MB = int(os.getenv("HEXO_WORKER_MAX_RSS_MB", "1024"))  # 常驻内存超过后重启进程，0 为不限制
+HEXO_WORKER_IDLE_SECONDS = int(os.getenv("HEXO_WORKER_IDLE_SECONDS", "3600"))  # 空闲超过该时长退出，0 为一直保留
+HEXO_WORKER_HEALTH_INTERVAL = int(os.getenv("HEXO_WORKER_HEALTH_INTERVAL", "30"))  # 健康检查间隔（秒）
+HEXO_WORKER_MAX_RESTARTS = int(os.getenv("HEXO_WORKER_MAX_RESTARTS", "3"))  # 连续崩溃重启次数上限，超过后等下次完整构建再启动
+
+# ========== 自动部署 ==========
+AUTO_DEPLOY_ENABLED = os.getenv("AUTO_DEPLOY_ENABLED", "0") == "1"  # 文章提交、拉取到远端提交后自动部署
+AUTO_DEPLOY_DEBOUNCE_SECONDS = int(os.getenv("AUTO_DEPLOY_DEBOUNCE_SECONDS", "60"))  # 最后一次改动后安静多久开始构建
+AUTO_DEPLOY_MAX_DELAY_SECONDS = int(os.getenv("AUTO_DEPLOY_MAX_DELAY_SECONDS", "600"))  # 持续改动时最迟多久构建一次
+
+# ========== 草稿预览构建 ==========
+PREVIEW_BUILD_TTL = int(os.getenv("PREVIEW_BUILD_TTL", "86400"))  # 预览输出保留时长（秒），0 为不按时间清理
+PREVIEW_BUILD_KEEP = int(os.getenv("PREVIEW_BUILD_KEEP", "10"))  # 每个仓库最多保留的预览数
+PREVIEW_BUILD_ROOT = os.getenv("PREVIEW_BUILD_ROOT", "/previews/")  # 预览站点的访问路径前缀，需在 nginx 中映射到仓库的 .previews 目录
 
 # 确保目录存在
 if not os.path.exists(REPOS_BASE_DIR):
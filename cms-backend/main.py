@@ -1,10 +1,16 @@
 # main.py
 
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 
-from routers import repo, article,wehbookHexo
+from commons.metrics import HTTP_REQUEST_SECONDS
+from commons.profiler import install_route_profiling
+from commons.tracing import start_trace
+from configs.config import METRICS_ENABLED, TRACING_ENABLED
+from routers import repo, article,wehbookHexo,metrics,profiling,asset
 
 app = FastAPI(docs_url=None, version="1.0.0")  # 禁用默认 /docs
 
@@ -28,14 +34,51 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端跨域调用时需要读取 ETag（带 If-None-Match 复用缓存）和 X-Trace-Id
+    expose_headers=["ETag", "X-Trace-Id"],
 )
 
+# ----------------------------
+# 接口耗时指标（关闭时不注册中间件）
+# ----------------------------
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_duration(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # 使用路由模板而不是实际路径，避免标签爆炸
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                         route=getattr(route, "path", "unmatched"), status=status)
+
+# ----------------------------
+# 链路追踪：每个请求一个根 span，响应头返回 X-Trace-Id
+# ----------------------------
+if TRACING_ENABLED:
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        with start_trace("http.request", method=request.method, path=request.url.path) as root:
+            response = await call_next(request)
+            route = request.scope.get("route")
+            root.set_attribute("route", getattr(route, "path", "unmatched"))
+            root.set_attribute("status", response.status_code)
+            response.headers["X-Trace-Id"] = root.trace.trace_id
+            return response
+
 # ----------------------------
 # 注册路由
 # ----------------------------
 app.include_router(repo.router)
 app.include_router(article.router)
+app.include_router(asset.router)
 app.include_router(wehbookHexo.router)
+app.include_router(metrics.router)
+app.include_router(profiling.router)
 
 # ----------------------------
 # 根路径提示
@@ -46,4 +89,9 @@ def read_root():
         "message": "Hexo Headless CMS API",
         "docs": "/docs",
         "redoc": "/redoc"
-    }
\ No newline at end of file
+    }
+
+# ----------------------------
+# 按需剖析：包装各路由的接口函数（需在所有路由注册之后）
+# ----------------------------
+install_route_profiling(app)
@@ -1,8 +1,14 @@
 # schemas.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from pydantic import Field
 
+from commons.postsTree import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_DEPTH
+
+# 批量接口单次最多处理的文章数
+MAX_BATCH_SIZE = 500
+
+
 class ArticleCreate(BaseModel):
     title: str = Field(..., min_length=1, description="文章标题，不能为空")
     path: str = Field(..., description="自定义文件路径，不能为空")
@@ -19,4 +25,59 @@ class ArticleCreate(BaseModel):
                 "body": "---\ntitle: 我的第一篇文章\n---\n这是正文...",
                 "draft": False
             }
-        }
\ No newline at end of file
+        }
+
+
+class TreeListQuery(BaseModel):
+    repo_url: Optional[str] = Field(None, description="仓库地址，为空时使用当前仓库")
+    branch: str = Field("main", description="分支")
+    path: str = Field("", description="目录相对 _posts 的路径，空为根目录")
+    depth: int = Field(1, ge=1, le=MAX_DEPTH, description="返回的层数")
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="每个目录返回的条数")
+    cursor: Optional[str] = Field(None, description="上一页返回的 next_cursor")
+
+
+class SearchQuery(BaseModel):
+    q: str = Field(..., min_length=1, max_length=200, description="检索词，中文按相邻两字匹配")
+    repo_url: Optional[str] = Field(None, description="仓库地址，为空时使用当前仓库")
+    branch: str = Field("main", description="分支")
+    limit: int = Field(20, ge=1, le=100, description="返回条数")
+    offset: int = Field(0, ge=0, description="偏移量")
+
+
+class BatchPaths(BaseModel):
+    paths: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE, description="文章路径列表")
+
+
+class BatchSave(BaseModel):
+    posts: List[ArticleCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE, description="要保存的文章")
+    message: Optional[str] = Field(None, description="提交说明，为空时自动生成")
+
+
+class TextEdit(BaseModel):
+    start: int = Field(..., ge=0, description="起始偏移（Unicode 字符，相对原文）")
+    end: int = Field(..., ge=0, description="结束偏移（不含）")
+    text: str = Field("", description="替换后的文本")
+
+
+class ArticlePatch(BaseModel):
+    path: str = Field(..., description="文章路径")
+    title: Optional[str] = Field(None, description="用于提交说明，为空时使用路径")
+    base_etag: str = Field(..., description="补丁所基于的版本（getArticle 返回的 ETag）")
+    edits: List[TextEdit] = Field(..., max_length=10000, description="对 getArticle 返回的 body 的区间替换，按 start 升序")
+    result_sha256: str = Field(..., min_length=64, max_length=64, description="应用补丁后 body 的 SHA-256（UTF-8），用于校验")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "path": "tech/python.md",
+                "base_etag": "\"3f2a...\"",
+                "edits": [{"start": 120, "end": 128, "text": "新的内容"}],
+                "result_sha256": "9c56cc51b374c3ba189210d5b6d4bf57790d351c96c47c02190ecf1e430635ab",
+            }
+        }
+
+
+class PreviewQuery(BaseModel):
+    path: Optional[str] = Field(None, description="文章路径，body 为空时渲染已保存的内容")
+    body: Optional[str] = Field(None, description="编辑器中的 Markdown 内容（可含 Front Matter）")
@@ -1,15 +1,28 @@
 # routers/article.py
 
-from fastapi import APIRouter, Depends, HTTPException
+import hashlib
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from typing import Dict, List,Any
 from datetime import datetime
+from loguru import logger
 
 from configs.config import current_repo
-from model.articleModel import ArticleCreate
+from model.articleModel import ArticleCreate, TreeListQuery, SearchQuery, BatchPaths, BatchSave, \
+    ArticlePatch, PreviewQuery
 from utils.token_utils import verify_token
-from utils.git_utils import git_pull, git_commit_and_push, ensure_repo_cloned
-from utils.article_utils import scan_posts_tree, read_post, save_post, delete_post
+from utils.git_utils import git_pull, git_commit_and_push, ensure_repo_cloned, repo_lock, get_head_commit, \
+    reset_worktree
+from utils.article_utils import scan_posts_compact, read_post, save_post, delete_post, get_post_etag, \
+    normalize_post_path, apply_text_edits, split_front_matter
+from utils.markdown_utils import marked_options, render_key, render_markdown, renderer_name
+from utils.etag_utils import etag_matches, not_modified, content_etag
+from utils.response_utils import encoded_json_response, encoded_not_modified
 from commons.articleCache import MultiRepoCacheManager
+from commons.metrics import CACHE_REQUESTS, repo_labels
+from commons.searchIndex import SEARCH_INDEXES
+from commons.autoDeploy import AUTO_DEPLOY
+from configs.config import PREVIEW_MAX_KB
 
 router = APIRouter(prefix="/api", tags=["Article"])
 # 全局缓存管理器
@@ -18,14 +31,28 @@ cache_manager = MultiRepoCacheManager()
 def get_current_repo():
     if not current_repo["url"]:
         raise HTTPException(status_code=400, detail="请先调用 /api/setup 设置仓库")
-    return current_repo
+    # 取快照，避免处理过程中被其他请求 / worker 修改
+    return dict(current_repo)
+
+
 
+def _commit_and_push(repo_url: str, branch: str, message: str) -> dict:
+    """提交推送文章改动；启用自动部署时标记站点待部署"""
+    result = git_commit_and_push(repo_url, branch=branch, message=message)
+    if AUTO_DEPLOY is not None and result.get("status") == "pushed":
+        AUTO_DEPLOY.mark_dirty(repo_url, branch, "commit")
+    return result
 
 # ----------------------------s
 # 列出所有文章
 # ----------------------------
 @router.post("/list", response_model=Dict[str, Any])
-def list_article(data: Dict,token: str = Depends(verify_token)):
+def list_article(data: Dict, token: str = Depends(verify_token),
+                 if_none_match: str = Header(None), accept_encoding: str = Header(None)):
+    """
+    直接返回缓存中预序列化（按 Accept-Encoding 选择 gzip / br）的响应体
+    响应带 ETag（HEAD commit + 文章树哈希），If-None-Match 命中时返回 304
+    """
 
     try:
         repo_url = data.get("repo_url")
@@ -45,26 +72,108 @@ def list_article(data: Dict,token: str = Depends(verify_token)):
             raise HTTPException(status_code=400, detail="缺少 repo_url")
 
 
-        cached_data = cache_manager.get_cached_data(repo_url, branch)
-        if cached_data is not None:
-            return cached_data
+        body, etag = cache_manager.get_cached_body(repo_url, branch)
+        if body is not None:
+            CACHE_REQUESTS.inc(result="hit", **repo_labels(repo_url, branch))
+        else:
+            CACHE_REQUESTS.inc(result="miss", **repo_labels(repo_url, branch))
+            _load_cache(repo_url, branch)
+            body, etag = cache_manager.get_cached_body(repo_url, branch)
 
-        repo_path = ensure_repo_cloned(repo_url, branch)
+        if etag_matches(if_none_match, etag):
+            return encoded_not_modified(body, accept_encoding, etag)
+        return encoded_json_response(body, accept_encoding, etag)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"读取失败: {str(e)}")
 
-        current_repo["url"] = repo_url
-        current_repo["branch"] = branch
-        current_repo["path"] = repo_path
 
-        git_pull(repo_url, branch)
-        data_result = scan_posts_tree(repo_url)
+def _load_cache(repo_url: str, branch: str):
+    """缓存未命中：克隆 / 拉取并扫描，写入缓存并启动后台刷新"""
+    repo_path = ensure_repo_cloned(repo_url, branch)
 
-        # 更新缓存并启动后台刷新
-        cache_manager.set_cached_data(repo_url, branch, data_result)
+    current_repo.update(url=repo_url, branch=branch, path=repo_path)
+
+    git_pull(repo_url, branch)
+    tree = scan_posts_compact(repo_url)
+
+    # 更新缓存并启动后台刷新
+    cache_manager.set_cached_data(repo_url, branch, tree, get_head_commit(repo_url))
+
+
+# ----------------------------
+# 按层级列出文章（懒加载）
+# ----------------------------
+@router.post("/listTree", response_model=Dict[str, Any])
+def list_tree(query: TreeListQuery, response: Response, token: str = Depends(verify_token),
+              if_none_match: str = Header(None)):
+    """
+    从缓存的文章树返回 path 目录下 depth 层，目录附带子目录数 / 文件数 / 文章总数
+    大目录用 limit + cursor 分页（next_cursor 为空表示没有更多）
+    ETag 由文章树 ETag 与查询参数组成，文章树未变化时返回 304
+    """
+    repo_url, branch = query.repo_url, query.branch
+    if not repo_url:
+        if not current_repo["url"]:
+            raise HTTPException(status_code=400, detail="缺少 repo_url")
+        repo_url, branch = current_repo["url"], current_repo["branch"]
 
-        return data_result
+    try:
+        tree, etag = cache_manager.get_cached_tree(repo_url, branch)
+        if tree is not None:
+            CACHE_REQUESTS.inc(result="hit", **repo_labels(repo_url, branch))
+        else:
+            CACHE_REQUESTS.inc(result="miss", **repo_labels(repo_url, branch))
+            _load_cache(repo_url, branch)
+            tree, etag = cache_manager.get_cached_tree(repo_url, branch)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取失败: {str(e)}")
 
+    path = query.path.strip("/")
+    if not tree.has_dir(path):
+        raise HTTPException(status_code=404, detail=f"目录不存在: {query.path}")
+
+    # 查询参数的哈希需跨 worker 一致，不能用内置 hash()
+    etag = content_etag(repr((path, query.depth, query.limit, query.cursor)).encode("utf-8"), prefix=etag.strip('"'))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return tree.list_dir(path, query.depth, query.limit, query.cursor)
+
+# ----------------------------
+# 全文检索
+# ----------------------------
+@router.post("/search", response_model=Dict[str, Any])
+def search_article(query: SearchQuery, token: str = Depends(verify_token)):
+    """
+    按标题和正文检索文章，BM25 排序，返回带 <mark> 高亮的摘要
+    索引在缓存刷新后于后台增量更新；首次使用时同步建立
+    stale 为 true 表示后台尚未更新到最新 commit，结果可能缺少最近的修改
+    """
+    if SEARCH_INDEXES is None:
+        raise HTTPException(status_code=404, detail="全文检索未启用")
+    repo_url, branch = query.repo_url, query.branch
+    if not repo_url:
+        if not current_repo["url"]:
+            raise HTTPException(status_code=400, detail="缺少 repo_url")
+        repo_url, branch = current_repo["url"], current_repo["branch"]
+
+    try:
+        entry = cache_manager.get_cache_entry(repo_url, branch)
+        tree, version = entry.get_versioned_tree()
+        if tree is None:
+            _load_cache(repo_url, branch)
+            tree, version = entry.get_versioned_tree()
+        index = SEARCH_INDEXES.get(repo_url)
+        if index.commit is None:
+            index.sync(tree, version)
+        result = index.search(query.q, query.limit, query.offset)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"检索失败: {str(e)}")
+    result["stale"] = result["indexed_commit"] != version
+    return result
+
 # ----------------------------
 # 创建文章
 # ----------------------------
@@ -79,47 +188,150 @@ def create_article(post: ArticleCreate, token: str = Depends(verify_token)):
     if not title:
         raise HTTPException(status_code=400, detail="标题不能为空")
 
-    git_pull(repo_url, branch)
+    # 拉取、写入、提交在同一把仓库锁内完成（多 worker 时互斥）
+    with repo_lock(repo_url):
+        git_pull(repo_url, branch)
 
-    date_str = post_dirct.get("date")
-    if date_str:
-        try:
-            now = date_str.split()[0]  # 取第一部分，如 "2025-09-23 10:00:00" → "2025-09-23"
-        except (AttributeError, IndexError):
+        date_str = post_dirct.get("date")
+        if date_str:
+            try:
+                now = date_str.split()[0]  # 取第一部分，如 "2025-09-23 10:00:00" → "2025-09-23"
+            except (AttributeError, IndexError):
+                now = datetime.now().strftime("%Y-%m-%d")
+        else:
             now = datetime.now().strftime("%Y-%m-%d")
-    else:
-        now = datetime.now().strftime("%Y-%m-%d")
-    slug = title.replace(' ', '-').lower()
-    filename = post_dirct.get("path")
+        slug = title.replace(' ', '-').lower()
+        filename = post_dirct.get("path")
 
-    try:
-        save_post(repo_url, filename, post_dirct)
+        try:
+            save_post(repo_url, filename, post_dirct)
 
-        git_commit_and_push(
-            repo_url,
-            branch=branch,
-            message=f"✏️ 更新: {title}"
-        )
-        # 执行手动刷新
-        data_result = cache_manager.refresh_cache(repo_url, branch)
-        return {"id": filename, "message": "创建成功"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"创建失败: {str(e)}")
+            _commit_and_push(
+                repo_url,
+                branch=branch,
+                message=f"✏️ 更新: {title}"
+            )
+            # 执行手动刷新
+            data_result = cache_manager.refresh_cache(repo_url, branch)
+            return {"id": filename, "message": "创建成功"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"创建失败: {str(e)}")
 
 # ----------------------------
 # 获取单篇文章
 # ----------------------------
 @router.post("/getArticle")
-def get_article(post: Dict, token: str = Depends(verify_token)):
+def get_article(post: Dict, response: Response, token: str = Depends(verify_token),
+                if_none_match: str = Header(None)):
+    """响应带 ETag（文件内容哈希），If-None-Match 命中时返回 304，不读取解析文章"""
     filename = post.get("path")
     if not filename.endswith(".md"):
         filename += ".md"
     repo = get_current_repo()
     try:
+        etag = get_post_etag(repo["url"], filename)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
         return read_post(repo["url"], filename)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="文章未找到")
 
+# ----------------------------
+# 服务端渲染预览
+# ----------------------------
+@router.post("/preview", summary="渲染文章预览")
+def preview_article(query: PreviewQuery, response: Response, token: str = Depends(verify_token),
+                    if_none_match: str = Header(None)):
+    """
+    body 不为空时渲染编辑器中的内容，否则渲染 path 对应的已保存文章；Front Matter 不参与渲染
+    渲染选项与站点 _config.yml 的 marked 配置一致；按块缓存，编辑时只重新渲染改动的块
+    响应带 ETag（渲染选项 + 正文哈希），If-None-Match 命中时返回 304
+    """
+    if renderer_name() is None:
+        raise HTTPException(status_code=503, detail="服务端未安装 Markdown 渲染器（pip install markdown-it-py）")
+    repo = get_current_repo()
+    content = query.body
+    if content is None:
+        if not query.path:
+            raise HTTPException(status_code=400, detail="缺少 path 或 body")
+        try:
+            content = read_post(repo["url"], normalize_post_path(query.path))["body"]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="文章未找到")
+    if len(content) > PREVIEW_MAX_KB * 1024:
+        raise HTTPException(status_code=413, detail=f"内容超过 {PREVIEW_MAX_KB}KB，无法预览")
+
+    front_matter, body = split_front_matter(content)
+    options = marked_options(repo["url"])
+    etag = content_etag(render_key(body, options).encode("utf-8"), prefix="preview")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        result = render_markdown(body, options)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"渲染失败: {str(e)}")
+    response.headers["ETag"] = etag
+    return {**result, "title": front_matter.get("title", ""), "renderer": renderer_name()}
+
+# ----------------------------
+# 按补丁保存文章（只上传修改的区间）
+# ----------------------------
+@router.post("/patchArticle", summary="按补丁保存文章")
+def patch_article(patch: ArticlePatch, response: Response, token: str = Depends(verify_token)):
+    """
+    补丁基于 getArticle 返回的 body 和 ETag，应用后校验 body 的 SHA-256
+    - 文章已被修改（ETag 不一致）返回 409，附带当前 ETag，客户端需重新获取
+    - 结果校验不一致返回 409，客户端应改用 /api/saveArticle 提交完整内容
+    成功时响应头和响应体返回新的 ETag，可作为下一次补丁的 base_etag
+    """
+    repo = get_current_repo()
+    repo_url = repo["url"]
+    branch = repo["branch"]
+    try:
+        filename = normalize_post_path(patch.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with repo_lock(repo_url):
+        git_pull(repo_url, branch)
+        try:
+            current_etag = get_post_etag(repo_url, filename)
+            post = read_post(repo_url, filename)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="文章未找到")
+        # 写前置条件按强校验比较：不接受 * 或弱 ETag，也不接受多个 ETag 列表
+        if patch.base_etag != current_etag:
+            raise HTTPException(status_code=409, detail={"message": "文章已被修改，请重新获取", "etag": current_etag})
+
+        try:
+            body = apply_text_edits(post["body"], [edit.model_dump() for edit in patch.edits])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if hashlib.sha256(body.encode("utf-8")).hexdigest() != patch.result_sha256.lower():
+            raise HTTPException(status_code=409, detail={"message": "补丁结果校验失败，请提交完整内容",
+                                                         "etag": current_etag})
+
+        try:
+            status = save_post(repo_url, filename, {"body": body})
+            if status != "unchanged":
+                _commit_and_push(
+                    repo_url,
+                    branch=branch,
+                    message=f"✏️ 更新: {patch.title or post['title']}"
+                )
+                cache_manager.rescan_cache(repo_url, branch)
+            etag = get_post_etag(repo_url, filename)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"保存失败: {str(e)}")
+
+    response.headers["ETag"] = etag
+    return {"id": filename, "etag": etag, "status": status, "message": "保存成功"}
+
 # ----------------------------
 # 更新文章-提交到git上
 # ----------------------------
@@ -131,7 +343,7 @@ def update_article(post: Dict, token: str = Depends(verify_token)):
     branch = repo["branch"]
     comment = post.get("comment")
     try:
-        git_commit_and_push(
+        _commit_and_push(
             repo_url,
             branch=branch,
             message=f"✏️ 更新: {comment}"
@@ -161,16 +373,137 @@ def remove_article(post: Dict, token: str = Depends(verify_token)):
     except:
         title = filename
 
-    git_pull(repo_url, branch)
+    # 拉取、删除、提交在同一把仓库锁内完成（多 worker 时互斥）
+    with repo_lock(repo_url):
+        git_pull(repo_url, branch)
 
+        try:
+            delete_post(repo_url, filename)
+            _commit_and_push(
+                repo_url,
+                branch=branch,
+                message=f"🗑️ 删除: {title}"
+            )
+            data_result = cache_manager.refresh_cache(repo_url, branch)
+            return {"message": "删除成功"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
+
+
+# ----------------------------
+# 批量接口：一次拉取、一次提交推送、一次缓存更新
+# ----------------------------
+def _batch_message(action: str, titles: List[str]) -> str:
+    return f"{action}: {len(titles)} 篇\n\n" + "\n".join(f"- {t}" for t in titles)
+
+
+def _validate_paths(paths: List[str]) -> List[str]:
+    """规范化并校验全部路径，任一不合法则整批拒绝"""
+    normalized, errors, seen = [], [], set()
+    for i, raw in enumerate(paths):
+        try:
+            path = normalize_post_path(raw)
+            if path in seen:
+                raise ValueError(f"路径重复: {path}")
+        except ValueError as e:
+            errors.append({"index": i, "path": raw, "error": str(e)})
+            continue
+        seen.add(path)
+        normalized.append(path)
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "校验失败，未做任何修改", "errors": errors})
+    return normalized
+
+
+def _rollback_batch(repo_url: str, base: str, paths: List[str]):
+    """批量操作失败时把工作区恢复到操作前的提交（调用方已持有 repo_lock）"""
     try:
-        delete_post(repo_url, filename)
-        git_commit_and_push(
-            repo_url,
-            branch=branch,
-            message=f"🗑️ 删除: {title}"
-        )
-        data_result = cache_manager.refresh_cache(repo_url, branch)
-        return {"message": "删除成功"}
+        reset_worktree(repo_url, base, [f"source/_posts/{path}" for path in paths])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
\ No newline at end of file
+        logger.error(f"批量操作失败后恢复工作区失败 {repo_url}: {e}")
+
+
+@router.post("/batchGet", summary="批量获取文章")
+def batch_get_articles(req: BatchPaths, token: str = Depends(verify_token)):
+    """逐条返回结果，单篇不存在不影响其他文章"""
+    repo = get_current_repo()
+    items = []
+    for path in _validate_paths(req.paths):
+        try:
+            items.append({"path": path, "ok": True, "etag": get_post_etag(repo["url"], path),
+                          "data": read_post(repo["url"], path)})
+        except FileNotFoundError:
+            items.append({"path": path, "ok": False, "error": "文章未找到"})
+    return {"items": items}
+
+
+@router.post("/batchSave", summary="批量保存文章")
+def batch_save_articles(req: BatchSave, token: str = Depends(verify_token)):
+    """
+    先校验全部条目（路径、内容、重复），有任一错误时返回 400 和逐条错误，不做任何修改
+    全部写入后只提交推送一次；内容未变化的文章不写入，全部未变化时不提交
+    """
+    repo = get_current_repo()
+    repo_url = repo["url"]
+    branch = repo["branch"]
+
+    paths = _validate_paths([post.path for post in req.posts])
+    errors = [{"index": i, "path": path, "error": "内容不能为空"}
+              for i, (path, post) in enumerate(zip(paths, req.posts)) if post.body is None]
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "校验失败，未做任何修改", "errors": errors})
+
+    with repo_lock(repo_url):
+        git_pull(repo_url, branch)
+        base = get_head_commit(repo_url)
+        try:
+            items, changed = [], []
+            for path, post in zip(paths, req.posts):
+                status = save_post(repo_url, path, post.model_dump())
+                items.append({"path": path, "ok": True, "status": status})
+                if status != "unchanged":
+                    changed.append(post.title)
+            if changed:
+                _commit_and_push(repo_url, branch=branch,
+                                    message=req.message or _batch_message("✏️ 批量更新", changed))
+                cache_manager.rescan_cache(repo_url, branch)
+        except Exception as e:
+            # 整批生效或整批不生效：已写入的文件不能留在工作区，否则会被下一次提交带上
+            _rollback_batch(repo_url, base, paths)
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=f"批量保存失败: {str(e)}")
+    return {"items": items, "changed": len(changed), "message": "保存成功"}
+
+
+@router.post("/batchDelete", summary="批量删除文章")
+def batch_delete_articles(req: BatchPaths, token: str = Depends(verify_token)):
+    """路径不合法时整批拒绝；文章不存在的逐条返回失败，其余照常删除并只提交推送一次"""
+    repo = get_current_repo()
+    repo_url = repo["url"]
+    branch = repo["branch"]
+
+    paths = _validate_paths(req.paths)
+    with repo_lock(repo_url):
+        git_pull(repo_url, branch)
+        base = get_head_commit(repo_url)
+        try:
+            items, deleted = [], []
+            for path in paths:
+                try:
+                    title = read_post(repo_url, path)["title"]
+                    delete_post(repo_url, path)
+                except FileNotFoundError:
+                    items.append({"path": path, "ok": False, "error": "文章未找到"})
+                    continue
+                items.append({"path": path, "ok": True})
+                deleted.append(title)
+            if deleted:
+                _commit_and_push(repo_url, branch=branch, message=_batch_message("🗑️ 批量删除", deleted))
+                cache_manager.rescan_cache(repo_url, branch)
+        except Exception as e:
+            _rollback_batch(repo_url, base, paths)
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=f"批量删除失败: {str(e)}")
+    return {"items": items, "deleted": len(deleted), "message": "删除成功"}
@@ -0,0 +1,95 @@
+# routers/asset.py
+
+import hashlib
+import os
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Query
+from starlette.concurrency import run_in_threadpool
+
+from configs.config import ASSET_MAX_MB
+from routers.article import get_current_repo
+from utils.asset_utils import asset_ext, asset_location, asset_name, find_asset, new_upload_path, place_asset
+from utils.git_utils import repo_lock
+from utils.token_utils import verify_token
+
+router = APIRouter(prefix="/api", tags=["Asset"])
+
+MAX_ASSET_BYTES = ASSET_MAX_MB * 1024 * 1024
+
+
+def _asset_result(name: str, url_prefix: str, sha256: str, size: int, deduplicated: bool) -> Dict:
+    url = url_prefix + name
+    return {"name": name, "url": url, "markdown": f"![]({url})", "sha256": sha256, "size": size,
+            "deduplicated": deduplicated}
+
+
+# ----------------------------
+# 检查资源是否已存在（上传前调用，已存在时无需传输）
+# ----------------------------
+@router.post("/checkAsset", summary="按内容哈希检查资源")
+def check_asset(data: Dict, token: str = Depends(verify_token)):
+    sha256 = str(data.get("sha256", "")).lower()
+    if len(sha256) != 64:
+        raise HTTPException(status_code=400, detail="sha256 格式错误")
+    repo = get_current_repo()
+    try:
+        directory, url_prefix = asset_location(repo["url"], data.get("post"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    name = find_asset(directory, sha256)
+    if not name:
+        return {"exists": False}
+    return {"exists": True, **_asset_result(name, url_prefix, sha256, os.path.getsize(os.path.join(directory, name)),
+                                            True)}
+
+
+# ----------------------------
+# 上传资源：请求体为文件原始内容（非 multipart），流式写入磁盘
+# ----------------------------
+@router.post("/uploadAsset", summary="上传图片等资源")
+async def upload_asset(request: Request,
+                       filename: str = Query(..., description="原文件名，用于确定扩展名"),
+                       post: Optional[str] = Query(None, description="所属文章路径，指定时存入文章资源目录"),
+                       content_length: Optional[int] = Header(None),
+                       token: str = Depends(verify_token)):
+    """
+    逐块写入临时文件并计算 SHA-256，内存占用与文件大小无关；超过 ASSET_MAX_MB 立即中止
+    以内容哈希命名，相同内容只保存一份；不单独提交，随下一次文章保存一起提交
+    """
+    repo = get_current_repo()
+    try:
+        ext = asset_ext(filename)
+        directory, url_prefix = asset_location(repo["url"], post)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if content_length is not None and content_length > MAX_ASSET_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件超过 {ASSET_MAX_MB}MB")
+
+    tmp_path = new_upload_path()
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_ASSET_BYTES:
+                    raise HTTPException(status_code=413, detail=f"文件超过 {ASSET_MAX_MB}MB")
+                hasher.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="文件内容为空")
+
+        sha256 = hasher.hexdigest()
+        name = asset_name(sha256, ext)
+
+        def _place():
+            with repo_lock(repo["url"]):
+                return place_asset(tmp_path, directory, name)
+
+        deduplicated = await run_in_threadpool(_place)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return _asset_result(name, url_prefix, sha256, size, deduplicated)
@@ -0,0 +1,59 @@
+# routers/metrics.py
+
+import hmac
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from commons.buildPool import build_pool
+from commons.metrics import render_metrics, register_collector, repo_labels
+from configs.config import METRICS_ENABLED, METRICS_TOKEN, SECRET_TOKEN
+from routers.article import cache_manager
+
+router = APIRouter(tags=["Metrics"])
+
+
+@register_collector
+def _cache_collector():
+    """文章列表缓存：是否有数据、距上次刷新的秒数（基于 get_all_cache_status，只报告当前配置的仓库）"""
+    has_data, age = [], []
+    now = datetime.now()
+    for status in cache_manager.get_all_cache_status().values():
+        labels = repo_labels(status["repo_url"], status["branch"])
+        if labels["repo"] == "other":
+            continue
+        has_data.append((labels, 1 if status["has_data"] else 0))
+        if status["last_updated"]:
+            age.append((labels, (now - datetime.fromisoformat(status["last_updated"])).total_seconds()))
+    return [
+        ("cms_cache_has_data", "gauge", "缓存是否已有数据", has_data),
+        ("cms_cache_age_seconds", "gauge", "缓存距上次刷新的秒数", age),
+    ]
+
+
+@register_collector
+def _build_pool_collector():
+    stats = build_pool.get_stats()
+    return [
+        ("cms_build_running", "gauge", "正在运行的构建数", [({}, stats["running"])]),
+        ("cms_build_queue_depth", "gauge", "排队中的构建数", [({}, stats["queue_depth"])]),
+        ("cms_build_oldest_wait_seconds", "gauge", "排队最久的构建已等待秒数", [({}, stats["oldest_wait_seconds"])]),
+        ("cms_build_completed_total", "counter", "已完成的构建数", [({}, stats["completed"])]),
+        ("cms_build_failed_total", "counter", "失败的构建数", [({}, stats["failed"])]),
+    ]
+
+
+# ----------------------------
+# Prometheus 抓取接口
+# ----------------------------
+@router.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # 不走 verify_token：抓取失败不应计入封禁；未单独设置 METRICS_TOKEN 时使用 ACCESS_TOKEN
+    expected = f"Bearer {METRICS_TOKEN or SECRET_TOKEN}".encode("utf-8")
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"), expected):
+        raise HTTPException(status_code=401, detail="无效的 metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,85 @@
+# routers/profiling.py
+
+from typing import Dict
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from commons.profiler import arm, disarm, get_arms, list_profiles, get_profile, get_profile_raw_path, DEPLOY_TARGET
+from utils.token_utils import verify_token
+
+router = APIRouter(prefix="/admin/profile", tags=["Profiling"])
+
+
+# ----------------------------
+# 布防：对路由的后 N 个请求做剖析
+# ----------------------------
+@router.post("/arm")
+def arm_route(data: Dict = Body(...), token: str = Depends(verify_token)):
+    """
+    route: 路由模板，如 /api/list
+    count: 剖析的请求数，默认 1
+    mode: cprofile（默认）| sampling
+    interval_ms: 采样间隔（sampling 模式），默认 5
+    """
+    route = data.get("route")
+    if not route:
+        raise HTTPException(status_code=400, detail="缺少 route")
+    try:
+        config = arm(route, int(data.get("count", 1)), data.get("mode", "cprofile"), data.get("interval_ms", 5))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "已布防", "route": route, **config}
+
+
+# ----------------------------
+# 布防：对后 N 次部署做剖析
+# ----------------------------
+@router.post("/armDeploy")
+def arm_deploy(data: Dict = Body(None), token: str = Depends(verify_token)):
+    data = data or {}
+    try:
+        config = arm(DEPLOY_TARGET, int(data.get("count", 1)), data.get("mode", "cprofile"), data.get("interval_ms", 5))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "已布防部署", **config}
+
+
+@router.post("/disarm")
+def disarm_profile(data: Dict = Body(None), token: str = Depends(verify_token)):
+    """route 为空时全部撤防；撤防部署传 route=__deploy__"""
+    disarm((data or {}).get("route"))
+    return {"message": "已撤防", "armed": get_arms()}
+
+
+@router.get("/armed")
+def get_armed(token: str = Depends(verify_token)):
+    return get_arms()
+
+
+# ----------------------------
+# 剖析结果
+# ----------------------------
+@router.get("/results")
+def get_results(token: str = Depends(verify_token)):
+    return list_profiles()
+
+
+@router.get("/results/{profile_id}")
+def get_result(profile_id: str, token: str = Depends(verify_token)):
+    """摘要：总墙钟 / CPU 时间、各阶段耗时和热点函数"""
+    result = get_profile(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    return result
+
+
+@router.get("/results/{profile_id}/raw")
+def download_result(profile_id: str, token: str = Depends(verify_token)):
+    """原始数据：cprofile 为 .prof（pstats / snakeviz），sampling 为 collapsed stack（flamegraph.pl）"""
+    path = get_profile_raw_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    return FileResponse(path, filename=path.rsplit("/", 1)[-1], media_type="application/octet-stream")
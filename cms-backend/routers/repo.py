@@ -21,9 +21,7 @@ def setup_repo(data: Dict, token: str = Depends(verify_token)) -> Dict:
 
     try:
         repo_path = ensure_repo_cloned(repo_url, branch)
-        current_repo["url"] = repo_url
-        current_repo["branch"] = branch
-        current_repo["path"] = repo_path
+        current_repo.update(url=repo_url, branch=branch, path=repo_path)
 
         return {
             "message": "仓库设置成功",
@@ -38,4 +36,4 @@ def setup_repo(data: Dict, token: str = Depends(verify_token)) -> Dict:
 def get_status(token: str = Depends(verify_token)) -> Dict:
     if not current_repo["url"]:
         return {"status": "未设置仓库"}
-    return current_repo
\ No newline at end of file
+    return dict(current_repo)
\ No newline at end of file
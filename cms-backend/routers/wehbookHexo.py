@@ -1,18 +1,38 @@
 # routers/webhook.py
 
-import threading
-
-from fastapi import APIRouter, Request, HTTPException,Depends,Query
-
-from commons.deployCache import get_task, update_task, create_task, get_last_task_by_triggered_by
-from configs.config import current_repo  # 复用已有的全局仓库配置
-from utils.git_utils import git_pull, git_commit_and_push
-from utils.token_utils import verify_token  # 复用 Token 校验
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from fastapi import APIRouter, Request, HTTPException,Depends,Query,Body
+
+from commons.buildPool import build_pool
+from commons.hexoWorker import HEXO_WORKERS
+from commons.autoDeploy import AUTO_DEPLOY
+from commons.metrics import DEPLOY_STEP_SECONDS
+from commons.tracing import span
+from commons.deployCache import get_task, update_task, create_task, get_last_task_by_triggered_by, \
+    get_cancel_event, cancel_task, append_task_step, replace_triggered_by
+from configs.config import current_repo, HEXO_TOTAL_TIMEOUT, HEXO_ATOMIC_PUBLISH, HEXO_KEEP_RELEASES, \
+    PRECOMPRESS_ENABLED, PRECOMPRESS_WORKERS, CMS_DATA_DIR, SECRET_TOKEN, PREVIEW_BUILD_TTL, PREVIEW_BUILD_KEEP, PREVIEW_BUILD_ROOT, \
+    IMAGE_OPTIMIZE_ENABLED, IMAGE_WIDTHS, IMAGE_QUALITY, IMAGE_WORKERS, IMAGE_REWRITE_HTML  # 复用已有的全局仓库配置
+from utils.git_utils import git_pull, git_commit_and_push, get_repo_path, get_repo_name_from_url
+from utils.token_utils import verify_token, token_fingerprint  # 复用 Token 校验
 from loguru import logger
 from datetime import datetime
-from utils.webhook_utils import HexoBuilder
+from utils.webhook_utils import HexoBuilder, BuildCancelledError
+from utils.release_utils import prepare_release, publish_release, discard_release, prune_releases_async, \
+    is_public_tracked, exclude_precompressed, list_releases, rollback_release, get_current_release, ReleaseError, snapshot_release, \
+    prepare_preview, finish_preview, discard_preview, list_previews, prune_previews, prune_previews_async
+from utils.compress_utils import precompress_site
+from utils.image_utils import pillow_available, optimize_source_images, publish_image_variants
 
 router = APIRouter(prefix="/webhookHexo", tags=["WebhookHexo"])
+# 任务只记录 Token 指纹；早先版本写入的原始 Token 在启动时替换掉
+replace_triggered_by(SECRET_TOKEN, token_fingerprint(SECRET_TOKEN))
 class BuildInterruptedError(Exception):
     def __init__(self, message: str, results: list):
         super().__init__(message)
@@ -25,9 +45,40 @@ def get_hexo_repo_path():
     return current_repo["path"]
 
 
-def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_by: str = None):
-    """带状态回调的 Hexo 构建（供后台线程调用）"""
+def _resolve_repo(data: Optional[Dict]):
+    """入参指定仓库则使用入参（地址无效时返回 400），否则使用当前配置"""
+    data = data or {}
+    repo_url = data.get("repo_url")
+    branch = data.get("branch")
+    if branch is not None and (not isinstance(branch, str) or branch.startswith("-")):
+        raise HTTPException(status_code=400, detail="无效的分支名")
+    if not repo_url:
+        get_hexo_repo_path()
+        repo_url = current_repo["url"]
+        branch = branch or current_repo.get("branch", "main")
+    else:
+        try:
+            if not isinstance(repo_url, str):
+                raise ValueError("无效的 Git 仓库地址")
+            get_repo_path(repo_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return repo_url, branch or "main"
+
+
+def run_hexo_build_with_callback(repo_url: str, branch: str, task_id: str = None, triggered_by: str = None):
+    """
+    带状态回调的 Hexo 构建（供构建线程池调用）
+    仓库地址和分支在提交时确定，构建过程中不再读取可变的 current_repo
+    """
+    # 最后一个构建步骤成功时任务即视为成功（原子发布时为 publish_release）
+    build_state = {"final_step": "npx hexo generate", "step_started": time.monotonic()}
+
     def _update_status(step_name: str, status: str, message: str = "", error: str = "", stdout: str = ""):
+        # 步骤顺序执行，距上一次状态更新的时间即为本步骤耗时
+        now = time.monotonic()
+        DEPLOY_STEP_SECONDS.observe(now - build_state["step_started"], step=step_name, status=status)
+        build_state["step_started"] = now
         if task_id:
             step = {
                 "step": step_name,
@@ -36,31 +87,39 @@ def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_
                 "error": error,
                 "stdout": stdout[:500] if stdout else "",  # 防止过大
             }
-            current = get_task(task_id)
-            if current:
-                steps_list = current.get("steps", []) + [step]  # 避免与外层 steps 冲突
-                # 判断是否是最后一步（npx hexo generate）
-                is_final_step = (step_name == "npx hexo generate")
-                update_task(
-                    task_id,
-                    status="success" if status == "success" and is_final_step else "running",
-                    message=message or f"正在执行: {step_name}",
-                    steps=steps_list
-                )
+            # 判断是否是最后一步
+            is_final_step = (step_name == build_state["final_step"])
+            append_task_step(
+                task_id,
+                step,
+                status="success" if status == "success" and is_final_step else "running",
+                message=message or f"正在执行: {step_name}"
+            )
 
     results = []
+    cancel_event = get_cancel_event(task_id) if task_id else None
+    deadline = time.monotonic() + HEXO_TOTAL_TIMEOUT
+
+    def _mark_cancelled(step_name: str):
+        _update_status(step_name, "cancelled", message=f"{step_name} cancelled")
+        if task_id:
+            update_task(task_id, status="cancelled", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 构建已取消")
+        results.append({"step": step_name, "status": "cancelled"})
+        raise BuildInterruptedError("构建已取消", results)
 
     # === Step 1: Git Pull ===
-    repo_url = current_repo.get("url")
-    branch = current_repo.get("branch", "main")
     if not repo_url:
         error_msg = "未配置仓库 URL"
         _update_status("git_pull", "failure", error=error_msg)
         raise BuildInterruptedError(error_msg, [{"step": "git_pull", "status": "error", "error": error_msg}])
 
+    if cancel_event and cancel_event.is_set():
+        _mark_cancelled("git_pull")
+
     try:
         logger.info("🔄 正在拉取最新代码...")
         git_pull(repo_url, branch)
+        repo_path = get_repo_path(repo_url)
         _update_status("git_pull", "success", f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Git 拉取成功 ")
         results.append({"step": "git_pull", "status": "success"})
     except Exception as e:
@@ -69,15 +128,73 @@ def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_
         raise BuildInterruptedError(f"Git 拉取失败: {err_str}", [{"step": "git_pull", "status": "error", "error": err_str}])
 
     # === Step 2: Hexo 构建 ===
-    # === Step 2: Hexo 构建 ===
+    release = None
     try:
-        builder = HexoBuilder(repo_path=repo_path)
+        builder = HexoBuilder(repo_path=repo_path, cancel_event=cancel_event, deadline=deadline)
+
+        # 原子发布：生成到新版本目录，成功后再切换 public 链接
+        config_args = []
+        if HEXO_ATOMIC_PUBLISH:
+            if is_public_tracked(repo_path):
+                logger.warning("⚠️ public 目录已被 git 跟踪，跳过原子发布，直接在 public 中构建")
+            else:
+                release = prepare_release(repo_path)
+                config_args = ["--config", release["config_arg"]]
+                build_state["final_step"] = "publish_release"
+        if not release and PRECOMPRESS_ENABLED:
+            build_state["final_step"] = "precompress"
+        elif not release and IMAGE_OPTIMIZE_ENABLED and pillow_available():
+            build_state["final_step"] = "image_optimize"
+
+        output_dir = release["release_path"] if release else os.path.join(repo_path, "public")
+
+        # 图片优化：与 npm install / hexo generate 并行处理源图片，结果按内容哈希缓存
+        image_future = None
+        image_cache_dir = os.path.join(CMS_DATA_DIR, "images", get_repo_name_from_url(repo_url))
+        if IMAGE_OPTIMIZE_ENABLED:
+            if pillow_available():
+                image_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-optimize")
+                image_future = image_executor.submit(
+                    optimize_source_images,
+                    [os.path.join(repo_path, "source", "_posts"), os.path.join(repo_path, "source", "images")],
+                    image_cache_dir, IMAGE_WIDTHS, IMAGE_QUALITY, IMAGE_WORKERS or None
+                )
+                image_executor.shutdown(wait=False)
+            else:
+                _update_status("image_optimize", "skipped", message="未安装 Pillow，跳过图片优化")
+
         steps = [
             ("npm install", ["npm", "install"]),
-            ("npx hexo clean", ["npx", "hexo", "clean"]),
-            ("npx hexo generate", ["npx", "hexo", "generate"]),
+            ("npx hexo clean", ["npx", "hexo", "clean"] + config_args),
+            ("npx hexo generate", ["npx", "hexo", "generate"] + config_args),
         ]
 
+        # 常驻 Hexo 进程可用时只做一次增量生成，失败则回退为完整构建
+        worker = HEXO_WORKERS.acquire(repo_path, atomic=bool(release)) if HEXO_WORKERS else None
+        if worker:
+            final_step = build_state["final_step"]
+            if final_step == "npx hexo generate":
+                build_state["final_step"] = "hexo worker generate"
+            try:
+                with span("build.hexo_worker"):
+                    stats = worker.generate(cancel_event, deadline)
+                    if release:
+                        stats.update(snapshot_release(repo_path, worker.public_path, output_dir))
+                _update_status("hexo worker generate", "success", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 常驻进程增量生成完成，耗时 {stats['seconds']}s", stdout=json.dumps(stats))
+                results.append({"step": "hexo worker generate", "status": "success", "stats": stats})
+                steps = []
+            except BuildCancelledError:
+                _mark_cancelled("hexo worker generate")
+            except Exception as e:
+                logger.warning(f"常驻 Hexo 进程生成失败，改为完整构建: {e}")
+                _update_status("hexo worker generate", "failure", message="常驻进程生成失败，改为完整构建", error=str(e))
+                build_state["final_step"] = final_step
+                if release:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+        if steps and HEXO_WORKERS:
+            # 完整构建会执行 hexo clean，先停掉常驻进程
+            HEXO_WORKERS.stop(repo_path)
+
         for action_name, cmd in steps:
             try:
                 logger.info(f"正在执行: {action_name}")
@@ -89,6 +206,9 @@ def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_
                     "stdout": cmd_stdout,
                 })
                 logger.info(f"✅ 执行成功: {cmd_stdout[:200].strip()}...")
+            except BuildCancelledError:
+                logger.warning(f"⏹️ 构建已取消: {action_name}")
+                _mark_cancelled(action_name)
             except Exception as e:
                 err_msg = str(e)
                 _update_status(action_name, "failure", message=action_name + " error", error=err_msg)
@@ -99,15 +219,87 @@ def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_
                 })
                 raise BuildInterruptedError(err_msg, results)
 
+        if steps and HEXO_WORKERS:
+            # 依赖刚安装完成，启动常驻进程供下次部署使用
+            HEXO_WORKERS.warm_up(repo_path, atomic=bool(release))
+
+        # 把优化后的图片版本链接到生成结果中对应图片的旁边
+        if image_future:
+            try:
+                builder.check_cancelled()
+                with span("build.image_optimize"):
+                    source_stats = image_future.result()
+                    publish_stats = publish_image_variants(output_dir, image_cache_dir, source_stats, IMAGE_REWRITE_HTML)
+                summary = (f"{source_stats['images']} 张图片，新处理 {source_stats['processed']}，复用 {source_stats['reused']}，"
+                           f"发布 {publish_stats['linked']} 个版本，改写 {publish_stats.get('img_rewritten', 0)} 处引用，WebP 节省 {publish_stats['bytes_saved_webp'] // 1024} KB，"
+                           f"耗时 {source_stats['seconds'] + publish_stats['seconds']:.3f}s")
+                stats = {k: v for k, v in source_stats.items() if k not in ("hashes", "sizes")}
+                stats.update(publish_stats)
+                _update_status("image_optimize", "success", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 图片优化完成: {summary}", stdout=json.dumps(stats))
+                results.append({"step": "image_optimize", "status": "success", "stats": stats})
+                logger.info(f"🖼️ 图片优化完成: {summary}")
+            except BuildCancelledError:
+                _mark_cancelled("image_optimize")
+            except Exception as e:
+                err_msg = str(e)
+                _update_status("image_optimize", "failure", message="image_optimize error", error=err_msg)
+                results.append({"step": "image_optimize", "status": "error", "error": err_msg})
+                raise BuildInterruptedError(err_msg, results)
+
+        # 预压缩：为生成结果写出 .gz / .br，内容未变的文件复用上次的压缩结果
+        if PRECOMPRESS_ENABLED:
+            cache_dir = os.path.join(CMS_DATA_DIR, "precompress", get_repo_name_from_url(repo_url))
+            try:
+                builder.check_cancelled()
+                if not release and is_public_tracked(repo_path):
+                    exclude_precompressed(repo_path)
+                with span("build.precompress"):
+                    stats = precompress_site(output_dir, cache_dir, PRECOMPRESS_WORKERS or None)
+                summary = (f"{stats['files']} 个文件，新压缩 {stats['compressed']}，复用 {stats['reused']}，"
+                           f"gzip 节省 {stats['bytes_saved_gzip'] // 1024} KB，"
+                           f"brotli 节省 {stats['bytes_saved_brotli'] // 1024} KB，耗时 {stats['seconds']}s")
+                _update_status("precompress", "success", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 预压缩完成: {summary}", stdout=json.dumps(stats))
+                results.append({"step": "precompress", "status": "success", "stats": stats})
+                logger.info(f"🗜️ 预压缩完成: {summary}")
+            except BuildCancelledError:
+                _mark_cancelled("precompress")
+            except Exception as e:
+                err_msg = str(e)
+                _update_status("precompress", "failure", message="precompress error", error=err_msg)
+                results.append({"step": "precompress", "status": "error", "error": err_msg})
+                raise BuildInterruptedError(err_msg, results)
+
+        if release:
+            try:
+                with span("build.publish_release", release_id=release["release_id"]):
+                    publish_release(repo_path, release["release_id"])
+                _update_status("publish_release", "success", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 已发布版本 {release['release_id']}")
+                results.append({"step": "publish_release", "status": "success", "release_id": release["release_id"]})
+            except Exception as e:
+                err_msg = str(e)
+                _update_status("publish_release", "failure", message="publish_release error", error=err_msg)
+                results.append({"step": "publish_release", "status": "error", "error": err_msg})
+                raise BuildInterruptedError(err_msg, results)
+            release = None
+            prune_releases_async(repo_path, HEXO_KEEP_RELEASES)
+        prune_previews_async(repo_path, PREVIEW_BUILD_TTL, PREVIEW_BUILD_KEEP)
+
         # ✅ 构建成功，但不 return！继续执行推送
         logger.info("🎉 Hexo 构建成功，准备推送部署...")
 
     except Exception as e:
-        if task_id:
+        if release:
+            # 半成品版本直接丢弃，线上 public 保持不变
+            discard_release(repo_path, release["release_id"])
+        current = get_task(task_id) if task_id else None
+        if current and current.get("status") != "cancelled":
             update_task(task_id, status="failure", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 构建失败: {str(e)}")
         raise  # 重新抛出，中断流程
 
     # === Step 3: 提交并推送构建结果 ===
+    if cancel_event and cancel_event.is_set():
+        _mark_cancelled("git_commit_and_push")
+
     try:
         commit_msg = f"Deploy: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         git_commit_and_push(
@@ -138,13 +330,95 @@ def run_hexo_build_with_callback(repo_path: str, task_id: str = None, triggered_
 
 
 
-def run_hexo_build(repo_path: str):
+def run_preview_build_with_callback(repo_url: str, branch: str, task_id: str = None, triggered_by: str = None):
+    """
+    草稿预览构建（供构建线程池调用，与同仓库的部署排队执行）
+    打开 render_drafts 生成到 .previews/<preview_id>，不切换 public、不推送
+    复用部署构建的 node_modules 和 db.json（不执行 hexo clean），未改动的文章不重新渲染
+    """
+    cancel_event = get_cancel_event(task_id) if task_id else None
+    deadline = time.monotonic() + HEXO_TOTAL_TIMEOUT
+    results = []
+    started = {"at": time.monotonic()}
+
+    def _update_status(step_name: str, status: str, message: str = "", error: str = "", stdout: str = "",
+                       final: bool = False):
+        now = time.monotonic()
+        DEPLOY_STEP_SECONDS.observe(now - started["at"], step=step_name, status=status)
+        started["at"] = now
+        if task_id:
+            step = {"step": step_name, "status": status, "message": message, "error": error,
+                    "stdout": stdout[:500] if stdout else ""}
+            append_task_step(task_id, step, status="success" if status == "success" and final else "running",
+                             message=message or f"正在执行: {step_name}")
+
+    def _fail(step_name: str, e: Exception):
+        if isinstance(e, BuildCancelledError) or (cancel_event and cancel_event.is_set()):
+            _update_status(step_name, "cancelled", message=f"{step_name} cancelled")
+            results.append({"step": step_name, "status": "cancelled"})
+            if task_id:
+                update_task(task_id, status="cancelled", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 预览构建已取消")
+            raise BuildInterruptedError("预览构建已取消", results)
+        _update_status(step_name, "failure", message=f"{step_name} error", error=str(e))
+        results.append({"step": step_name, "status": "error", "error": str(e)})
+        if task_id:
+            update_task(task_id, status="failure", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 预览构建失败: {e}")
+        raise BuildInterruptedError(str(e), results)
+
+    try:
+        if cancel_event and cancel_event.is_set():
+            raise BuildCancelledError("构建已取消")
+        git_pull(repo_url, branch)
+        repo_path = get_repo_path(repo_url)
+        _update_status("git_pull", "success", f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Git 拉取成功 ")
+        results.append({"step": "git_pull", "status": "success"})
+    except Exception as e:
+        _fail("git_pull", e)
+
+    preview = None
+    try:
+        builder = HexoBuilder(repo_path=repo_path, cancel_event=cancel_event, deadline=deadline)
+        preview = prepare_preview(repo_path, PREVIEW_BUILD_ROOT)
+        if task_id:
+            update_task(task_id, preview_id=preview["preview_id"])
+    except Exception as e:
+        if preview:
+            discard_preview(repo_path, preview["preview_id"])
+        _fail("prepare_preview", e)
+    steps = [("npx hexo generate", ["npx", "hexo", "generate", "--config", preview["config_arg"]])]
+    if os.path.isdir(os.path.join(repo_path, "node_modules")):
+        _update_status("npm install", "skipped", message="复用已安装的 node_modules")
+    else:
+        steps.insert(0, ("npm install", ["npm", "install"]))
+
+    for action_name, cmd in steps:
+        try:
+            logger.info(f"正在执行预览构建: {action_name}")
+            cmd_stdout = builder.run_command(cmd)
+        except Exception as e:
+            discard_preview(repo_path, preview["preview_id"])
+            _fail(action_name, e)
+        results.append({"step": action_name, "status": "success", "stdout": cmd_stdout})
+        _update_status(action_name, "success", message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {action_name} success",
+                       stdout=cmd_stdout, final=action_name == steps[-1][0])
+
+    finish_preview(repo_path, preview["preview_id"])
+    prune_previews_async(repo_path, PREVIEW_BUILD_TTL, PREVIEW_BUILD_KEEP)
+    url = f"{PREVIEW_BUILD_ROOT.rstrip('/')}/{preview['preview_id']}/"
+    results.append({"step": "preview", "status": "success", "preview_id": preview["preview_id"], "url": url})
+    if task_id:
+        update_task(task_id, status="success", preview_url=url,
+                    message=f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 预览已生成: {url}")
+    logger.info(f"👀 草稿预览已生成 {preview['preview_id']}")
+    return results
+
+
+def run_hexo_build(repo_url: str, branch: str = "main"):
     """执行 Hexo 构建流程（Git Pull + 构建），支持 Windows / Linux / macOS"""
     results = []
+    repo_path = get_repo_path(repo_url)
 
     # === Step 1: Git Pull ===
-    repo_url = current_repo.get("url")
-    branch = current_repo.get("branch", "main")
     if not repo_url:
         error_msg = "未配置仓库 URL"
         results.append({"step": "git_pull", "status": "error", "error": error_msg})
@@ -210,39 +484,169 @@ def run_hexo_build(repo_path: str):
     return results
 
 
+def submit_deploy(repo_url: str, branch: str, owner: str, triggered_by: str,
+                  on_finish: Optional[Callable[[bool], None]] = None,
+                  build_fn: Callable = run_hexo_build_with_callback):
+    """
+    创建任务并提交到构建线程池（同仓库排队，不同仓库并发），返回 (task_id, 前面排队的构建数)
+    owner 为任务归属（Token 指纹），/status 未指定 task_id 时按它查找最近的任务
+    """
+    task_id = create_task(owner)
+    update_task(task_id, repo_url=repo_url, branch=branch)
+    ahead = build_pool.queue_position(repo_url)
+    if ahead:
+        update_task(task_id, message=f"任务已提交，前面还有 {ahead} 个构建")
+    if on_finish is None:
+        build_pool.submit(repo_url, branch, build_fn,
+                          repo_url, branch, task_id=task_id, triggered_by=triggered_by)
+    else:
+        build_pool.submit(repo_url, branch, _run_build_and_notify,
+                          repo_url, branch, on_finish, build_fn, task_id=task_id, triggered_by=triggered_by)
+    return task_id, ahead
+
+
+def _run_build_and_notify(repo_url: str, branch: str, on_finish: Callable[[bool], None], build_fn: Callable,
+                          **kwargs):
+    success = False
+    try:
+        build_fn(repo_url, branch, **kwargs)
+        success = True
+    finally:
+        on_finish(success)
+
+
+if AUTO_DEPLOY is not None:
+    AUTO_DEPLOY.bind(lambda repo_url, branch, on_finish: submit_deploy(
+        repo_url, branch, "auto-deploy", "auto-deploy", on_finish)[0])
+
+
 @router.post("/deploy")
 async def trigger_hexo_build_async(
         request: Request,
+        data: Optional[Dict] = Body(None),
         token: str = Depends(verify_token)
 ):
-    repo_path = get_hexo_repo_path()
-    client_ip = request.client.host
-    logger.info(f"📥 异步部署请求，来源IP: {client_ip}")
-
-    # 1. 创建任务
-    task_id = create_task(token)
+    # 入参指定仓库则构建该仓库，否则使用当前配置（提交时取快照）
+    repo_url, branch = _resolve_repo(data)
 
-    update_task(task_id, triggered_by=token)
-
-    # 2. 启动后台线程执行
-    def background_worker():
-        try:
-            run_hexo_build_with_callback(repo_path, task_id=task_id, triggered_by=client_ip)
-        except Exception as e:
-            logger.exception(f"后台任务异常: {e}")
-            # 异常已在 run_hexo_build_with_callback 中处理
+    client_ip = request.client.host
+    logger.info(f"📥 异步部署请求，来源IP: {client_ip}，仓库: {repo_url}@{branch}")
 
-    thread = threading.Thread(target=background_worker, daemon=True)
-    thread.start()
+    task_id, ahead = submit_deploy(repo_url, branch, token_fingerprint(token), client_ip)
 
-    # 3. 立即返回 task_id
+    # 立即返回 task_id
     return {
         "status": "accepted",
         "task_id": task_id,
         "message": "部署任务已提交，正在后台执行",
-        "triggered_by": client_ip
+        "triggered_by": client_ip,
+        "repo_url": repo_url,
+        "branch": branch,
+        "queue_ahead": ahead
+    }
+
+@router.post("/preview")
+async def trigger_preview_build(
+        request: Request,
+        data: Optional[Dict] = Body(None),
+        token: str = Depends(verify_token)
+):
+    """生成包含草稿的预览站点（不发布、不推送），进度通过 /status 查询，完成后 message 中给出访问路径"""
+    repo_url, branch = _resolve_repo(data)
+    client_ip = request.client.host
+    logger.info(f"📥 草稿预览请求，来源IP: {client_ip}，仓库: {repo_url}@{branch}")
+    task_id, ahead = submit_deploy(repo_url, branch, token_fingerprint(token), client_ip,
+                                   build_fn=run_preview_build_with_callback)
+    return {
+        "status": "accepted",
+        "task_id": task_id,
+        "message": "预览构建已提交，正在后台执行",
+        "repo_url": repo_url,
+        "branch": branch,
+        "queue_ahead": ahead
+    }
+
+@router.post("/previews")
+async def get_previews(data: Optional[Dict] = Body(None), token: str = Depends(verify_token)):
+    """列出未过期的草稿预览（倒序），同时清理过期的预览"""
+    repo_url, branch = _resolve_repo(data)
+    repo_path = get_repo_path(repo_url)
+    prune_previews(repo_path, PREVIEW_BUILD_TTL, PREVIEW_BUILD_KEEP)
+    previews = list_previews(repo_path)
+    for preview in previews:
+        preview["url"] = f"{PREVIEW_BUILD_ROOT.rstrip('/')}/{preview['preview_id']}/"
+        preview["expires_at"] = preview["created_at"] + PREVIEW_BUILD_TTL if PREVIEW_BUILD_TTL > 0 else None
+    return {"repo_url": repo_url, "branch": branch, "previews": previews}
+
+@router.post("/deletePreview")
+async def delete_preview(data: Dict = Body(...), token: str = Depends(verify_token)):
+    """删除指定的草稿预览（preview_id）"""
+    repo_url, _ = _resolve_repo(data)
+    repo_path = get_repo_path(repo_url)
+    preview_id = data.get("preview_id")
+    preview = next((p for p in list_previews(repo_path) if p["preview_id"] == preview_id), None)
+    if preview is None:
+        raise HTTPException(status_code=404, detail="预览不存在或已过期")
+    if preview["building"]:
+        raise HTTPException(status_code=409, detail="预览正在构建，无法删除")
+    discard_preview(repo_path, preview_id)
+    return {"message": "预览已删除", "preview_id": preview_id}
+
+@router.post("/releases")
+async def get_releases(data: Optional[Dict] = Body(None), token: str = Depends(verify_token)):
+    """列出已发布的版本（倒序），current 为当前线上版本"""
+    repo_url, branch = _resolve_repo(data)
+    repo_path = get_repo_path(repo_url)
+    return {
+        "repo_url": repo_url,
+        "branch": branch,
+        "current": get_current_release(repo_path),
+        "releases": list_releases(repo_path)
     }
 
+@router.post("/rollback")
+async def rollback(data: Optional[Dict] = Body(None), token: str = Depends(verify_token)):
+    """回滚到指定版本（release_id），不指定则回滚到上一个版本"""
+    repo_url, branch = _resolve_repo(data)
+    try:
+        release_id = rollback_release(get_repo_path(repo_url), (data or {}).get("release_id"))
+    except ReleaseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "回滚成功", "release_id": release_id}
+
+@router.post("/autoDeploy")
+async def get_auto_deploy_status(data: Optional[Dict] = Body(None), token: str = Depends(verify_token)):
+    """自动部署状态：是否有待部署的改动、待部署 / 构建中 / 上次自动部署成功的 commit"""
+    repo_url, branch = _resolve_repo(data)
+    if AUTO_DEPLOY is None:
+        return {"enabled": False, "repo_url": repo_url, "branch": branch}
+    return {"repo_url": repo_url, "branch": branch, **AUTO_DEPLOY.get_status(repo_url, branch)}
+
+@router.get("/pool")
+async def get_build_pool_stats(token: str = Depends(verify_token)):
+    """构建线程池状态：并发上限、运行数、排队深度和等待时间"""
+    return build_pool.get_stats()
+
+@router.get("/workers")
+async def get_hexo_workers(token: str = Depends(verify_token)):
+    """常驻 Hexo 进程状态：运行状态、内存、生成次数、最近错误"""
+    if HEXO_WORKERS is None:
+        return {"enabled": False, "workers": [], "starting": []}
+    return HEXO_WORKERS.get_stats()
+
+@router.post("/cancel")
+async def cancel_deploy(
+        task_id: str = Query(..., description="任务ID"),
+        token: str = Depends(verify_token)
+):
+    """取消排队中或运行中的部署任务，运行中的 npm / hexo 进程组会被整体终止"""
+    if not get_task(task_id):
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    if not cancel_task(task_id):
+        raise HTTPException(status_code=409, detail="任务已结束，无法取消")
+    logger.info(f"⏹️ 已请求取消部署任务: {task_id}")
+    return {"task_id": task_id, "message": "已请求取消任务"}
+
 @router.get("/status")
 async def get_deploy_status(
         task_id: str = Query(None, description="任务ID"),
@@ -253,18 +657,23 @@ async def get_deploy_status(
         task = get_task(task_id)
     else:
         # 未指定 task_id：获取该用户最近一次任务
-        task = get_last_task_by_triggered_by(token)
+        task = get_last_task_by_triggered_by(token_fingerprint(token))
 
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在或已过期")
 
     return {
-        "task_id": task_id,
-        "status": task["status"],  # queued | running | success | failure
+        "task_id": task.get("task_id", task_id),
+        "status": task["status"],  # queued | running | success | failure | cancelled
         "message": task.get("message", ""),
         "triggered_by": task.get("triggered_by"),
+        "repo_url": task.get("repo_url"),
+        "branch": task.get("branch"),
         "steps": task.get("steps", []),
-        "created_at": task.get("created_at")
+        "created_at": task.get("created_at"),
+        "preview_url": task.get("preview_url"),
+        "auto_deploy": AUTO_DEPLOY.get_status(task["repo_url"], task.get("branch") or "main")
+        if AUTO_DEPLOY is not None and task.get("repo_url") else None
     }
 # 异步执行构建，避免阻塞响应
-# background_tasks.add_task(run_hexo_build, repo_path)
\ No newline at end of file
+# background_tasks.add_task(run_hexo_build, repo_url, branch)
\ No newline at end of file
@@ -2,20 +2,39 @@
 
 """
 🚀 启动 FastAPI 服务
-使用方式：python run.py
+使用方式：
+    python run.py                 # 开发模式：单进程 + 热重载
+    python run.py --workers 4     # 生产模式：多 worker（共享状态自动切换为 sqlite）
 """
 
+import argparse
+import os
+
 import uvicorn
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hexo Headless CMS API")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("UVICORN_WORKERS", "1")),
+                        help="worker 进程数，大于 1 时为生产模式（关闭热重载）")
+    args = parser.parse_args()
+
+    production = args.workers > 1
+    if production:
+        # worker 进程继承环境变量，config.py 据此选择共享状态后端
+        os.environ["UVICORN_WORKERS"] = str(args.workers)
+        os.environ.setdefault("SHARED_STATE_BACKEND", "sqlite")
+
     print("🌍 启动 Hexo Headless CMS API")
     print("📌 访问文档: http://localhost:3001/docs")
+    if production:
+        print(f"⚙️ 生产模式: {args.workers} 个 worker，共享状态后端: {os.environ['SHARED_STATE_BACKEND']}")
     print("🛑 按 Ctrl+C 停止 服务\n")
 
     uvicorn.run(
         "main:app",           # 🔥 使用字符串形式
         host="0.0.0.0",
         port=3001,
-        reload=True,          # ✅ 现在热重载会生效
+        reload=not production,  # ✅ 开发模式热重载，多 worker 时不可用
+        workers=args.workers if production else None,
         log_level="info"
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,10 @@
+# conftest.py
+"""
+测试公共配置：仓库与 CMS 数据目录指向临时目录，必须在导入 configs.config 之前设置
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("REPOS_BASE_DIR", tempfile.mkdtemp(prefix="cms-test-repos-"))
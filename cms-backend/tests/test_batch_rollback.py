@@ -0,0 +1,67 @@
+# test_batch_rollback.py
+import os
+import subprocess
+
+import pytest
+from fastapi import HTTPException
+
+from model.articleModel import BatchSave
+from routers import article
+from utils.git_utils import ensure_repo_cloned
+
+GIT_ENV = {"GIT_AUTHOR_NAME": "cms", "GIT_AUTHOR_EMAIL": "cms@example.com",
+           "GIT_COMMITTER_NAME": "cms", "GIT_COMMITTER_EMAIL": "cms@example.com"}
+
+
+def _git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True,
+                          env={**os.environ, **GIT_ENV}).stdout
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    for key, value in GIT_ENV.items():
+        monkeypatch.setenv(key, value)
+    remote = str(tmp_path / "blog.git")
+    seed = str(tmp_path / "seed")
+    _git(str(tmp_path), "init", "-q", "--bare", "-b", "main", remote)
+    _git(str(tmp_path), "clone", "-q", remote, seed)
+    os.makedirs(os.path.join(seed, "source", "_posts"))
+    with open(os.path.join(seed, "source", "_posts", "hello.md"), "w", encoding="utf-8") as f:
+        f.write("---\ntitle: Hello\n---\n你好\n")
+    with open(os.path.join(seed, "_config.yml"), "w", encoding="utf-8") as f:
+        f.write("title: blog\n")
+    _git(seed, "add", "-A")
+    _git(seed, "commit", "-qm", "init")
+    _git(seed, "push", "-q", "origin", "main")
+
+    repo_path = ensure_repo_cloned(remote, "main")
+    monkeypatch.setattr(article, "get_current_repo", lambda: {"url": remote, "branch": "main"})
+    # 远端拒绝所有推送
+    hook = os.path.join(remote, "hooks", "pre-receive")
+    with open(hook, "w") as f:
+        f.write("#!/bin/sh\nexit 1\n")
+    os.chmod(hook, 0o755)
+    return repo_path
+
+
+def test_failed_push_rolls_back_batch_but_keeps_unrelated_changes(repo):
+    head = _git(repo, "rev-parse", "HEAD")
+    with open(os.path.join(repo, "_config.yml"), "a", encoding="utf-8") as f:
+        f.write("subtitle: local\n")
+
+    req = BatchSave(posts=[
+        {"title": "Hello", "path": "hello.md", "body": "---\ntitle: Hello\n---\n改过\n"},
+        {"title": "New", "path": "tech/new.md", "body": "---\ntitle: New\n---\nnew\n"},
+    ])
+    with pytest.raises(HTTPException) as exc:
+        article.batch_save_articles(req, token="test")
+    assert exc.value.status_code == 500
+
+    assert _git(repo, "rev-parse", "HEAD") == head
+    with open(os.path.join(repo, "source", "_posts", "hello.md"), encoding="utf-8") as f:
+        assert f.read() == "---\ntitle: Hello\n---\n你好\n"
+    assert not os.path.exists(os.path.join(repo, "source", "_posts", "tech"))
+    with open(os.path.join(repo, "_config.yml"), encoding="utf-8") as f:
+        assert f.read() == "title: blog\nsubtitle: local\n"
+    assert _git(repo, "status", "--porcelain").splitlines() == [" M _config.yml"]
@@ -0,0 +1,90 @@
+# test_redis_storage.py
+"""
+RedisStorage 在兼容 Redis 协议的替身（fakeredis）上的行为：两个客户端连同一个服务端，模拟多 worker
+"""
+import time
+from datetime import timedelta
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis 执行 Lua 脚本需要 lupa
+
+from commons.storage import RedisStorage
+
+TEMP, PERM = 3, 6
+BAN = timedelta(milliseconds=300)
+
+
+@pytest.fixture
+def storages():
+    server = fakeredis.FakeServer()
+    make = lambda: RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True),
+                                failure_ttl=0.5, perm_ban_ttl=60, perm_threshold=PERM)
+    return make(), make()
+
+
+def _record(storage, ip="1.2.3.4"):
+    return storage.record_failed_attempt(ip, TEMP, PERM, BAN)
+
+
+def test_increment_is_shared_between_clients(storages):
+    a, b = storages
+    assert _record(a) == (1, None)
+    assert _record(b) == (2, None)
+    assert a.get_failed_attempts("1.2.3.4") == (2, None)
+    assert b.get_failed_attempts("5.6.7.8") == (0, None)
+
+
+def test_temp_ban_at_threshold_visible_to_other_client(storages):
+    a, b = storages
+    for _ in range(TEMP - 1):
+        _record(a)
+    count, unban_time = _record(b)
+    assert count == TEMP and unban_time is not None
+    _, seen = a.get_failed_attempts("1.2.3.4")
+    assert seen is not None
+    assert 0 < a.client.pttl("auth_ban:1.2.3.4") <= BAN.total_seconds() * 1000
+
+
+def test_ban_expires_and_count_resets(storages):
+    a, b = storages
+    for _ in range(TEMP):
+        _record(a)
+    time.sleep(BAN.total_seconds() + 0.1)
+    # 封禁键已由 Redis 过期，下一次失败从 1 重新计数
+    assert b.get_failed_attempts("1.2.3.4")[1] is None
+    assert _record(b) == (1, None)
+
+
+def test_failure_record_expires_after_ttl(storages):
+    a, _ = storages
+    _record(a)
+    assert 0 < a.client.pttl("auth_fail:1.2.3.4") <= 500
+    time.sleep(0.6)
+    assert a.get_failed_attempts("1.2.3.4") == (0, None)
+
+
+def test_perm_ban_keeps_count_with_long_ttl(storages):
+    a, b = storages
+    count = 0
+    for i in range(PERM):
+        count, _ = _record(a if i % 2 else b)
+    assert count == PERM
+    assert a.client.pttl("auth_fail:1.2.3.4") > 50_000
+    assert b.get_failed_attempts("1.2.3.4")[0] == PERM
+
+
+def test_clear_resets_for_all_clients(storages):
+    a, b = storages
+    for _ in range(TEMP):
+        _record(a)
+    b.clear_failed_attempts("1.2.3.4")
+    assert a.get_failed_attempts("1.2.3.4") == (0, None)
+    assert not a.client.exists("auth_fail:1.2.3.4", "auth_ban:1.2.3.4")
+
+
+def test_set_failed_attempts_round_trip(storages):
+    a, b = storages
+    a.set_failed_attempts("1.2.3.4", 4)
+    assert b.get_failed_attempts("1.2.3.4") == (4, None)
@@ -0,0 +1,45 @@
+# test_search_index.py
+import os
+
+import pytest
+
+from commons.searchIndex import SearchIndex
+from utils.article_utils import get_posts_dir, scan_posts_compact
+
+REPO_URL = "https://example.com/test/search-blog.git"
+
+
+@pytest.fixture
+def index(tmp_path):
+    posts_dir = get_posts_dir(REPO_URL)
+    with open(os.path.join(posts_dir, "cn.md"), "w", encoding="utf-8") as f:
+        f.write("---\ntitle: 测试\n---\n我爱中国\n")
+    with open(os.path.join(posts_dir, "en.md"), "w", encoding="utf-8") as f:
+        f.write("---\ntitle: Hello\n---\nhello world\n")
+    search_index = SearchIndex(REPO_URL, str(tmp_path / "search.db"))
+    search_index.sync(scan_posts_compact(REPO_URL), None)
+    return search_index
+
+
+def _paths(index, query):
+    return [item["path"] for item in index.search(query)["items"]]
+
+
+@pytest.mark.parametrize("query", ["国", "试", "我", "爱", "测"])
+def test_single_cjk_char_matches_anywhere_in_run(index, query):
+    # 只出现在中文段末尾的字（国、试）也要能查到
+    assert _paths(index, query) == ["cn.md"]
+
+
+@pytest.mark.parametrize("query", ["中国", "我爱中国", "hello"])
+def test_multi_char_queries(index, query):
+    expected = ["en.md"] if query == "hello" else ["cn.md"]
+    assert _paths(index, query) == expected
+
+
+def test_single_char_counts_each_occurrence_once(index):
+    # 段中的字只按以它开头的 bigram 计数，段末的字只按单字计数
+    conn = index._conn()
+    for char in ("中", "国"):
+        postings = SearchIndex._postings(conn, char)
+        assert [tf for tf, _ in postings.values()] == [1]
@@ -1,55 +1,63 @@
 # article_utils.py
 
 import os
+import re
+from collections import deque
 from utils.git_utils import get_repo_path
-from typing import List, Dict,Any
+from typing import List, Dict, Any, Tuple
+from commons.metrics import timed_operation
+from commons.tracing import traced, span
+from commons.ttlCache import ShardedTTLCache
+from commons.postsTree import PostsTree, ROOT
+from utils.etag_utils import content_etag
 
-def scan_posts_tree(repo_url: str) -> Dict[str, Any]:
-    """
-    扫描 _posts 目录，返回包含子目录和文件的树形结构 + 文件总数
-    返回格式: { "items": [...], "total": N }
-    """
+# 文章 ETag 缓存：文件路径 -> ((mtime_ns, size), etag)，文件未变时只需一次 stat
+_POST_ETAGS = ShardedTTLCache(max_entries=20_000)
+_FRONT_MATTER_RE = re.compile(r'^---\s*\n(.*?)\n---\s*\n(.*)', re.DOTALL)
+
+@timed_operation("scan_posts_tree")
+@traced("fs.scan_posts_tree")
+def scan_posts_compact(repo_url: str) -> PostsTree:
+    """扫描 _posts 目录，返回紧凑的文章树（缓存中常驻的表示）"""
     repo_path = get_repo_path(repo_url)
-    posts_dir = os.path.join(repo_path, "source", "_posts")
+    return scan_posts_dir(os.path.join(repo_path, "source", "_posts"))
 
-    if not os.path.exists(posts_dir):
-        return {"items": [], "total": 0}
 
-    total_files = 0  #  文件计数器
+def scan_posts_dir(posts_dir: str) -> PostsTree:
+    """
+    广度优先扫描目录，只收录 .md / .markdown 文件和全部子目录
+    每个目录的子节点按名称排序后一次性加入，与原递归扫描的顺序一致
+    """
+    tree = PostsTree()
+    if not os.path.exists(posts_dir):
+        return tree.finish()
 
-    def build_tree(root_path: str) -> List[Dict]:
-        nonlocal total_files  #  声明使用外层变量
-        items = []
+    queue = deque([(ROOT, posts_dir)])
+    while queue:
+        node, dir_path = queue.popleft()
+        children = []
         try:
-            for name in sorted(os.listdir(root_path)):
-                full_path = os.path.join(root_path, name)
-                rel_path = os.path.relpath(full_path, posts_dir).replace("\\", "/")
-
-                if os.path.isfile(full_path):
-                    if name.lower().endswith(('.md', '.markdown')):
-                        total_files += 1  #  计数！
-                        items.append({
-                            "type": "file",
-                            "name": name,
-                            "path": rel_path
-                        })
-                elif os.path.isdir(full_path):
-                    children = build_tree(full_path)
-                    items.append({
-                        "type": "dir",
-                        "name": name,
-                        "path": rel_path,
-                        "children": children
-                    })
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        if entry.name.lower().endswith(('.md', '.markdown')):
+                            children.append((entry.name, False))
+                    elif entry.is_dir():
+                        children.append((entry.name, True))
         except PermissionError:
             pass  # 忽略无权限访问的目录
-        return items
+        children.sort()
+        for child, name in tree.add_children(node, children):
+            queue.append((child, os.path.join(dir_path, name)))
+    return tree.finish()
 
-    items = build_tree(posts_dir)
-    return {
-        "items": items,
-        "total": total_files
-    }
+
+def scan_posts_tree(repo_url: str) -> Dict[str, Any]:
+    """
+    扫描 _posts 目录，返回包含子目录和文件的树形结构 + 文件总数
+    返回格式: { "items": [...], "total": N }
+    """
+    return scan_posts_compact(repo_url).to_dict()
 
 
 def get_posts_dir(repo_url: str) -> str:
@@ -60,6 +68,42 @@ def get_posts_dir(repo_url: str) -> str:
         os.makedirs(posts_dir, exist_ok=True)
     return posts_dir
 
+def get_post_etag(repo_url: str, filename: str) -> str:
+    """文章内容的强 ETag（内容哈希），文件不存在时抛出 FileNotFoundError"""
+    filepath = os.path.join(get_posts_dir(repo_url), filename)
+    st = os.stat(filepath)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _POST_ETAGS.get(filepath)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(filepath, 'rb') as f:
+        etag = content_etag(f.read())
+    _POST_ETAGS.set(filepath, (stamp, etag))
+    return etag
+
+def split_front_matter(content: str) -> Tuple[Dict[str, str], str]:
+    """解析 Front Matter，返回 (字段, 正文)；没有 Front Matter 时字段为空"""
+    with span("frontmatter.parse", bytes=len(content)):
+        match = _FRONT_MATTER_RE.match(content)
+        if not match:
+            return {}, content
+        front_matter = {}
+        for line in match.group(1).splitlines():
+            if ':' in line:
+                k, v = line.split(':', 1)
+                front_matter[k.strip()] = v.strip().strip('"\'')
+        return front_matter, match.group(2)
+
+
+def post_title(filename: str, front_matter: Dict[str, str]) -> str:
+    """Front Matter 中的 title，没有时从文件名提取（保留原逻辑）"""
+    name_part = os.path.splitext(filename)[0]  # 使用 os.path 分离扩展名
+    parts = name_part.split('-', 3)
+    title = parts[3].replace('-', ' ').title() if len(parts) >= 4 else name_part
+    return front_matter.get("title", title)
+
+
+@traced("post.read")
 def read_post(repo_url: str, filename: str) -> Dict:
     """
     读取文章（支持子目录）
@@ -74,41 +118,105 @@ def read_post(repo_url: str, filename: str) -> Dict:
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # 解析 Front Matter
-    import re
-    match = re.match(r'^---\s*\n(.*?)\n---\s*\n(.*)', content, re.DOTALL)
-    if match:
-        fm_lines = match.group(1).splitlines()
-        front_matter = {}
-        for line in fm_lines:
-            if ':' in line:
-                k, v = line.split(':', 1)
-                front_matter[k.strip()] = v.strip().strip('"\'')
-        body = match.group(2)
-    else:
-        front_matter, body = {}, content
-
-    # 从文件名提取标题（保留原逻辑）
-    name_part = os.path.splitext(filename)[0]  # 使用 os.path 分离扩展名
+    front_matter, body = split_front_matter(content)
+    title = post_title(filename, front_matter)
+    # 从文件名提取日期（保留原逻辑）
+    name_part = os.path.splitext(filename)[0]
     parts = name_part.split('-', 3)
-    title = parts[3].replace('-', ' ').title() if len(parts) >= 4 else name_part
 
     return {
         "path": filename,  # ✅ 使用相对路径作为唯一 ID
-        "filename": front_matter.get("title", title)+".md",
-        "title": front_matter.get("title", title),
+        "filename": title+".md",
+        "title": title,
         "date": front_matter.get("date",
                                  f"{parts[0]}-{parts[1]}-{parts[2]}" if len(parts) >= 3 else ""),
         "draft": str(front_matter.get("draft", "false")),  # 确保是字符串
         "body": content.strip()
     }
 
-def save_post(repo_url: str, filename: str, data: dict):
+def normalize_post_path(path: str) -> str:
+    """
+    规范化文章相对路径：统一分隔符、去掉开头的 /、补全 .md 扩展名
+    路径为空或跳出 _posts 目录时抛出 ValueError
+    """
+    path = (path or "").strip().replace("\\", "/").lstrip("/")
+    if not path:
+        raise ValueError("路径不能为空")
+    if any(part in ("", ".", "..") for part in path.split("/")):
+        raise ValueError(f"非法路径: {path}")
+    if not path.lower().endswith(('.md', '.markdown')):
+        path += ".md"
+    return path
+
+
+def normalize_post_body(body: str) -> str:
+    """保存到文件的内容：去掉首尾空白，以换行结尾"""
+    return body.strip() + '\n'
+
+
+def _front_matter_key(line: str) -> str:
+    return line.split(':', 1)[0].strip() if ':' in line and not line.startswith((' ', '\t', '-')) else ''
+
+
+def _set_front_matter_key(lines: List[str], key: str, value: str) -> List[str]:
+    """原位置替换该字段，不存在时追加到末尾"""
+    for i, line in enumerate(lines):
+        if _front_matter_key(line) == key:
+            return lines[:i] + [f"{key}: {value}"] + lines[i + 1:]
+    return lines + [f"{key}: {value}"]
+
+
+def apply_draft_flag(content: str, draft: bool) -> str:
+    """
+    让草稿标记在部署时生效：Hexo 不识别 draft 字段，只按 published: false 排除文章
+    - draft 为 True 或 Front Matter 中 draft: true 时写入 draft: true 与 published: false
+    - Front Matter 中 draft: false 时去掉 published: false（取消草稿）
+    草稿只在预览构建（render_drafts）中生成
+    """
+    match = _FRONT_MATTER_RE.match(content)
+    if not match:
+        return f"---\ndraft: true\npublished: false\n---\n{content}" if draft else content
+    front_matter, _ = split_front_matter(content)
+    draft_field = front_matter.get("draft", "").lower()
+    lines = match.group(1).split("\n")
+    if draft or draft_field == "true":
+        lines = _set_front_matter_key(_set_front_matter_key(lines, "draft", "true"), "published", "false")
+    elif draft_field == "false" and front_matter.get("published", "").lower() == "false":
+        lines = [line for line in lines if _front_matter_key(line) != "published"]
+    else:
+        return content
+    return content[:match.start(1)] + "\n".join(lines) + content[match.end(1):]
+
+
+def apply_text_edits(text: str, edits: List[Dict[str, Any]]) -> str:
+    """
+    按区间替换文本：edits 为 [{"start", "end", "text"}]，偏移量以 Unicode 字符计，
+    均相对原文，需按 start 升序且互不重叠；不合法时抛出 ValueError
+    """
+    parts, pos = [], 0
+    for edit in edits:
+        start, end = edit["start"], edit["end"]
+        if start < pos or end < start or end > len(text):
+            raise ValueError(f"补丁区间无效: [{start}, {end})")
+        parts.append(text[pos:start])
+        parts.append(edit["text"])
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+@traced("post.save")
+def save_post(repo_url: str, filename: str, data: dict) -> str:
     """
     保存文章（支持子目录，自动创建目录）
+    data 带 draft 字段（完整保存）时同步草稿标记，见 apply_draft_flag
+    返回 created / updated / unchanged，内容未变化时不写文件
     """
     posts_dir = get_posts_dir(repo_url)
     filepath = os.path.join(posts_dir, filename)
+    content = normalize_post_body(data["body"])
+    if "draft" in data:
+        content = apply_draft_flag(content, bool(data["draft"]))
 
     # ✅ 确保父目录存在
     parent_dir = os.path.dirname(filepath)
@@ -129,10 +237,19 @@ def save_post(repo_url: str, filename: str, data: dict):
     #     header += f"{k}: {v}\n"
     # header += "---\n\n"
 
+    status = "created"
+    if os.path.exists(filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return "unchanged"
+        status = "updated"
+
     with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(data["body"].strip() + '\n')
+        f.write(content)
+    return status
 
 
+@traced("post.delete")
 def delete_post(repo_url: str, filename: str):
     """
     删除文章（支持子目录）
@@ -0,0 +1,62 @@
+# asset_utils.py
+"""
+文章资源（图片等）上传：边接收边写临时文件并计算 SHA-256，以内容哈希命名，
+目标目录已有相同内容时直接复用，不再写入
+- 未指定文章时放在 source/images，引用地址 /images/<名称>
+- 指定文章时放在文章资源目录 source/_posts/<文章路径去掉扩展名>/（Hexo post_asset_folder），引用地址为相对名称
+上传不单独提交，随下一次文章保存一起提交推送
+"""
+import glob
+import os
+import uuid
+from typing import Optional, Tuple
+
+from configs.config import ASSET_ALLOWED_EXTS, ASSET_UPLOAD_TMP_DIR
+from utils.article_utils import normalize_post_path
+from utils.git_utils import get_repo_path
+
+# 文件名中保留的哈希长度（64 位，足以避免碰撞）
+HASH_NAME_LENGTH = 16
+
+
+def asset_ext(filename: str) -> str:
+    """取扩展名并校验，不允许的类型抛出 ValueError"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in ASSET_ALLOWED_EXTS:
+        raise ValueError(f"不支持的文件类型: {ext or '无扩展名'}，允许 {', '.join(sorted(ASSET_ALLOWED_EXTS))}")
+    return ext
+
+
+def asset_location(repo_url: str, post: Optional[str] = None) -> Tuple[str, str]:
+    """返回 (目标目录, 引用地址前缀)"""
+    repo_path = get_repo_path(repo_url)
+    if post:
+        post_dir = os.path.splitext(normalize_post_path(post))[0]
+        return os.path.join(repo_path, "source", "_posts", post_dir), ""
+    return os.path.join(repo_path, "source", "images"), "/images/"
+
+
+def asset_name(sha256: str, ext: str) -> str:
+    return sha256[:HASH_NAME_LENGTH] + ext
+
+
+def find_asset(directory: str, sha256: str) -> Optional[str]:
+    """按内容哈希查找已上传的资源，返回文件名"""
+    matches = glob.glob(os.path.join(glob.escape(directory), sha256[:HASH_NAME_LENGTH] + ".*"))
+    return os.path.basename(matches[0]) if matches else None
+
+
+def new_upload_path() -> str:
+    os.makedirs(ASSET_UPLOAD_TMP_DIR, exist_ok=True)
+    return os.path.join(ASSET_UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.part")
+
+
+def place_asset(tmp_path: str, directory: str, name: str) -> bool:
+    """把临时文件移动到目标目录（需持有仓库锁）；已存在相同内容时删除临时文件并返回 True"""
+    target = os.path.join(directory, name)
+    if os.path.exists(target):
+        os.remove(tmp_path)
+        return True
+    os.makedirs(directory, exist_ok=True)
+    os.replace(tmp_path, target)
+    return False
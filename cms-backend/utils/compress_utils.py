@@ -0,0 +1,125 @@
+# compress_utils.py
+"""
+静态资源预压缩：为生成的站点写出 .gz / .br 同名文件，配合 nginx gzip_static / brotli_static 使用
+压缩结果按内容哈希缓存，内容未变的文件直接硬链接缓存，不重复压缩
+"""
+import gzip
+import hashlib
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # 可选依赖：pip install brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTS = {
+    ".html", ".htm", ".css", ".js", ".mjs", ".json", ".xml", ".svg",
+    ".txt", ".map", ".atom", ".rss", ".webmanifest", ".ico",
+}
+# 太小的文件压缩收益不抵额外请求头开销
+MIN_SIZE = 256
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _collect_files(output_dir: str) -> List[str]:
+    files = []
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTS:
+                continue
+            full_path = os.path.join(root, name)
+            if os.path.islink(full_path) or os.path.getsize(full_path) < MIN_SIZE:
+                continue
+            files.append(full_path)
+    return files
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _place(cached: str, target: str):
+    """优先硬链接缓存文件（零拷贝），跨文件系统时退化为复制"""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(cached, target)
+    except OSError:
+        shutil.copyfile(cached, target)
+
+
+def _compress_one(args: Tuple[str, str, bool]) -> Dict:
+    """在子进程中执行：哈希、压缩（或复用缓存）、写出同名文件"""
+    path, cache_dir, use_brotli = args
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    result = {"hash": digest, "original": len(data), "gzip": 0, "brotli": 0, "reused": True}
+
+    variants = [(".gz", lambda d: gzip.compress(d, GZIP_LEVEL, mtime=0))]
+    if use_brotli:
+        variants.append((".br", lambda d: brotli.compress(d, quality=BROTLI_QUALITY)))
+
+    for suffix, compress in variants:
+        cached = os.path.join(cache_dir, digest[:2], digest + suffix)
+        if not os.path.exists(cached):
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            _write_atomic(cached, compress(data))
+            result["reused"] = False
+        _place(cached, path + suffix)
+        result["gzip" if suffix == ".gz" else "brotli"] = os.path.getsize(cached)
+    return result
+
+
+def _prune_cache(cache_dir: str, used_hashes: set):
+    """删除本次构建没有用到的缓存（旧版本目录里的硬链接不受影响）"""
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            if name.split(".", 1)[0] not in used_hashes:
+                os.remove(os.path.join(root, name))
+
+
+def precompress_site(output_dir: str, cache_dir: str, workers: Optional[int] = None) -> Dict:
+    """
+    并行预压缩 output_dir 下可压缩的文件，返回统计信息
+    """
+    started = time.monotonic()
+    os.makedirs(cache_dir, exist_ok=True)
+    files = _collect_files(output_dir)
+    use_brotli = brotli is not None
+
+    results = []
+    if files:
+        workers = workers or os.cpu_count() or 1
+        # 调用方运行在多线程的 API 进程中，使用 spawn 避免 fork 带来的锁状态问题
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(
+                _compress_one,
+                [(path, cache_dir, use_brotli) for path in files],
+                chunksize=32
+            ))
+        _prune_cache(cache_dir, {r["hash"] for r in results})
+
+    original = sum(r["original"] for r in results)
+    gzip_total = sum(r["gzip"] for r in results)
+    brotli_total = sum(r["brotli"] for r in results)
+    return {
+        "files": len(results),
+        "compressed": sum(1 for r in results if not r["reused"]),
+        "reused": sum(1 for r in results if r["reused"]),
+        "bytes_original": original,
+        "bytes_saved_gzip": original - gzip_total,
+        "bytes_saved_brotli": original - brotli_total if use_brotli else 0,
+        "brotli": use_brotli,
+        "seconds": round(time.monotonic() - started, 3),
+    }
@@ -0,0 +1,60 @@
+# etag_utils.py
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(*parts: str) -> str:
+    """由版本号 / 内容哈希拼出强 ETag（带引号）"""
+    return '"' + "-".join(p for p in parts if p) + '"'
+
+
+def content_etag(data: bytes, prefix: str = "") -> str:
+    return make_etag(prefix, hashlib.sha256(data).hexdigest()[:32])
+
+
+# 压缩后的响应使用不同的强 ETag（加编码后缀），比较时去掉后缀
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    if not encoding:
+        return etag
+    return etag[:-1] + f"-{encoding}" + '"'
+
+
+def _strip_encoding(etag: str) -> str:
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    If-None-Match 比较（RFC 9110：弱比较，W/ 前缀忽略）
+    支持 "*" 和逗号分隔的多个 ETag
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag or _strip_encoding(candidate) == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    """
+    304 响应：不带响应体，不做任何序列化
+    按编码协商的响应需传入与 200 相同的带编码后缀的 ETag（RFC 9110），并带上相同的 Vary
+    """
+    headers = {"ETag": etag}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
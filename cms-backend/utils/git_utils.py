@@ -2,11 +2,16 @@
 import traceback
 
 import git
+import hashlib
 import os
 import re
+from typing import Iterable, Optional, Set, Tuple
+
 from fastapi import HTTPException
 
-from configs.config import REPOS_BASE_DIR # 会自动触发目录创建
+from configs.config import REPOS_BASE_DIR, SHARED_STATE # 会自动触发目录创建
+from commons.metrics import timed_operation
+from commons.tracing import traced
 
 def get_repo_name_from_url(url: str) -> str:
     """从 Git URL 提取仓库名（用作本地目录名）"""
@@ -21,6 +26,65 @@ def get_repo_path(repo_url: str) -> str:
     repo_name = get_repo_name_from_url(repo_url)
     return os.path.join(REPOS_BASE_DIR, repo_name)
 
+def repo_lock(repo_url: str):
+    """
+    仓库工作区锁（跨 worker、同线程可重入）
+    拉取 / 写文件 / 提交推送需要在同一把锁内完成，避免多个进程同时改动工作区
+    """
+    return SHARED_STATE.lock(f"repo:{get_repo_name_from_url(repo_url)}")
+
+def get_head_commit(repo_url: str) -> str:
+    """返回本地仓库 HEAD 的 commit id"""
+    return git.Repo(get_repo_path(repo_url)).head.commit.hexsha
+
+def source_fingerprint(repo_url: str, exclude: Tuple[str, ...] = ("public", ".deploy_git")) -> str:
+    """
+    HEAD 中除构建产物外各顶层条目的对象哈希，相同即站点输入未变化
+    只提交构建产物的部署提交不会改变该值
+    """
+    tree = git.Repo(get_repo_path(repo_url)).head.commit.tree
+    entries = "\n".join(f"{item.name}:{item.hexsha}" for item in tree if item.name not in exclude)
+    return hashlib.sha1(entries.encode("utf-8")).hexdigest()
+
+def reset_worktree(repo_url: str, commit: str, paths: Iterable[str] = ()):
+    """
+    把 paths 恢复到 commit（批量操作中途失败时调用，需在 repo_lock 内）
+    HEAD 以 reset --mixed 退回 commit（丢弃未推送成功的本地提交），工作区其他改动原样保留；
+    paths 中 commit 里已有的文件检出回原内容，新建的文件删除并清理空目录
+    """
+    repo_path = get_repo_path(repo_url)
+    repo = git.Repo(repo_path)
+    repo.git.reset("--mixed", "-q", commit)
+    paths = list(paths)
+    if not paths:
+        return
+    tracked = set(repo.git.ls_tree("-r", "--name-only", "-z", commit, "--", *paths).split("\0")) - {""}
+    if tracked:
+        repo.git.checkout(commit, "--", *sorted(tracked))
+    created = [path for path in paths if path not in tracked]
+    if created:
+        repo.git.clean("-f", "--", *created)
+    for path in created:
+        parent = os.path.dirname(os.path.join(repo_path, path))
+        while parent.startswith(repo_path + os.sep) and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+def changed_files(repo_url: str, old_commit: str, new_commit: str, subdir: str = "") -> Optional[Set[str]]:
+    """
+    两个 commit 之间变更（新增 / 修改 / 删除 / 重命名两端）的文件，路径相对 subdir
+    old_commit 不存在（如强制推送后）等情况返回 None，调用方需退化为全量处理
+    """
+    try:
+        output = git.Repo(get_repo_path(repo_url)).git.diff(
+            "--name-only", "--no-renames", "-z", old_commit, new_commit, "--", subdir or ".")
+    except (git.exc.GitCommandError, ValueError):
+        return None
+    prefix = subdir.rstrip("/") + "/" if subdir else ""
+    return {p[len(prefix):] for p in output.split("\0") if p and p.startswith(prefix)}
+
+@timed_operation("ensure_repo_cloned")
+@traced("git.ensure_repo_cloned")
 def ensure_repo_cloned(repo_url: str, branch: str = "main") -> str:
     """
     确保仓库已克隆，返回本地路径
@@ -66,6 +130,13 @@ def ensure_repo_cloned(repo_url: str, branch: str = "main") -> str:
 
 def git_pull(repo_url: str, branch: str = "main") -> dict:
     """拉取指定仓库"""
+    with repo_lock(repo_url):
+        return _git_pull(repo_url, branch)
+
+
+@timed_operation("git_pull")
+@traced("git.pull")
+def _git_pull(repo_url: str, branch: str = "main") -> dict:
     repo_path = ensure_repo_cloned(repo_url, branch)
     try:
         repo = git.Repo(repo_path)
@@ -97,6 +168,13 @@ def git_pull(repo_url: str, branch: str = "main") -> dict:
 
 def git_commit_and_push(repo_url: str, branch: str = "main", message: str = None) -> dict:
     """提交并推送"""
+    with repo_lock(repo_url):
+        return _git_commit_and_push(repo_url, branch, message)
+
+
+@timed_operation("git_commit_and_push")
+@traced("git.commit_and_push")
+def _git_commit_and_push(repo_url: str, branch: str = "main", message: str = None) -> dict:
     repo_path = ensure_repo_cloned(repo_url, branch)
     try:
         repo = git.Repo(repo_path)
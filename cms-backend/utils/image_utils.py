@@ -0,0 +1,282 @@
+# image_utils.py
+"""
+图片优化：为文章图片生成 WebP 及多种宽度的响应式版本
+结果按源文件内容哈希缓存，未变化的图片永远不会重复处理
+生成后把版本链接到输出图片旁边，并把 HTML 中引用这些图片的 <img> 包成
+<picture>（WebP srcset），浏览器按宽度选择版本，不支持 WebP 时仍使用原图
+"""
+import hashlib
+import html
+import multiprocessing
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+try:
+    from PIL import Image, ImageOps  # 可选依赖：pip install Pillow
+except ImportError:
+    Image = None
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+# 缓存目录中标记处理完成的文件
+DONE_MARKER = ".done"
+# 已包装过的 <picture> 整体跳过（重复部署时不重复包装），其余匹配单个 <img>
+_IMG_RE = re.compile(r'<picture data-cms-webp>.*?</picture>|<img\b[^>]*>', re.I | re.S)
+_SRC_RE = re.compile(r'\bsrc\s*=\s*("([^"]*)"|\'([^\']*)\')', re.I)
+
+
+def pillow_available() -> bool:
+    return Image is not None
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _collect_images(dirs: Iterable[str]) -> List[str]:
+    images = []
+    for base in dirs:
+        if not os.path.isdir(base):
+            continue
+        for root, _, names in os.walk(base):
+            for name in names:
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                    images.append(os.path.join(root, name))
+    return images
+
+
+def _variant_dir(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, digest[:2], digest)
+
+
+def _process_one(args) -> Dict:
+    """
+    在子进程中执行：生成 WebP 原尺寸 + 各宽度版本，写入内容寻址缓存
+    调用方已按内容哈希去重，同一哈希只会有一个进程处理
+    """
+    path, digest, cache_dir, widths, quality = args
+    target = _variant_dir(cache_dir, digest)
+    result = {"hash": digest, "size": os.path.getsize(path), "reused": True, "variants": 0}
+
+    if os.path.exists(os.path.join(target, DONE_MARKER)):
+        result["variants"] = len([n for n in os.listdir(target) if n.endswith(".webp")])
+        return result
+
+    # 先写到临时目录，完成后整体改名，避免半成品被复用
+    tmp_dir = f"{target}.{uuid.uuid4().hex[:6]}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+                img = img.convert("RGBA" if has_alpha else "RGB")
+            img.save(os.path.join(tmp_dir, "full.webp"), "WEBP", quality=quality, method=6)
+            for width in widths:
+                if width >= img.width:
+                    continue
+                height = round(img.height * width / img.width)
+                resized = img.resize((width, height), Image.LANCZOS)
+                resized.save(os.path.join(tmp_dir, f"w{width}.webp"), "WEBP", quality=quality, method=6)
+        open(os.path.join(tmp_dir, DONE_MARKER), "w").close()
+        if os.path.exists(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    result["reused"] = False
+    result["variants"] = len([n for n in os.listdir(target) if n.endswith(".webp")])
+    return result
+
+
+def optimize_source_images(source_dirs: Iterable[str], cache_dir: str, widths: List[int],
+                           quality: int, workers: Optional[int] = None) -> Dict:
+    """
+    处理源目录中的图片，结果写入缓存；可与 hexo generate 并行执行
+    返回统计信息，其中 hashes / sizes 供 publish_image_variants 使用
+    """
+    started = time.monotonic()
+    os.makedirs(cache_dir, exist_ok=True)
+    images = _collect_images(source_dirs)
+
+    results = []
+    duplicates = 0
+    if images:
+        workers = workers or os.cpu_count() or 1
+        # 调用方运行在多线程的 API 进程中，使用 spawn 避免 fork 带来的锁状态问题
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            digests = list(executor.map(_file_hash, images, chunksize=16))
+            # 内容相同的图片只处理一次：同一缓存目录被两个进程同时写入会互相删除
+            unique: Dict[str, str] = {}
+            for path, digest in zip(images, digests):
+                unique.setdefault(digest, path)
+            duplicates = len(images) - len(unique)
+            results = list(executor.map(
+                _process_one,
+                [(path, digest, cache_dir, widths, quality) for digest, path in unique.items()],
+                chunksize=4
+            ))
+
+    # 清理源目录中已不存在的图片的缓存
+    used = {r["hash"] for r in results}
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            if name not in used:
+                shutil.rmtree(os.path.join(prefix_dir, name), ignore_errors=True)
+
+    return {
+        "images": len(results) + duplicates,
+        "duplicates": duplicates,
+        "processed": sum(1 for r in results if not r["reused"]),
+        "reused": sum(1 for r in results if r["reused"]),
+        "variants": sum(r["variants"] for r in results),
+        "hashes": used,
+        "sizes": {r["size"] for r in results},
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+def publish_image_variants(output_dir: str, cache_dir: str, source_stats: Dict, rewrite_html: bool = True) -> Dict:
+    """
+    hexo generate 之后执行：按内容哈希找到输出目录中的图片，把缓存中的版本链接到同级
+    例如 images/a.png → images/a.webp、images/a.w640.webp
+    rewrite_html 为 True 时再把引用这些图片的 <img> 改写为 <picture>，见 rewrite_html_images
+    """
+    started = time.monotonic()
+    linked = 0
+    bytes_original = 0
+    bytes_webp = 0
+    # 输出目录内的相对路径 -> [(版本相对路径, 宽度)]
+    published: Dict[str, List[Tuple[str, int]]] = {}
+    for path in _collect_images([output_dir]):
+        size = os.path.getsize(path)
+        # 先按文件大小过滤，避免对无关图片计算哈希
+        if size not in source_stats["sizes"]:
+            continue
+        digest = _file_hash(path)
+        if digest not in source_stats["hashes"]:
+            continue
+        variant_dir = _variant_dir(cache_dir, digest)
+        stem = os.path.splitext(path)[0]
+        rel = os.path.relpath(path, output_dir).replace(os.sep, "/")
+        variants = published[rel] = []
+        for name in sorted(os.listdir(variant_dir)):
+            if not name.endswith(".webp"):
+                continue
+            suffix = ".webp" if name == "full.webp" else f".{name}"
+            target = stem + suffix
+            if os.path.lexists(target):
+                os.remove(target)
+            try:
+                os.link(os.path.join(variant_dir, name), target)
+            except OSError:
+                shutil.copyfile(os.path.join(variant_dir, name), target)
+            linked += 1
+            if name == "full.webp":
+                bytes_original += size
+                bytes_webp += os.path.getsize(target)
+                with Image.open(target) as img:
+                    width = img.width
+            else:
+                width = int(name[1:-len(".webp")])
+            variants.append((os.path.relpath(target, output_dir).replace(os.sep, "/"), width))
+
+    stats = {
+        "linked": linked,
+        "bytes_saved_webp": bytes_original - bytes_webp,
+    }
+    if rewrite_html:
+        stats.update(rewrite_html_images(output_dir, published))
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def _resolve_image(src: str, html_dir: str, published: Dict[str, List[Tuple[str, int]]]) -> Optional[str]:
+    """
+    把 <img src> 解析为输出目录内的相对路径：相对地址按 HTML 所在目录解析；
+    绝对地址（可能带站点 root 前缀或域名）依次去掉开头的路径段匹配
+    """
+    url = urlsplit(html.unescape(src))
+    path = unquote(url.path)
+    if not path or url.scheme not in ("", "http", "https"):
+        return None
+    if not path.startswith("/") and not url.netloc:
+        rel = os.path.normpath(os.path.join(html_dir, path)).replace(os.sep, "/")
+        return rel if rel in published else None
+    parts = path.strip("/").split("/")
+    for i in range(len(parts)):
+        rel = "/".join(parts[i:])
+        if rel in published:
+            return rel
+    return None
+
+
+def _picture(tag: str, src: str, variants: List[Tuple[str, int]]) -> str:
+    """生成 <picture>：srcset 中的地址与原 src 同一写法，只替换文件名"""
+    base = src.rsplit("/", 1)[0] + "/" if "/" in src else ""
+    srcset = ", ".join(f"{html.escape(base + quote(v.rsplit('/', 1)[-1]), quote=True)} {width}w"
+                       for v, width in sorted(variants, key=lambda item: item[1]))
+    return f'<picture data-cms-webp><source type="image/webp" srcset="{srcset}">{tag}</picture>'
+
+
+def rewrite_html_images(output_dir: str, published: Dict[str, List[Tuple[str, int]]]) -> Dict:
+    """
+    把输出 HTML 中引用已发布图片的 <img> 包成 <picture>，WebP 版本按宽度写入 srcset（sizes 默认 100vw）
+    HTML 通过临时文件 + 改名整体替换：版本目录之间的文件可能是硬链接，不能原地修改
+    """
+    files = tags = 0
+    if not published:
+        return {"html_rewritten": 0, "img_rewritten": 0}
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            if not name.endswith(".html"):
+                continue
+            path = os.path.join(root, name)
+            html_dir = os.path.relpath(root, output_dir).replace(os.sep, "/")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            count = 0
+
+            def replace(match):
+                nonlocal count
+                tag = match.group(0)
+                if tag[1] in "pP":
+                    return tag
+                src_match = _SRC_RE.search(tag)
+                if not src_match:
+                    return tag
+                src = src_match.group(2) if src_match.group(2) is not None else src_match.group(3)
+                rel = _resolve_image(src, "" if html_dir == "." else html_dir, published)
+                if rel is None or not published[rel]:
+                    return tag
+                count += 1
+                return _picture(tag, src, published[rel])
+
+            rewritten = _IMG_RE.sub(replace, text)
+            if not count:
+                continue
+            tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(rewritten)
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+            files += 1
+            tags += count
+    return {"html_rewritten": files, "img_rewritten": tags}
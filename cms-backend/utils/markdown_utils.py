@@ -0,0 +1,207 @@
+# markdown_utils.py
+"""
+服务端 Markdown 预览渲染（可选依赖：pip install markdown-it-py，或 pip install markdown）
+- 渲染选项取自仓库 _config.yml 的 marked 配置（hexo-renderer-marked），与站点生成保持一致
+- 正文按顶层块（空行分隔，代码围栏、列表不拆开）切分，每块以内容哈希缓存渲染结果（LRU），
+  增量编辑时只重新渲染改动的块；整篇结果另按哈希缓存
+- 正文含引用式链接定义或脚注时，块之间有依赖，整篇一起渲染
+"""
+import hashlib
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from commons.ttlCache import ShardedTTLCache
+from configs.config import PREVIEW_CACHE_ENTRIES
+from utils.git_utils import get_repo_path
+
+try:
+    from markdown_it import MarkdownIt  # 可选依赖：pip install markdown-it-py（CommonMark，优先使用）
+except ImportError:
+    MarkdownIt = None
+
+try:
+    import markdown as _markdown  # 可选依赖：pip install markdown
+except ImportError:
+    _markdown = None
+
+try:
+    import yaml  # 可选依赖：没有时只识别 marked 下的简单布尔项
+except ImportError:
+    yaml = None
+
+# hexo-renderer-marked 的默认值
+DEFAULT_MARKED = {"gfm": True, "breaks": True, "autolink": True}
+
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM_RE = re.compile(r"^ {0,3}([-*+]|\d{1,9}[.)])(\s|$)")
+# 引用式链接定义 [id]: url 与脚注定义 [^1]: ...
+_REF_DEF_RE = re.compile(r"^ {0,3}\[[^\]]+\]:", re.M)
+_MARKED_OPTION_RE = re.compile(r"^\s+(\w+):\s*(true|false)\s*(#.*)?$")
+
+_BLOCK_CACHE = ShardedTTLCache(max_entries=PREVIEW_CACHE_ENTRIES)
+_DOC_CACHE = ShardedTTLCache(max_entries=max(16, PREVIEW_CACHE_ENTRIES // 20))
+# 站点配置按文件 mtime 缓存: repo_path -> (mtime_ns, 配置)
+_SITE_CONFIGS: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_local = threading.local()
+
+
+def renderer_name() -> Optional[str]:
+    if MarkdownIt is not None:
+        return "markdown-it-py"
+    if _markdown is not None:
+        return "python-markdown"
+    return None
+
+
+# ============= 站点配置 =============
+def _parse_marked_fallback(text: str) -> Dict[str, Any]:
+    options, in_marked = {}, False
+    for line in text.splitlines():
+        if line.startswith("marked:"):
+            in_marked = True
+            continue
+        if in_marked and line and not line.startswith((" ", "#")):
+            break
+        match = _MARKED_OPTION_RE.match(line) if in_marked else None
+        if match:
+            options[match.group(1)] = match.group(2) == "true"
+    return {"marked": options}
+
+
+def site_config(repo_url: str) -> Dict[str, Any]:
+    """读取仓库根目录的 _config.yml，文件未变化时直接返回缓存"""
+    path = os.path.join(get_repo_path(repo_url), "_config.yml")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _SITE_CONFIGS.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        config = (yaml.safe_load(text) if yaml is not None else _parse_marked_fallback(text)) or {}
+    except Exception:
+        config = {}
+    _SITE_CONFIGS[path] = (mtime, config)
+    return config
+
+
+def marked_options(repo_url: str) -> Dict[str, bool]:
+    marked = site_config(repo_url).get("marked")
+    options = dict(DEFAULT_MARKED)
+    if isinstance(marked, dict):
+        options.update({k: bool(marked[k]) for k in DEFAULT_MARKED if k in marked})
+    return options
+
+
+# ============= 渲染器 =============
+def _renderer(options: Dict[str, bool]):
+    """每个线程、每组选项一个实例"""
+    key = ("md", tuple(sorted(options.items())))
+    instance = getattr(_local, "instances", {}).get(key)
+    if instance is not None:
+        return instance
+    if MarkdownIt is not None:
+        md = MarkdownIt("commonmark", {"html": True, "breaks": options["breaks"]})
+        if options["gfm"]:
+            md.enable(["table", "strikethrough"])
+        if options["autolink"]:
+            try:
+                md.enable("linkify")
+                md.options["linkify"] = True
+                md.render("")  # linkify 需要 linkify-it-py，未安装时在此报错
+            except Exception:
+                md.disable("linkify", ignoreInvalid=True)
+                md.options["linkify"] = False
+        instance = md.render
+    else:
+        extensions = ["fenced_code", "tables"] + (["nl2br"] if options["breaks"] else [])
+        md = _markdown.Markdown(extensions=extensions)
+
+        def instance(text: str, _md=md) -> str:
+            return _md.reset().convert(text)
+    if not hasattr(_local, "instances"):
+        _local.instances = {}
+    _local.instances[key] = instance
+    return instance
+
+
+# ============= 分块 =============
+def _splittable(current: List[str], line: str) -> bool:
+    """空行之后的 line 能否开始新块：缩进行（缩进代码、列表续行）与相邻的列表项不拆开"""
+    if line[0] in " \t":
+        return False
+    if _LIST_ITEM_RE.match(line) and any(_LIST_ITEM_RE.match(prev) for prev in current):
+        return False
+    return True
+
+
+def split_blocks(body: str) -> List[str]:
+    """按空行切分为可独立渲染的顶层块，代码围栏内的空行不切分"""
+    blocks, current, fence, after_blank = [], [], None, False
+    for line in body.split("\n"):
+        if fence:
+            current.append(line)
+            match = _FENCE_RE.match(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+                    and not line.strip().lstrip(fence[0]):
+                fence = None
+            continue
+        if not line.strip():
+            if current:
+                current.append(line)
+                after_blank = True
+            continue
+        if after_blank and _splittable(current, line):
+            blocks.append("\n".join(current).rstrip())
+            current = []
+        after_blank = False
+        current.append(line)
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+    if current:
+        blocks.append("\n".join(current).rstrip())
+    return blocks
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def render_key(body: str, options: Dict[str, bool]) -> str:
+    """整篇渲染结果的缓存键，同时用作预览响应的 ETag 依据"""
+    return f"{renderer_name()}:{sorted(options.items())}:{_digest(body)}"
+
+
+def render_markdown(body: str, options: Dict[str, bool]) -> Dict[str, Any]:
+    """
+    渲染正文（不含 Front Matter），返回 {"html", "blocks", "rendered", "cached"}
+    rendered 为本次实际渲染的块数，其余块来自缓存；未安装渲染器时抛出 RuntimeError
+    """
+    if renderer_name() is None:
+        raise RuntimeError("服务端未安装 Markdown 渲染器（pip install markdown-it-py）")
+    doc_key = render_key(body, options)
+    cached = _DOC_CACHE.get(doc_key)
+    if cached is not None:
+        return {**cached, "rendered": 0, "cached": True}
+
+    render = _renderer(options)
+    blocks = [body] if _REF_DEF_RE.search(body) else split_blocks(body)
+    prefix = doc_key.rsplit(":", 1)[0]
+    parts, rendered = [], 0
+    for block in blocks:
+        key = f"{prefix}:{_digest(block)}"
+        html = _BLOCK_CACHE.get(key)
+        if html is None:
+            html = render(block)
+            _BLOCK_CACHE.set(key, html)
+            rendered += 1
+        parts.append(html)
+    result = {"html": "".join(parts), "blocks": len(blocks)}
+    _DOC_CACHE.set(doc_key, result)
+    return {**result, "rendered": rendered, "cached": False}
@@ -0,0 +1,343 @@
+# release_utils.py
+"""
+原子发布：hexo generate 输出到全新的版本目录，成功后通过替换 public 符号链接一次性切换，
+nginx 始终看到完整的一版站点；保留最近 N 个版本用于秒级回滚
+草稿预览输出到独立的 .previews 目录，不进入 public，按过期时间清理
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+RELEASES_DIR_NAME = ".releases"
+PUBLIC_LINK_NAME = "public"
+# hexo 使用多个 --config 时会在仓库根目录写出合并后的配置
+HEXO_MULTICONFIG_NAME = "_multiconfig.yml"
+PREVIEWS_DIR_NAME = ".previews"
+GIT_EXCLUDE_PATTERNS = [f"/{RELEASES_DIR_NAME}/", f"/{PUBLIC_LINK_NAME}", f"/{HEXO_MULTICONFIG_NAME}"]
+# 预览不涉及 public：public 被 git 跟踪（不使用原子发布）时不能把它加入排除，否则部署提交会漏掉新页面
+PREVIEW_EXCLUDE_PATTERNS = [f"/{PREVIEWS_DIR_NAME}/", f"/{HEXO_MULTICONFIG_NAME}"]
+# public 被 git 跟踪时只排除预压缩产物，页面本身仍随部署提交
+PRECOMPRESSED_EXCLUDE_PATTERNS = [f"/{PUBLIC_LINK_NAME}/**/*.gz", f"/{PUBLIC_LINK_NAME}/**/*.br"]
+
+_repo_locks: Dict[str, threading.Lock] = {}
+_repo_locks_guard = threading.Lock()
+
+
+class ReleaseError(RuntimeError):
+    """发布 / 回滚失败"""
+
+
+def _repo_lock(repo_path: str) -> threading.Lock:
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(os.path.abspath(repo_path), threading.Lock())
+
+
+def get_releases_dir(repo_path: str) -> str:
+    return os.path.join(repo_path, RELEASES_DIR_NAME)
+
+
+def is_public_tracked(repo_path: str) -> bool:
+    """public/ 已被 git 跟踪时不能替换成符号链接（会把构建产物从仓库中删掉）"""
+    result = subprocess.run(
+        ["git", "ls-files", "--", PUBLIC_LINK_NAME],
+        cwd=repo_path, capture_output=True, text=True, encoding="utf-8"
+    )
+    return bool(result.stdout.strip())
+
+
+def _ensure_git_exclude(repo_path: str, patterns: List[str] = GIT_EXCLUDE_PATTERNS):
+    """把版本目录和 public 链接（或指定的 patterns）写入 .git/info/exclude，避免被部署提交带上"""
+    exclude_file = os.path.join(repo_path, ".git", "info", "exclude")
+    if not os.path.isdir(os.path.dirname(exclude_file)):
+        os.makedirs(os.path.dirname(exclude_file), exist_ok=True)
+    existing = ""
+    if os.path.exists(exclude_file):
+        with open(exclude_file, "r", encoding="utf-8") as f:
+            existing = f.read()
+    missing = [p for p in patterns if p not in existing.splitlines()]
+    if missing:
+        with open(exclude_file, "a", encoding="utf-8") as f:
+            if existing and not existing.endswith("\n"):
+                f.write("\n")
+            f.write("\n".join(missing) + "\n")
+
+
+def exclude_precompressed(repo_path: str):
+    """不使用原子发布且 public 被 git 跟踪时，在 public 中预压缩前调用，避免 .gz / .br 被部署提交带上"""
+    _ensure_git_exclude(repo_path, PRECOMPRESSED_EXCLUDE_PATTERNS)
+
+
+def new_release_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def prepare_release(repo_path: str, extra_config: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    创建一个新版本，返回:
+    {"release_id", "release_path", "config_arg"}
+    config_arg 作为 hexo 的 --config 参数，把 public_dir 指向新版本目录
+    """
+    _ensure_git_exclude(repo_path)
+    releases_dir = get_releases_dir(repo_path)
+    os.makedirs(releases_dir, exist_ok=True)
+
+    release_id = new_release_id()
+    release_rel = f"{RELEASES_DIR_NAME}/{release_id}"
+    override_rel = f"{RELEASES_DIR_NAME}/.override-{release_id}.yml"
+
+    lines = [f"public_dir: {release_rel}"]
+    for key, value in (extra_config or {}).items():
+        lines.append(f"{key}: {value}")
+    with open(os.path.join(repo_path, override_rel), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return {
+        "release_id": release_id,
+        "release_path": os.path.join(repo_path, release_rel),
+        "config_arg": f"_config.yml,{override_rel}",
+    }
+
+
+def snapshot_release(repo_path: str, source_dir: str, release_path: str) -> Dict[str, int]:
+    """
+    把常驻 Hexo 进程的输出目录复制为新版本：与当前线上版本大小、修改时间都相同的文件直接硬链接，其余复制
+    源目录会被下一次生成原地改写，不能直接链接；版本目录中的文件从不原地修改，版本之间共享是安全的
+    """
+    current = get_current_release(repo_path)
+    previous = os.path.join(get_releases_dir(repo_path), current) if current else None
+    linked = copied = 0
+    for root, _, files in os.walk(source_dir):
+        rel = os.path.relpath(root, source_dir)
+        target_root = os.path.normpath(os.path.join(release_path, rel))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            if previous:
+                prev = os.path.join(previous, rel, name)
+                try:
+                    st, prev_st = os.stat(src), os.stat(prev)
+                    if st.st_size == prev_st.st_size and st.st_mtime_ns == prev_st.st_mtime_ns:
+                        os.link(prev, dst)
+                        linked += 1
+                        continue
+                except OSError:
+                    pass
+            shutil.copy2(src, dst)
+            copied += 1
+    return {"files": linked + copied, "linked": linked, "copied": copied}
+
+
+def discard_release(repo_path: str, release_id: str):
+    """构建失败时删除半成品版本目录，线上 public 不受影响"""
+    release_path = os.path.join(get_releases_dir(repo_path), release_id)
+    shutil.rmtree(release_path, ignore_errors=True)
+    _remove_override(repo_path, release_id)
+
+
+def _remove_override(repo_path: str, release_id: str):
+    override = os.path.join(get_releases_dir(repo_path), f".override-{release_id}.yml")
+    if os.path.exists(override):
+        os.remove(override)
+
+
+def get_current_release(repo_path: str) -> Optional[str]:
+    link = os.path.join(repo_path, PUBLIC_LINK_NAME)
+    if not os.path.islink(link):
+        return None
+    return os.path.basename(os.readlink(link).rstrip("/\\"))
+
+
+def _swap_public_link(repo_path: str, release_id: str):
+    """原子替换 public -> .releases/<release_id>"""
+    link = os.path.join(repo_path, PUBLIC_LINK_NAME)
+
+    # 首次启用：把原有的真实 public 目录迁移为一个版本，保证回滚可用
+    if os.path.isdir(link) and not os.path.islink(link):
+        # 以原目录的修改时间命名，保证排在新版本之前
+        legacy_time = datetime.fromtimestamp(os.path.getmtime(link)).strftime('%Y%m%d-%H%M%S')
+        legacy_id = f"{legacy_time}-legacy"
+        os.rename(link, os.path.join(get_releases_dir(repo_path), legacy_id))
+        logger.info(f"📦 已将原 public 目录迁移为版本 {legacy_id}")
+
+    tmp_link = os.path.join(repo_path, f".{PUBLIC_LINK_NAME}.{uuid.uuid4().hex[:6]}.tmp")
+    try:
+        # 相对路径，宿主机映射目录后依然有效
+        os.symlink(f"{RELEASES_DIR_NAME}/{release_id}", tmp_link, target_is_directory=True)
+        os.replace(tmp_link, link)
+    except OSError as e:
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        raise ReleaseError(f"切换 public 链接失败: {e}") from e
+
+
+def publish_release(repo_path: str, release_id: str):
+    """发布新版本：校验输出完整后切换链接"""
+    release_path = os.path.join(get_releases_dir(repo_path), release_id)
+    if not os.path.isdir(release_path) or not os.listdir(release_path):
+        raise ReleaseError(f"版本目录为空，拒绝发布: {release_id}")
+    with _repo_lock(repo_path):
+        _swap_public_link(repo_path, release_id)
+    _remove_override(repo_path, release_id)
+    logger.info(f"🚀 已发布版本 {release_id}")
+
+
+def list_releases(repo_path: str) -> List[Dict]:
+    """按创建时间倒序列出版本"""
+    releases_dir = get_releases_dir(repo_path)
+    if not os.path.isdir(releases_dir):
+        return []
+    current = get_current_release(repo_path)
+    releases = []
+    for name in os.listdir(releases_dir):
+        full_path = os.path.join(releases_dir, name)
+        if name.startswith(".") or not os.path.isdir(full_path):
+            continue
+        releases.append({
+            "release_id": name,
+            "created_at": os.path.getmtime(full_path),
+            "current": name == current,
+        })
+    releases.sort(key=lambda r: r["release_id"], reverse=True)
+    return releases
+
+
+def rollback_release(repo_path: str, release_id: Optional[str] = None) -> str:
+    """
+    回滚到指定版本；未指定时回滚到当前版本的上一个版本
+    """
+    releases = list_releases(repo_path)
+    if not releases:
+        raise ReleaseError("没有可回滚的版本")
+
+    if release_id is None:
+        ids = [r["release_id"] for r in releases]
+        current = get_current_release(repo_path)
+        if current not in ids or ids.index(current) + 1 >= len(ids):
+            raise ReleaseError("没有更早的版本可回滚")
+        release_id = ids[ids.index(current) + 1]
+    elif release_id not in {r["release_id"] for r in releases}:
+        raise ReleaseError(f"版本不存在: {release_id}")
+
+    with _repo_lock(repo_path):
+        _swap_public_link(repo_path, release_id)
+    logger.info(f"⏪ 已回滚到版本 {release_id}")
+    return release_id
+
+
+def prune_releases(repo_path: str, keep: int):
+    """保留最新的 keep 个版本（当前版本始终保留）"""
+    with _repo_lock(repo_path):
+        current = get_current_release(repo_path)
+        releases = list_releases(repo_path)
+        for release in releases[keep:]:
+            if release["release_id"] == current:
+                continue
+            shutil.rmtree(os.path.join(get_releases_dir(repo_path), release["release_id"]), ignore_errors=True)
+            logger.info(f"🧹 已清理旧版本 {release['release_id']}")
+
+
+def prune_releases_async(repo_path: str, keep: int):
+    """后台清理旧版本，不阻塞部署流程"""
+    def worker():
+        try:
+            prune_releases(repo_path, keep)
+        except Exception as e:
+            logger.warning(f"清理旧版本失败: {e}")
+
+    threading.Thread(target=worker, daemon=True).start()
+
+
+# ============= 草稿预览 =============
+def get_previews_dir(repo_path: str) -> str:
+    return os.path.join(repo_path, PREVIEWS_DIR_NAME)
+
+
+def prepare_preview(repo_path: str, root_prefix: str = "/") -> Dict[str, str]:
+    """
+    创建一个预览输出目录，返回:
+    {"preview_id", "preview_path", "config_arg"}
+    config_arg 把 public_dir 指向 .previews/<preview_id>，打开 render_drafts，
+    并把站点 root 设为 <root_prefix><preview_id>/，预览站点挂在独立路径下时链接依然正确
+    """
+    _ensure_git_exclude(repo_path, PREVIEW_EXCLUDE_PATTERNS)
+    previews_dir = get_previews_dir(repo_path)
+    os.makedirs(previews_dir, exist_ok=True)
+
+    preview_id = new_release_id()
+    preview_rel = f"{PREVIEWS_DIR_NAME}/{preview_id}"
+    override_rel = f"{PREVIEWS_DIR_NAME}/.override-{preview_id}.yml"
+    root = f"/{root_prefix.strip('/')}/{preview_id}/".replace("//", "/")
+    with open(os.path.join(repo_path, override_rel), "w", encoding="utf-8") as f:
+        f.write(f"public_dir: {preview_rel}\nrender_drafts: true\nroot: {root}\n")
+
+    return {
+        "preview_id": preview_id,
+        "preview_path": os.path.join(repo_path, preview_rel),
+        "config_arg": f"_config.yml,{override_rel}",
+    }
+
+
+def finish_preview(repo_path: str, preview_id: str):
+    override = os.path.join(get_previews_dir(repo_path), f".override-{preview_id}.yml")
+    if os.path.exists(override):
+        os.remove(override)
+
+
+def discard_preview(repo_path: str, preview_id: str):
+    """构建失败或手动删除时移除预览目录"""
+    shutil.rmtree(os.path.join(get_previews_dir(repo_path), preview_id), ignore_errors=True)
+    finish_preview(repo_path, preview_id)
+
+
+def list_previews(repo_path: str) -> List[Dict]:
+    """按创建时间倒序列出预览；仍有 override 文件的是正在构建的"""
+    previews_dir = get_previews_dir(repo_path)
+    if not os.path.isdir(previews_dir):
+        return []
+    previews = []
+    for name in os.listdir(previews_dir):
+        full_path = os.path.join(previews_dir, name)
+        if name.startswith(".") or not os.path.isdir(full_path):
+            continue
+        previews.append({
+            "preview_id": name,
+            "created_at": os.path.getmtime(full_path),
+            "building": os.path.exists(os.path.join(previews_dir, f".override-{name}.yml")),
+        })
+    previews.sort(key=lambda p: p["preview_id"], reverse=True)
+    return previews
+
+
+def prune_previews(repo_path: str, ttl: int, keep: int) -> List[str]:
+    """删除超过 ttl 秒的预览，并只保留最新的 keep 个；正在构建的不删除"""
+    now = time.time()
+    removed = []
+    with _repo_lock(repo_path):
+        finished = [p for p in list_previews(repo_path) if not p["building"]]
+        for index, preview in enumerate(finished):
+            if index < keep and (ttl <= 0 or now - preview["created_at"] < ttl):
+                continue
+            discard_preview(repo_path, preview["preview_id"])
+            removed.append(preview["preview_id"])
+    if removed:
+        logger.info(f"🧹 已清理过期预览 {', '.join(removed)}")
+    return removed
+
+
+def prune_previews_async(repo_path: str, ttl: int, keep: int):
+    """后台清理过期预览，不阻塞构建流程"""
+    def worker():
+        try:
+            prune_previews(repo_path, ttl, keep)
+        except Exception as e:
+            logger.warning(f"清理过期预览失败: {e}")
+
+    threading.Thread(target=worker, daemon=True).start()
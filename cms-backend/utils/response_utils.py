@@ -0,0 +1,107 @@
+# response_utils.py
+"""
+预序列化 JSON 响应：数据刷新时编码一次（可选 orjson），同时生成 gzip / br 压缩版本，
+请求时按 Accept-Encoding 直接返回对应字节，不再逐次校验、编码、压缩
+"""
+import gzip
+import json
+from typing import Dict, Optional
+
+from fastapi import Response
+
+from utils.etag_utils import encoded_etag, not_modified
+
+try:
+    import orjson  # 可选依赖：pip install orjson，编码速度快数倍
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # 可选依赖：pip install brotli
+except ImportError:
+    brotli = None
+
+# 响应压缩在刷新时做一次，选择速度和压缩率均衡的级别
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# 太小的响应不值得压缩
+MIN_COMPRESS_SIZE = 1024
+# q 值相同时的优先顺序
+ENCODING_PREFERENCE = ("br", "gzip")
+
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody:
+    """
+    一份数据的 JSON 字节及其压缩版本
+    keep_identity=False 时（常驻缓存）只保留压缩版本，极少数不接受压缩的请求临时解压 gzip
+    """
+    __slots__ = ("_identity", "variants")
+
+    def __init__(self, data=None, raw: Optional[bytes] = None, keep_identity: bool = True):
+        identity = raw if raw is not None else dumps_json(data)
+        self.variants: Dict[str, bytes] = {}
+        if len(identity) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(identity, GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(identity, quality=BROTLI_QUALITY)
+        self._identity = identity if keep_identity or not self.variants else None
+
+    @property
+    def identity(self) -> bytes:
+        if self._identity is not None:
+            return self._identity
+        return gzip.decompress(self.variants["gzip"])
+
+    @property
+    def size(self) -> int:
+        """实际常驻的字节数"""
+        return len(self._identity or b"") + sum(len(v) for v in self.variants.values())
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available) -> Optional[str]:
+    """按 Accept-Encoding 的 q 值选择压缩方式，None 表示不压缩"""
+    if not accept_encoding or not available:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encoded_json_response(body: EncodedBody, accept_encoding: Optional[str] = None,
+                          etag: Optional[str] = None) -> Response:
+    encoding = negotiate_encoding(accept_encoding, body.variants)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = encoded_etag(etag, encoding)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    content = body.variants[encoding] if encoding else body.identity
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def encoded_not_modified(body: EncodedBody, accept_encoding: Optional[str], etag: str) -> Response:
+    """与 encoded_json_response 按同样的协商结果返回 304，ETag 与对应的 200 响应一致"""
+    encoding = negotiate_encoding(accept_encoding, body.variants)
+    return not_modified(encoded_etag(etag, encoding), vary="Accept-Encoding")
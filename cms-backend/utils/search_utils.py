@@ -0,0 +1,67 @@
+# search_utils.py
+"""
+全文检索的分词与摘要高亮
+- 中日韩文字没有空格分词，按相邻两字（bigram）切分，单字成段时保留单字
+- 建立索引时每段末尾的字另存一个单字：查询单字时按"以该字开头的 bigram + 该单字"匹配，
+  段中每个字恰好计一次，只出现在段末的字也能查到
+- 其他文字按字母数字连续段切分并转小写
+"""
+import html
+import re
+from collections import Counter
+from typing import List
+
+# 假名、CJK 统一表意文字（含扩展 A、兼容区）、韩文音节
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W_{_CJK}]+)")
+
+# 摘要窗口：命中位置前后保留的字符数
+SNIPPET_BEFORE = 30
+SNIPPET_AFTER = 90
+
+
+def tokenize(text: str, run_tails: bool = False) -> List[str]:
+    """run_tails 为 True 时（建立索引）为每个中文段追加段末单字"""
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text.lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            if run_tails:
+                tokens.append(cjk[-1])
+    return tokens
+
+
+def term_frequencies(text: str) -> Counter:
+    return Counter(tokenize(text, run_tails=True))
+
+
+def query_terms(query: str) -> List[str]:
+    """查询词去重后保持原顺序"""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def make_snippet(text: str, terms: List[str]) -> str:
+    """
+    取第一个命中附近的一段文字，命中词用 <mark> 包裹，其余部分做 HTML 转义
+    没有命中时返回开头一段
+    """
+    text = " ".join(text.split())
+    if not terms:
+        return html.escape(text[:SNIPPET_BEFORE + SNIPPET_AFTER])
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - SNIPPET_BEFORE) if first else 0
+    end = min(len(text), start + SNIPPET_BEFORE + SNIPPET_AFTER)
+    window = text[start:end]
+
+    parts, pos = [], 0
+    for match in pattern.finditer(window):
+        parts.append(html.escape(window[pos:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        pos = match.end()
+    parts.append(html.escape(window[pos:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
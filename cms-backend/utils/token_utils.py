@@ -1,88 +1,131 @@
+import hashlib
+import hmac
 
 from fastapi import  HTTPException, Header,Request
-from pydantic.v1.validators import max_str_int
 
-from configs.config import SECRET_TOKEN,AUTH_STORAGE
+from configs.config import SECRET_TOKEN,AUTH_STORAGE,AUTH_MAX_TRACKED_IPS,AUTH_FAILURE_TTL
+from commons.ttlCache import ShardedTTLCache
+from commons.metrics import AUTH_REJECTIONS
 from datetime import datetime, timedelta
 
 MAX_FAILED_BEFORE_TEMP_BAN = 20
 TEMP_BAN_DURATION = timedelta(minutes=5)
 MAX_FAILED_BEFORE_PERM_BAN = 50
 
+_SECRET_TOKEN_BYTES = SECRET_TOKEN.encode("utf-8")
 
+# 本进程内的封禁快照：ip -> 解封时间（None 为永久封禁），合法 Token 只查这里，不访问存储
+_LOCAL_BANS = ShardedTTLCache(max_entries=AUTH_MAX_TRACKED_IPS)
+# 本进程内出现过失败的 ip，合法 Token 到来时才需要去存储里清空失败记录
+_LOCAL_FAILURES = ShardedTTLCache(max_entries=AUTH_MAX_TRACKED_IPS, default_ttl=AUTH_FAILURE_TTL)
 
-def verify_token(request: Request) -> str:
-    client_ip = request.client.host
-    now = datetime.now()
-
-    # 获取当前失败记录
-    failed_count, unban_time = AUTH_STORAGE.get_failed_attempts(client_ip)
-
-    # 检查是否在临时封禁期内
-    if unban_time and now < unban_time:
-        remain_sec = int((unban_time - now).total_seconds())
-        raise HTTPException(
-            status_code=403,
-            detail=f"请求过于频繁，IP {client_ip} 被临时封禁，请 {remain_sec} 秒后重试"
-        )
 
-    # 检查是否永久封禁
-    if failed_count >= MAX_FAILED_BEFORE_PERM_BAN:
-        raise HTTPException(
-            status_code=403,
-            detail=f"IP {client_ip} 因多次验证失败已被永久封禁"
-        )
+def token_fingerprint(token: str) -> str:
+    """Token 的短指纹，用于记录任务的触发者，不落盘原始 Token"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:12]
 
 
-    authorization = request.headers.get("Authorization")
-
+def verify_token(request: Request) -> str:
     """
     验证 Bearer Token
+    - 合法 Token 走快速路径：只检查本进程的封禁快照，常见情况下不读写存储
+    - 其他情况先检查存储中的封禁状态，再记录失败（原子操作）
+    多 worker 时其他 worker 产生的封禁只对失败请求立即生效，合法 Token 不受影响
     """
+    client_ip = request.client.host
+    authorization = request.headers.get("Authorization")
+
+    token = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+
+    if token is not None and hmac.compare_digest(token.encode("utf-8"), _SECRET_TOKEN_BYTES):
+        _check_local_ban(client_ip)
+        if client_ip in _LOCAL_FAILURES:
+            # ✅ 验证成功，清空失败记录（之前有过失败时才需要访问存储）
+            _check_ban(client_ip)
+            AUTH_STORAGE.clear_failed_attempts(client_ip)
+            _LOCAL_FAILURES.pop(client_ip)
+        return token  # 认证通过
+
+    _check_ban(client_ip)
+
     if not authorization:
+        AUTH_REJECTIONS.inc(reason="missing_header")
         raise HTTPException(
             status_code=401,
             detail="缺少认证头",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not authorization.startswith("Bearer "):
+    if token is None:
+        AUTH_REJECTIONS.inc(reason="malformed_header")
         raise HTTPException(
             status_code=401,
             detail="认证头格式错误，应为 'Bearer <token>'",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    token = authorization.split(" ")[1]
-    if token != SECRET_TOKEN:
-        # 记录ip错误次数，准备封禁
-        _record_failed_attempt(client_ip)
+    # 记录ip错误次数，准备封禁
+    _record_failed_attempt(client_ip)
+    AUTH_REJECTIONS.inc(reason="invalid_token")
+    raise HTTPException(
+        status_code=401,
+        detail="无效或过期的 Token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _raise_banned(ip: str, unban_time):
+    AUTH_REJECTIONS.inc(reason="perm_banned" if unban_time is None else "temp_banned")
+    if unban_time is None:
         raise HTTPException(
-            status_code=401,
-            detail="无效或过期的 Token",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=403,
+            detail=f"IP {ip} 因多次验证失败已被永久封禁"
         )
-    # ✅ 验证成功，清空失败记录（可选）
-    AUTH_STORAGE.clear_failed_attempts(client_ip)
-    return token  # 认证通过
+    remain_sec = int((unban_time - datetime.now()).total_seconds())
+    raise HTTPException(
+        status_code=403,
+        detail=f"请求过于频繁，IP {ip} 被临时封禁，请 {remain_sec} 秒后重试"
+    )
 
 
+def _check_local_ban(ip: str):
+    """只查本进程快照（O(1)，无存储访问）"""
+    banned, unban_time = _LOCAL_BANS.get(ip, (False, None))
+    if banned:
+        _raise_banned(ip, unban_time)
 
-def _record_failed_attempt(ip: str):
-    """记录一次失败，并判断是否需要封禁"""
+
+def _check_ban(ip: str):
+    """查存储中的封禁状态，并同步到本进程快照"""
     now = datetime.now()
     failed_count, unban_time = AUTH_STORAGE.get_failed_attempts(ip)
 
-    # 如果之前被封但已过期，重置计数
-    if unban_time and now >= unban_time :
-        failed_count = 0
-        unban_time = None
+    # 检查是否在临时封禁期内
+    if unban_time and now < unban_time:
+        _remember_ban(ip, failed_count, unban_time)
+        _raise_banned(ip, unban_time)
 
-    failed_count += 1
+    # 检查是否永久封禁
+    if failed_count >= MAX_FAILED_BEFORE_PERM_BAN:
+        _remember_ban(ip, failed_count, None)
+        _raise_banned(ip, None)
 
-    # 达到临时封禁阈值，且未永久封禁
-    if MAX_FAILED_BEFORE_TEMP_BAN <= failed_count < MAX_FAILED_BEFORE_PERM_BAN:
-        unban_time = now + TEMP_BAN_DURATION
 
-    # 更新记录
-    AUTH_STORAGE.set_failed_attempts(ip, failed_count, unban_time)
\ No newline at end of file
+def _remember_ban(ip: str, failed_count: int, unban_time):
+    if failed_count >= MAX_FAILED_BEFORE_PERM_BAN:
+        _LOCAL_BANS.set(ip, (True, None), ttl=getattr(AUTH_STORAGE, "perm_ban_ttl", None))
+    elif unban_time:
+        ttl = (unban_time - datetime.now()).total_seconds()
+        if ttl > 0:
+            _LOCAL_BANS.set(ip, (True, unban_time), ttl=ttl)
+
+
+def _record_failed_attempt(ip: str):
+    """记录一次失败，并判断是否需要封禁（计数与封禁判断由存储原子完成）"""
+    failed_count, unban_time = AUTH_STORAGE.record_failed_attempt(
+        ip, MAX_FAILED_BEFORE_TEMP_BAN, MAX_FAILED_BEFORE_PERM_BAN, TEMP_BAN_DURATION
+    )
+    _LOCAL_FAILURES.set(ip, True)
+    _remember_ban(ip, failed_count, unban_time)
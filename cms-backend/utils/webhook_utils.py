@@ -1,7 +1,36 @@
 # hexo_builder.py
+import functools
+import os
+import signal
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Optional
+
+from commons.tracing import span
+from configs.config import (
+    HEXO_STEP_TIMEOUT,
+    HEXO_NICE,
+    HEXO_MAX_MEMORY_MB,
+    HEXO_RLIMIT_AS_MB,
+    HEXO_MAX_CPU_SECONDS,
+)
+
+# 取消 / 超时后等待进程组退出的宽限时间（秒）
+KILL_GRACE_SECONDS = 5
+# 轮询取消标记的间隔（秒）
+POLL_INTERVAL = 0.5
+
+
+class BuildCancelledError(RuntimeError):
+    """构建被用户取消"""
+
+
+class BuildTimeoutError(RuntimeError):
+    """构建步骤或整个构建超时"""
+
 
 def _resolve_executable(name: str) -> str:
     """根据平台返回正确 cl的可执行文件名"""
@@ -14,44 +43,156 @@ def _resolve_executable(name: str) -> str:
         return name
 
 
+def _limit_child_resources(limit_cpu: bool = True):
+    """
+    子进程 fork 后、exec 前执行（仅 POSIX）：
+    降低优先级并设置 rlimit，避免失控的 Hexo 插件拖垮同机的 API 进程
+    常驻进程不设置 CPU 时间上限（RLIMIT_CPU 按进程累计）
+    """
+    import resource
+
+    if HEXO_NICE:
+        os.nice(HEXO_NICE)
+    if HEXO_RLIMIT_AS_MB > 0:
+        limit = HEXO_RLIMIT_AS_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if limit_cpu and HEXO_MAX_CPU_SECONDS > 0:
+        resource.setrlimit(resource.RLIMIT_CPU, (HEXO_MAX_CPU_SECONDS, HEXO_MAX_CPU_SECONDS + 5))
+
+
+def _build_env() -> dict:
+    env = os.environ.copy()
+    if HEXO_MAX_MEMORY_MB > 0:
+        node_options = env.get("NODE_OPTIONS", "")
+        env["NODE_OPTIONS"] = f"{node_options} --max-old-space-size={HEXO_MAX_MEMORY_MB}".strip()
+    return env
+
+
+def spawn_process(cmd: list, cwd, limit_cpu: bool = True, **kwargs) -> subprocess.Popen:
+    """
+    在独立进程组中启动命令，降低优先级并限制资源；命令不存在时抛出 RuntimeError
+    其余参数原样传给 Popen
+    """
+    resolved_cmd = [_resolve_executable(cmd[0])] + cmd[1:]
+    if sys.platform == "win32":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+        kwargs["preexec_fn"] = functools.partial(_limit_child_resources, limit_cpu)
+    try:
+        return subprocess.Popen(resolved_cmd, cwd=cwd, text=True, encoding='utf-8', env=_build_env(), **kwargs)
+    except FileNotFoundError:
+        cmd_str = ' '.join(resolved_cmd)
+        raise RuntimeError(
+            f"命令未找到: {cmd_str}。\n"
+            f"请确保 Node.js 已安装并加入系统 PATH。\n"
+            f"当前平台: {sys.platform}"
+        )
+
+
+def kill_process_tree(proc: subprocess.Popen):
+    """
+    杀掉整个进程组（npx → node → 插件子进程），防止残留孤儿进程
+    """
+    if sys.platform == "win32":
+        subprocess.run(
+            ["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+            capture_output=True,
+        )
+        return
+
+    try:
+        pgid = os.getpgid(proc.pid)
+    except ProcessLookupError:
+        # 组长已退出，组 ID 与其 pid 相同（start_new_session）
+        pgid = proc.pid
+
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+
+    try:
+        proc.wait(timeout=KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        pass
+
+    # 组长退出后组内可能仍有子进程，统一强杀
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
 class HexoBuilder:
-    def __init__(self, repo_path: str):
+    def __init__(self, repo_path: str, cancel_event: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None):
+        """
+        :param repo_path: Hexo 仓库本地路径
+        :param cancel_event: 被 set 时立即终止当前命令
+        :param deadline: 整个构建的截止时间（time.monotonic()），超过即终止
+        """
         self.repo_path = Path(repo_path)
         if not self.repo_path.exists():
             raise ValueError(f"仓库路径不存在: {repo_path}")
+        self.cancel_event = cancel_event
+        self.deadline = deadline
+
+    def check_cancelled(self):
+        """步骤之间调用，已取消或已超过总时限则抛出异常"""
+        if self.cancel_event and self.cancel_event.is_set():
+            raise BuildCancelledError("构建已取消")
+        if self.deadline and time.monotonic() >= self.deadline:
+            raise BuildTimeoutError("构建总时长超过限制")
 
-    def run_command(self, cmd: list, cwd=None):
+    def run_command(self, cmd: list, cwd=None, timeout: Optional[int] = None):
         """
         跨平台安全执行命令
         - Windows: 自动使用 .cmd 后缀
         - 所有平台: 显式指定 encoding='utf-8'
+        - 子进程运行在独立进程组中，超时 / 取消时整组清理
         """
         if not cmd:
             raise ValueError("命令不能为空")
 
+        self.check_cancelled()
+        with span("build.subprocess", cmd=" ".join(cmd)):
+            return self._run_command(cmd, cwd, timeout)
+
+    def _run_command(self, cmd: list, cwd=None, timeout: Optional[int] = None):
+
         cwd = cwd or self.repo_path
-        resolved_cmd = [_resolve_executable(cmd[0])] + cmd[1:]
+        step_timeout = timeout or HEXO_STEP_TIMEOUT
+        proc = spawn_process(cmd, cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
+        step_deadline = time.monotonic() + step_timeout
         try:
-            result = subprocess.run(
-                resolved_cmd,
-                cwd=cwd,
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=300,
-                encoding='utf-8'
-            )
-            return result.stdout
-        except FileNotFoundError:
-            cmd_str = ' '.join(resolved_cmd)
-            raise RuntimeError(
-                f"命令未找到: {cmd_str}。\n"
-                f"请确保 Node.js 已安装并加入系统 PATH。\n"
-                f"当前平台: {sys.platform}"
-            )
-        except subprocess.CalledProcessError as e:
+            while True:
+                try:
+                    stdout, stderr = proc.communicate(timeout=POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    # communicate 超时后重试不会丢失输出
+                    if self.cancel_event and self.cancel_event.is_set():
+                        raise BuildCancelledError(f"构建已取消: {' '.join(cmd)}")
+                    now = time.monotonic()
+                    if now >= step_deadline:
+                        raise BuildTimeoutError(f"命令执行超时（{step_timeout}秒）: {' '.join(cmd)}")
+                    if self.deadline and now >= self.deadline:
+                        raise BuildTimeoutError(f"构建总时长超过限制: {' '.join(cmd)}")
+        except BaseException:
+            kill_process_tree(proc)
+            proc.communicate()
+            raise
+        finally:
+            # 正常结束也清理一次，回收脱离父进程的插件子进程
+            if sys.platform != "win32":
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+        if proc.returncode != 0:
             # 抛出带 stderr 的异常，便于上层捕获
-            raise RuntimeError(e.stderr.strip() or "命令执行失败，无错误输出") from e
-        except subprocess.TimeoutExpired as e:
-            raise RuntimeError("命令执行超时（5分钟）") from e
+            raise RuntimeError((stderr or "").strip() or "命令执行失败，无错误输出")
+        return stdout